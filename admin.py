@@ -1,1037 +1,1536 @@
-from aiogram import Bot, types, F, Router
-from aiogram.filters import Command, StateFilter
-from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.context import FSMContext
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message, ContentType
-from aiogram.utils.keyboard import InlineKeyboardBuilder
-import os
-import logging
-from typing import List
-from functools import wraps
-from datetime import datetime
-
-from db import Category, Type, Product, ProductMedia, SessionLocal, Order, OrderItem, MainMenuSection
-from config import ADMIN_IDS, MEDIA_FOLDER  # Изменено на ADMIN_IDS
-
-# Setup logging for admin module
-logger = logging.getLogger(__name__)
-
-admin_router = Router()
-
-
-# Декоратор для проверки админа
-def admin_required(handler):
-    @wraps(handler)
-    async def wrapper(*args, **kwargs):
-        message = None
-        for arg in args:
-            if isinstance(arg, (types.Message, types.CallbackQuery)):
-                message = arg
-                break
-        if not message:
-            message = kwargs.get('message') or kwargs.get('callback_query') or kwargs.get('event')
-
-        # Изменено: проверка на вхождение в список ADMIN_IDS
-        if message and hasattr(message, 'from_user') and message.from_user.id not in ADMIN_IDS:
-            if hasattr(message, 'answer'):
-                await message.answer("⛔ У вас нет прав для выполнения этой команды.")
-            elif hasattr(message, 'message') and hasattr(message.message, 'answer'):
-                await message.message.answer("⛔ У вас нет прав для выполнения этой команды.")
-            return
-
-        return await handler(*args, **kwargs)
-
-    return wrapper
-
-
-
-# Состояния для FSM
-class AddCategory(StatesGroup):
-    entering_name = State()
-
-
-class AddType(StatesGroup):
-    choosing_category = State()
-    entering_name = State()
-
-
-class AddProduct(StatesGroup):
-    choosing_category = State()
-    choosing_type = State()
-    entering_name = State()
-    entering_description = State()
-    entering_price = State()
-    adding_media = State()
-
-
-class DeleteCategory(StatesGroup):
-    choosing_category = State()
-
-
-class DeleteType(StatesGroup):
-    choosing_category = State()
-    choosing_type = State()
-
-
-class DeleteProduct(StatesGroup):
-    choosing_category = State()
-    choosing_type = State()
-    choosing_product = State()
-
-
-# Состояния для редактирования главного меню
-class EditMainMenu(StatesGroup):
-    choosing_section = State()
-    editing_text = State()
-    editing_photo = State()
-
-
-# Клавиатура админ-панели
-def get_admin_keyboard():
-    keyboard = [
-        [
-            InlineKeyboardButton(text="➕ Добавить категорию", callback_data="add_category"),
-            InlineKeyboardButton(text="➖ Удалить категорию", callback_data="delete_category")
-        ],
-        [
-            InlineKeyboardButton(text="🏷️ Добавить тип", callback_data="add_type"),
-            InlineKeyboardButton(text="🗑️ Удалить тип", callback_data="delete_type")
-        ],
-        [
-            InlineKeyboardButton(text="🚪 Добавить товар", callback_data="add_product"),
-            InlineKeyboardButton(text="❌ Удалить товар", callback_data="delete_product")
-        ],
-        [
-            InlineKeyboardButton(text="📦 Заказы", callback_data="view_orders"),
-            InlineKeyboardButton(text="📝 Редактировать информацию", callback_data="edit_main_menu")
-        ]
-    ]
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
-
-
-# Команда /admin
-@admin_router.message(Command("admin"))
-@admin_required
-async def cmd_admin(message: Message):
-    await message.answer(
-        "👨‍💻 Панель администратора\n\nВыберите действие:",
-        reply_markup=get_admin_keyboard()
-    )
-
-
-# Обработчики кнопок админ-панели
-@admin_router.callback_query(F.data == "admin_panel")
-@admin_required
-async def back_to_admin_panel(callback: types.CallbackQuery):
-    await callback.message.edit_text(
-        "👨‍💻 Панель администратора\n\nВыберите действие:",
-        reply_markup=get_admin_keyboard()
-    )
-
-
-# Просмотр заказов с улучшенным отображением
-@admin_router.callback_query(F.data == "view_orders")
-@admin_required
-async def view_orders(callback: types.CallbackQuery):
-    db = SessionLocal()
-    try:
-        # Показываем только активных заказы
-        orders = db.query(Order).filter(Order.status == "pending").order_by(Order.id.desc()).all()
-        if not orders:
-            await callback.message.answer("📦 Нет активных заказов")
-            await callback.answer()
-            return
-
-        for order in orders:
-            order_items = db.query(OrderItem).filter(OrderItem.order_id == order.id).all()
-            order_text = (
-                f"📦 Заказ #{order.id}\n"
-                f"👤 Пользователь: {order.user_name}\n"
-                f"📞 Телефон: {order.phone_number}\n"
-                f"💰 Сумма: {order.total_amount} руб.\n"
-                f"📅 Дата: {order.created_at}\n"
-                f"🛒 Товары:\n"
-            )
-
-            # Добавляем информацию о товарах с первыми фотографиями
-            for item in order_items:
-                product = db.query(Product).filter(Product.id == item.product_id).first()
-                if product:
-                    media_files = db.query(ProductMedia).filter(ProductMedia.product_id == product.id).all()
-                    if media_files:
-                        first_media = media_files[0]
-                        # Отправляем фото товара
-                        if first_media.media_type == 'photo':
-                            await callback.message.answer_photo(
-                                photo=first_media.file_id,
-                                caption=(
-                                    f"🚪 {product.name}\n"
-                                    f"📦 Заказ #{order.id}\n"
-                                    f"👤 {order.user_name}\n"
-                                    f"📞 {order.phone_number}\n"
-                                    f"💰 {item.product_price} руб. x {item.quantity} = {item.product_price * item.quantity} руб."
-                                )
-                            )
-                        else:
-                            await callback.message.answer_video(
-                                video=first_media.file_id,
-                                caption=(
-                                    f"🚪 {product.name}\n"
-                                    f"📦 Заказ #{order.id}\n"
-                                    f"👤 {order.user_name}\n"
-                                    f"📞 {order.phone_number}\n"
-                                    f"💰 {item.product_price} руб. x {item.quantity} = {item.product_price * item.quantity} руб."
-                                )
-                            )
-
-            # Формируем текст заказа
-            for item in order_items:
-                order_text += f"• {item.product_name} - {item.product_price} руб. x {item.quantity}\n"
-
-            # Только кнопка "Выполнен"
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="✅ Выполнен", callback_data=f"complete_order_{order.id}")]
-            ])
-            await callback.message.answer(order_text, reply_markup=keyboard)
-
-        await callback.message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
-
-    finally:
-        db.close()
-    await callback.answer()
-
-
-# Обработчик выполнения заказа
-@admin_router.callback_query(F.data.startswith("complete_order_"))
-@admin_required
-async def complete_order(callback: types.CallbackQuery):
-    order_id = int(callback.data.split("_")[2])
-    db = SessionLocal()
-    try:
-        order = db.query(Order).filter(Order.id == order_id).first()
-        if order:
-            order.status = "completed"
-            db.commit()
-
-            # Удаляем сообщение с заказом
-            try:
-                await callback.message.delete()
-            except Exception as e:
-                logger.warning(f"Не удалось удалить сообщение: {e}")
-
-            await callback.answer(f"✅ Заказ #{order_id} выполнен и удален из списка")
-        else:
-            await callback.answer("❌ Заказ не найден")
-    except Exception as e:
-        db.rollback()
-        await callback.answer("❌ Ошибка при выполнении заказа")
-        logger.error(f"Order completion error: {e}")
-    finally:
-        db.close()
-
-
-# Начало редактирования главного меню
-@admin_router.callback_query(F.data == "edit_main_menu")
-@admin_required
-async def start_edit_main_menu(callback: types.CallbackQuery, state: FSMContext):
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🛠️ Услуги", callback_data="edit_section_services")],
-        [InlineKeyboardButton(text="ℹ️ Информация", callback_data="edit_section_info")],
-        [InlineKeyboardButton(text="💬 Консультация", callback_data="edit_section_consultation")],
-        [InlineKeyboardButton(text="🔙 Назад", callback_data="admin_panel")]
-    ])
-
-    await callback.message.edit_text(
-        "📝 Редактирование главного меню\n\nКакую информацию хотите изменить?",
-        reply_markup=keyboard
-    )
-    await state.set_state(EditMainMenu.choosing_section)
-    await callback.answer()
-
-
-# Обработчик выбора раздела для редактирования - ИСПРАВЛЕННЫЙ ФИЛЬТР
-@admin_router.callback_query(EditMainMenu.choosing_section, F.data.startswith("edit_section_"))
-@admin_required
-async def choose_section_to_edit(callback: types.CallbackQuery, state: FSMContext):
-    section_key = callback.data.replace("edit_section_", "")  # services, info, consultation
-
-    db = SessionLocal()
-    try:
-        section = db.query(MainMenuSection).filter(MainMenuSection.section_key == section_key).first()
-        if not section:
-            await callback.answer("❌ Раздел не найден в базе данных")
-            return
-
-        await state.update_data(section_key=section_key, section_id=section.id)
-
-        # Показываем текущее содержимое раздела
-        current_content = f"📝 Редактирование раздела: {section.title}\n\n"
-        current_content += f"Текущий текст:\n{section.content}\n\n"
-        current_content += "Введите новый текст для этого раздела:"
-
-        await callback.message.edit_text(current_content)
-        await state.set_state(EditMainMenu.editing_text)
-
-    except Exception as e:
-        logger.error(f"Error in choose_section_to_edit: {e}")
-        await callback.answer("❌ Ошибка при загрузке раздела")
-    finally:
-        db.close()
-
-
-# Обработчик ввода нового текста
-@admin_router.message(EditMainMenu.editing_text, F.text)
-@admin_required
-async def process_section_text(message: Message, state: FSMContext):
-    new_text = message.text
-    user_data = await state.get_data()
-    section_key = user_data['section_key']
-    section_id = user_data['section_id']
-
-    db = SessionLocal()
-    try:
-        section = db.query(MainMenuSection).filter(MainMenuSection.id == section_id).first()
-        if section:
-            section.content = new_text
-            db.commit()
-
-            # Предлагаем изменить фото
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🖼️ Изменить фото", callback_data="change_photo")],
-                [InlineKeyboardButton(text="🗑️ Удалить текущее фото", callback_data="remove_photo")],
-                [InlineKeyboardButton(text="➡️ Пропустить", callback_data="skip_photo")]
-            ])
-
-            photo_status = "есть" if section.photo_path else "нет"
-            await message.answer(
-                f"✅ Текст раздела обновлен!\n\n"
-                f"Текущее фото: {photo_status}\n"
-                f"Выберите действие с фото:",
-                reply_markup=keyboard
-            )
-            await state.set_state(EditMainMenu.editing_photo)
-        else:
-            await message.answer("❌ Раздел не найден")
-            await state.clear()
-
-    except Exception as e:
-        db.rollback()
-        await message.answer("❌ Ошибка при обновлении текста")
-        logger.error(f"Section text update error: {e}")
-        await state.clear()
-    finally:
-        db.close()
-
-
-# Обработчик действий с фото
-@admin_router.callback_query(EditMainMenu.editing_photo, F.data.in_(["change_photo", "remove_photo", "skip_photo"]))
-@admin_required
-async def handle_photo_action(callback: types.CallbackQuery, state: FSMContext, bot: Bot):
-    action = callback.data
-    user_data = await state.get_data()
-    section_id = user_data['section_id']
-
-    db = SessionLocal()
-    try:
-        section = db.query(MainMenuSection).filter(MainMenuSection.id == section_id).first()
-        if not section:
-            await callback.answer("❌ Раздел не найден")
-            await state.clear()
-            return
-
-        if action == "remove_photo":
-            # Удаляем текущее фото
-            if section.photo_path and os.path.exists(section.photo_path):
-                try:
-                    os.remove(section.photo_path)
-                except Exception as e:
-                    logger.error(f"Ошибка при удалении файла {section.photo_path}: {e}")
-
-            section.photo_path = None
-            section.file_id = None
-            db.commit()
-
-            await callback.message.answer("✅ Фото удалено! Раздел главного меню обновлен.")
-            await callback.message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
-            await state.clear()
-
-        elif action == "change_photo":
-            await callback.message.answer("🖼️ Отправьте новое фото для этого раздела:")
-            # Состояние уже установлено в editing_photo, ждем фото
-
-        elif action == "skip_photo":
-            await callback.message.answer("✅ Раздел главного меню обновлен!")
-            await callback.message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
-            await state.clear()
-
-    except Exception as e:
-        db.rollback()
-        await callback.message.answer("❌ Ошибка при обработке фото")
-        logger.error(f"Photo action error: {e}")
-        await state.clear()
-    finally:
-        db.close()
-
-    await callback.answer()
-
-
-# Обработчик загрузки нового фото
-@admin_router.message(EditMainMenu.editing_photo, F.content_type == ContentType.PHOTO)
-@admin_required
-async def process_section_photo(message: Message, state: FSMContext, bot: Bot):
-    user_data = await state.get_data()
-    section_id = user_data['section_id']
-
-    db = SessionLocal()
-    try:
-        section = db.query(MainMenuSection).filter(MainMenuSection.id == section_id).first()
-        if not section:
-            await message.answer("❌ Раздел не найден")
-            await state.clear()
-            return
-
-        # Удаляем старое фото, если оно есть
-        if section.photo_path and os.path.exists(section.photo_path):
-            try:
-                os.remove(section.photo_path)
-            except Exception as e:
-                logger.error(f"Ошибка при удалении старого файла {section.photo_path}: {e}")
-
-        # Сохраняем новое фото
-        file_id = message.photo[-1].file_id
-        file = await bot.get_file(file_id)
-        file_path = f"files/{file_id}_{message.message_id}.jpg"
-        await bot.download_file(file.file_path, file_path)
-
-        # Обновляем запись в БД
-        section.photo_path = file_path
-        section.file_id = file_id
-        db.commit()
-
-        await message.answer("✅ Фото обновлено! Раздел главного меню полностью обновлен.")
-        await message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
-
-    except Exception as e:
-        db.rollback()
-        await message.answer("❌ Ошибка при загрузке фото")
-        logger.error(f"Photo upload error: {e}")
-    finally:
-        db.close()
-
-    await state.clear()
-
-
-# Обработчики для остальных функций админ-панели (добавление/удаление категорий, типов, товаров)
-# ... [здесь остаются все ваши существующие обработчики для товаров, категорий и типов]
-
-# Добавление категории
-@admin_router.callback_query(F.data == "add_category")
-@admin_required
-async def start_add_category(callback: types.CallbackQuery, state: FSMContext):
-    await callback.message.answer("📝 Введите название новой категории:")
-    await state.set_state(AddCategory.entering_name)
-    await callback.answer()
-
-
-@admin_router.message(AddCategory.entering_name, F.text)
-@admin_required
-async def process_category_name(message: Message, state: FSMContext):
-    category_name = message.text.strip()
-    db = SessionLocal()
-    try:
-        existing_category = db.query(Category).filter(Category.name == category_name).first()
-        if existing_category:
-            await message.answer("❌ Категория с таким названием уже существует!")
-            return
-
-        new_category = Category(name=category_name)
-        db.add(new_category)
-        db.commit()
-        await message.answer(f"✅ Категория '{category_name}' успешно добавлена!")
-        await message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
-    except Exception as e:
-        db.rollback()
-        await message.answer("❌ Ошибка при добавлении категории!")
-    finally:
-        db.close()
-    await state.clear()
-
-
-# Добавление типа
-@admin_router.callback_query(F.data == "add_type")
-@admin_required
-async def start_add_type(callback: types.CallbackQuery, state: FSMContext):
-    db = SessionLocal()
-    try:
-        categories = db.query(Category).all()
-        if not categories:
-            await callback.message.answer("❌ Сначала создайте хотя бы одну категорию!")
-            await callback.answer()
-            return
-
-        builder = InlineKeyboardBuilder()
-        for category in categories:
-            builder.button(text=category.name, callback_data=f"cat_{category.id}")
-        builder.button(text="🔙 Назад", callback_data="admin_panel")
-        builder.adjust(1)
-
-        await callback.message.answer(
-            "📁 Выберите категорию для нового типа:",
-            reply_markup=builder.as_markup()
-        )
-        await state.set_state(AddType.choosing_category)
-    finally:
-        db.close()
-    await callback.answer()
-
-
-@admin_router.callback_query(AddType.choosing_category, F.data.startswith("cat_"))
-@admin_required
-async def process_category_for_type(callback: types.CallbackQuery, state: FSMContext):
-    category_id = int(callback.data.split("_")[1])
-    await state.update_data(category_id=category_id)
-    await callback.message.answer("🏷️ Введите название нового типа:")
-    await state.set_state(AddType.entering_name)
-    await callback.answer()
-
-
-@admin_router.message(AddType.entering_name, F.text)
-@admin_required
-async def process_type_name(message: Message, state: FSMContext):
-    type_name = message.text.strip()
-    user_data = await state.get_data()
-    category_id = user_data['category_id']
-    db = SessionLocal()
-    try:
-        existing_type = db.query(Type).filter(
-            Type.name == type_name,
-            Type.category_id == category_id
-        ).first()
-        if existing_type:
-            await message.answer("❌ Тип с таким названием уже существует в этой категории!")
-            return
-
-        new_type = Type(name=type_name, category_id=category_id)
-        db.add(new_type)
-        db.commit()
-        category = db.query(Category).filter(Category.id == category_id).first()
-        await message.answer(f"✅ Тип '{type_name}' успешно добавлен в категорию '{category.name}'!")
-        await message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
-    except Exception as e:
-        db.rollback()
-        await message.answer("❌ Ошибка при добавлении типа!")
-    finally:
-        db.close()
-    await state.clear()
-
-
-# Добавление товара
-@admin_router.callback_query(F.data == "add_product")
-@admin_required
-async def start_add_product(callback: types.CallbackQuery, state: FSMContext):
-    db = SessionLocal()
-    try:
-        categories = db.query(Category).all()
-        if not categories:
-            await callback.message.answer("❌ Сначала создайте хотя бы одну категорию!")
-            await callback.answer()
-            return
-
-        builder = InlineKeyboardBuilder()
-        for category in categories:
-            builder.button(text=category.name, callback_data=f"product_cat_{category.id}")
-        builder.button(text="🔙 Назад", callback_data="admin_panel")
-        builder.adjust(1)
-
-        await callback.message.answer(
-            "📁 Выберите категорию для товара:",
-            reply_markup=builder.as_markup()
-        )
-        await state.set_state(AddProduct.choosing_category)
-        await state.update_data(media_files=[])
-    finally:
-        db.close()
-    await callback.answer()
-
-
-@admin_router.callback_query(AddProduct.choosing_category, F.data.startswith("product_cat_"))
-@admin_required
-async def process_product_category(callback: types.CallbackQuery, state: FSMContext):
-    category_id = int(callback.data.split("_")[2])
-    await state.update_data(category_id=category_id)
-    db = SessionLocal()
-    try:
-        category = db.query(Category).filter(Category.id == category_id).first()
-        types = db.query(Type).filter(Type.category_id == category_id).all()
-        if not types:
-            await callback.message.answer(f"❌ В категории '{category.name}' нет типов! Сначала создайте тип.")
-            await state.clear()
-            return
-
-        builder = InlineKeyboardBuilder()
-        for type_obj in types:
-            builder.button(text=type_obj.name, callback_data=f"product_type_{type_obj.id}")
-        builder.button(text="🔙 Назад", callback_data="add_product")
-        builder.adjust(1)
-
-        await callback.message.answer(
-            f"🏷️ Выберите тип в категории '{category.name}':",
-            reply_markup=builder.as_markup()
-        )
-        await state.set_state(AddProduct.choosing_type)
-    finally:
-        db.close()
-    await callback.answer()
-
-
-@admin_router.callback_query(AddProduct.choosing_type, F.data.startswith("product_type_"))
-@admin_required
-async def process_product_type(callback: types.CallbackQuery, state: FSMContext):
-    type_id = int(callback.data.split("_")[2])
-    await state.update_data(type_id=type_id)
-    await callback.message.answer("🚪 Введите название товара:")
-    await state.set_state(AddProduct.entering_name)
-    await callback.answer()
-
-
-@admin_router.message(AddProduct.entering_name, F.text)
-@admin_required
-async def process_product_name(message: Message, state: FSMContext):
-    product_name = message.text.strip()
-    await state.update_data(product_name=product_name)
-    await message.answer("📝 Введите описание товара:")
-    await state.set_state(AddProduct.entering_description)
-
-
-@admin_router.message(AddProduct.entering_description, F.text)
-@admin_required
-async def process_product_description(message: Message, state: FSMContext):
-    product_description = message.text.strip()
-    await state.update_data(product_description=product_description)
-    await message.answer("💰 Введите цену товара в рублях (только число):")
-    await state.set_state(AddProduct.entering_price)
-
-
-@admin_router.message(AddProduct.entering_price, F.text)
-@admin_required
-async def process_product_price(message: Message, state: FSMContext):
-    try:
-        price = int(message.text.strip())
-        if price <= 0:
-            await message.answer("❌ Цена должна быть положительным числом!")
-            return
-        await state.update_data(price=price)
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="✅ Завершить добавление медиа", callback_data="finish_media")]
-        ])
-        await message.answer(
-            "🖼️ Теперь отправьте фото или видео товара.\nМожно отправить несколько файлов.\nКогда закончите, нажмите кнопку ниже:",
-            reply_markup=keyboard
-        )
-        await state.set_state(AddProduct.adding_media)
-    except ValueError:
-        await message.answer("❌ Пожалуйста, введите корректную цену (только число):")
-
-
-@admin_router.message(AddProduct.adding_media, F.content_type.in_({ContentType.PHOTO, ContentType.VIDEO}))
-@admin_required
-async def process_product_media(message: Message, state: FSMContext, bot: Bot):
-    user_data = await state.get_data()
-    media_files = user_data.get('media_files', [])
-    try:
-        if message.photo:
-            file_id = message.photo[-1].file_id
-            media_type = "photo"
-        elif message.video:
-            file_id = message.video.file_id
-            media_type = "video"
-        else:
-            await message.answer("❌ Поддерживаются только фото и видео!")
-            return
-
-        file = await bot.get_file(file_id)
-        file_path = f"{MEDIA_FOLDER}/{file_id}_{message.message_id}.jpg" if media_type == "photo" else f"{MEDIA_FOLDER}/{file_id}_{message.message_id}.mp4"
-        await bot.download_file(file.file_path, file_path)
-
-        media_files.append({
-            'file_id': file_id,
-            'file_path': file_path,
-            'media_type': media_type
-        })
-        await state.update_data(media_files=media_files)
-        await message.answer(f"✅ Медиафайл добавлен! Всего файлов: {len(media_files)}")
-    except Exception as e:
-        await message.answer("❌ Ошибка при обработке медиафайла!")
-
-
-@admin_router.callback_query(AddProduct.adding_media, F.data == "finish_media")
-@admin_required
-async def finish_media_and_save_product(callback: types.CallbackQuery, state: FSMContext, bot: Bot):
-    user_data = await state.get_data()
-    if not user_data.get('media_files'):
-        await callback.message.answer("❌ Вы не добавили ни одного медиафайла! Добавьте хотя бы один.")
-        await callback.answer()
-        return
-
-    db = SessionLocal()
-    try:
-        new_product = Product(
-            name=user_data['product_name'],
-            description=user_data['product_description'],
-            price=user_data['price'],
-            type_id=user_data['type_id']
-        )
-        db.add(new_product)
-        db.flush()
-
-        for media_info in user_data['media_files']:
-            media = ProductMedia(
-                product_id=new_product.id,
-                file_id=media_info['file_id'],
-                file_path=media_info['file_path'],
-                media_type=media_info['media_type']
-            )
-            db.add(media)
-
-        db.commit()
-        product_type = db.query(Type).filter(Type.id == user_data['type_id']).first()
-        category = db.query(Category).filter(Category.id == user_data['category_id']).first()
-
-        success_message = (
-            f"✅ Товар успешно добавлен!\n\n"
-            f"📁 Категория: {category.name}\n"
-            f"🏷️ Тип: {product_type.name}\n"
-            f"🚪 Товар: {user_data['product_name']}\n"
-            f"💰 Цена: {user_data['price']} руб.\n"
-            f"📝 Описание: {user_data['product_description']}\n"
-            f"🖼️ Медиафайлов: {len(user_data['media_files'])}"
-        )
-
-        await callback.message.answer(success_message)
-        await callback.message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
-    except Exception as e:
-        db.rollback()
-        await callback.message.answer("❌ Ошибка при сохранении товара!")
-    finally:
-        db.close()
-    await state.clear()
-    await callback.answer()
-
-
-# Удаление категории
-@admin_router.callback_query(F.data == "delete_category")
-@admin_required
-async def start_delete_category(callback: types.CallbackQuery, state: FSMContext):
-    db = SessionLocal()
-    try:
-        categories = db.query(Category).all()
-        if not categories:
-            await callback.message.answer("❌ Нет категорий для удаления!")
-            await callback.answer()
-            return
-
-        builder = InlineKeyboardBuilder()
-        for category in categories:
-            builder.button(text=category.name, callback_data=f"confirm_delete_category_{category.id}")
-        builder.button(text="🔙 Назад", callback_data="admin_panel")
-        builder.adjust(1)
-
-        await callback.message.answer(
-            "📁 Выберите категорию для удаления:",
-            reply_markup=builder.as_markup()
-        )
-    finally:
-        db.close()
-    await callback.answer()
-
-
-@admin_router.callback_query(F.data.startswith("confirm_delete_category_"))
-@admin_required
-async def process_delete_category(callback: types.CallbackQuery):
-    category_id = int(callback.data.split("_")[3])
-    db = SessionLocal()
-    try:
-        category = db.query(Category).filter(Category.id == category_id).first()
-        if not category:
-            await callback.message.answer("❌ Категория не найдена!")
-            await callback.answer()
-            return
-
-        # Получаем все типы в категории
-        types = db.query(Type).filter(Type.category_id == category_id).all()
-        deleted_files_count = 0
-
-        # Удаляем все товары и медиафайлы в этих типах
-        for type_obj in types:
-            products = db.query(Product).filter(Product.type_id == type_obj.id).all()
-            for product in products:
-                # Удаляем медиафайлы товара и физические файлы
-                media_files = db.query(ProductMedia).filter(ProductMedia.product_id == product.id).all()
-                for media in media_files:
-                    # Удаляем файл с диска
-                    if os.path.exists(media.file_path):
-                        try:
-                            os.remove(media.file_path)
-                            deleted_files_count += 1
-                        except Exception as e:
-                            logger.error(f"Ошибка при удалении файла {media.file_path}: {e}")
-                    db.delete(media)
-                db.delete(product)
-            db.delete(type_obj)
-
-        # Удаляем саму категорию
-        category_name = category.name
-        db.delete(category)
-        db.commit()
-
-        await callback.message.answer(
-            f"✅ Категория '{category_name}' и все связанные типы и товары удалены!\n"
-            f"🗑️ Удалено медиафайлов: {deleted_files_count}"
-        )
-        await callback.message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
-
-    except Exception as e:
-        db.rollback()
-        await callback.message.answer("❌ Ошибка при удалении категории!")
-    finally:
-        db.close()
-    await callback.answer()
-
-
-# Удаление типа
-@admin_router.callback_query(F.data == "delete_type")
-@admin_required
-async def start_delete_type(callback: types.CallbackQuery, state: FSMContext):
-    db = SessionLocal()
-    try:
-        categories = db.query(Category).all()
-        if not categories:
-            await callback.message.answer("❌ Нет категорий для удаления типов!")
-            await callback.answer()
-            return
-
-        builder = InlineKeyboardBuilder()
-        for category in categories:
-            builder.button(text=category.name, callback_data=f"delete_type_category_{category.id}")
-        builder.button(text="🔙 Назад", callback_data="admin_panel")
-        builder.adjust(1)
-
-        await callback.message.answer(
-            "📁 Выберите категорию:",
-            reply_markup=builder.as_markup()
-        )
-        await state.set_state(DeleteType.choosing_category)
-    finally:
-        db.close()
-    await callback.answer()
-
-
-@admin_router.callback_query(DeleteType.choosing_category, F.data.startswith("delete_type_category_"))
-@admin_required
-async def choose_type_for_deletion(callback: types.CallbackQuery, state: FSMContext):
-    category_id = int(callback.data.split("_")[3])
-    db = SessionLocal()
-    try:
-        category = db.query(Category).filter(Category.id == category_id).first()
-        types = db.query(Type).filter(Type.category_id == category_id).all()
-        if not types:
-            await callback.message.answer(f"❌ В категории '{category.name}' нет типов!")
-            await state.clear()
-            return
-
-        builder = InlineKeyboardBuilder()
-        for type_obj in types:
-            builder.button(text=type_obj.name, callback_data=f"confirm_delete_type_{type_obj.id}")
-        builder.button(text="🔙 Назад", callback_data="delete_type")
-        builder.adjust(1)
-
-        await callback.message.answer(
-            f"🏷️ Выберите тип для удаления из категории '{category.name}':",
-            reply_markup=builder.as_markup()
-        )
-        await state.set_state(DeleteType.choosing_type)
-    finally:
-        db.close()
-    await callback.answer()
-
-
-@admin_router.callback_query(DeleteType.choosing_type, F.data.startswith("confirm_delete_type_"))
-@admin_required
-async def process_delete_type(callback: types.CallbackQuery, state: FSMContext):
-    type_id = int(callback.data.split("_")[3])
-    db = SessionLocal()
-    try:
-        type_obj = db.query(Type).filter(Type.id == type_id).first()
-        if not type_obj:
-            await callback.message.answer("❌ Тип не найден!")
-            await callback.answer()
-            return
-
-        # Удаляем все товары и медиафайлы в этом типе
-        products = db.query(Product).filter(Product.type_id == type_id).all()
-        deleted_files_count = 0
-
-        for product in products:
-            # Удаляем медиафайлы товара
-            media_files = db.query(ProductMedia).filter(ProductMedia.product_id == product.id).all()
-            for media in media_files:
-                # Удаляем файл с диска
-                if os.path.exists(media.file_path):
-                    try:
-                        os.remove(media.file_path)
-                        deleted_files_count += 1
-                    except Exception as e:
-                        logger.error(f"Ошибка при удалении файла {media.file_path}: {e}")
-                db.delete(media)
-            db.delete(product)
-
-        # Удаляем сам тип
-        type_name = type_obj.name
-        db.delete(type_obj)
-        db.commit()
-
-        await callback.message.answer(
-            f"✅ Тип '{type_name}' и все связанные товары удалены!\n"
-            f"🗑️ Удалено медиафайлов: {deleted_files_count}"
-        )
-        await callback.message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
-
-    except Exception as e:
-        db.rollback()
-        await callback.message.answer("❌ Ошибка при удалении типа!")
-    finally:
-        db.close()
-    await state.clear()
-    await callback.answer()
-
-
-# Удаление товара
-@admin_router.callback_query(F.data == "delete_product")
-@admin_required
-async def start_delete_product(callback: types.CallbackQuery, state: FSMContext):
-    db = SessionLocal()
-    try:
-        categories = db.query(Category).all()
-        if not categories:
-            await callback.message.answer("❌ Нет категорий для удаления товаров!")
-            await callback.answer()
-            return
-
-        builder = InlineKeyboardBuilder()
-        for category in categories:
-            builder.button(text=category.name, callback_data=f"delete_product_category_{category.id}")
-        builder.button(text="🔙 Назад", callback_data="admin_panel")
-        builder.adjust(1)
-
-        await callback.message.answer(
-            "📁 Выберите категорию:",
-            reply_markup=builder.as_markup()
-        )
-        await state.set_state(DeleteProduct.choosing_category)
-    finally:
-        db.close()
-    await callback.answer()
-
-
-@admin_router.callback_query(DeleteProduct.choosing_category, F.data.startswith("delete_product_category_"))
-@admin_required
-async def choose_type_for_product_deletion(callback: types.CallbackQuery, state: FSMContext):
-    category_id = int(callback.data.split("_")[3])
-    await state.update_data(category_id=category_id)
-    db = SessionLocal()
-    try:
-        category = db.query(Category).filter(Category.id == category_id).first()
-        types = db.query(Type).filter(Type.category_id == category_id).all()
-        if not types:
-            await callback.message.answer(f"❌ В категории '{category.name}' нет типов!")
-            await state.clear()
-            return
-
-        builder = InlineKeyboardBuilder()
-        for type_obj in types:
-            builder.button(text=type_obj.name, callback_data=f"delete_product_type_{type_obj.id}")
-        builder.button(text="🔙 Назад", callback_data="delete_product")
-        builder.adjust(1)
-
-        await callback.message.answer(
-            f"🏷️ Выберите тип из категории '{category.name}':",
-            reply_markup=builder.as_markup()
-        )
-        await state.set_state(DeleteProduct.choosing_type)
-    finally:
-        db.close()
-    await callback.answer()
-
-
-@admin_router.callback_query(DeleteProduct.choosing_type, F.data.startswith("delete_product_type_"))
-@admin_required
-async def choose_product_for_deletion(callback: types.CallbackQuery, state: FSMContext):
-    type_id = int(callback.data.split("_")[3])
-    await state.update_data(type_id=type_id)
-    db = SessionLocal()
-    try:
-        type_obj = db.query(Type).filter(Type.id == type_id).first()
-        products = db.query(Product).filter(Product.type_id == type_id).all()
-        if not products:
-            await callback.message.answer(f"❌ В типе '{type_obj.name}' нет товаров!")
-            await state.clear()
-            return
-
-        builder = InlineKeyboardBuilder()
-        for product in products:
-            builder.button(text=product.name, callback_data=f"confirm_delete_product_{product.id}")
-        builder.button(text="🔙 Назад", callback_data=f"delete_product_category_{type_obj.category_id}")
-        builder.adjust(1)
-
-        await callback.message.answer(
-            f"🚪 Выберите товар для удаления из типа '{type_obj.name}':",
-            reply_markup=builder.as_markup()
-        )
-    finally:
-        db.close()
-    await callback.answer()
-
-
-@admin_router.callback_query(F.data.startswith("confirm_delete_product_"))
-@admin_required
-async def process_delete_product(callback: types.CallbackQuery):
-    product_id = int(callback.data.split("_")[3])
-    db = SessionLocal()
-    try:
-        product = db.query(Product).filter(Product.id == product_id).first()
-        if not product:
-            await callback.message.answer("❌ Товар не найден!")
-            await callback.answer()
-            return
-
-        # Удаляем медиафайлы товара
-        media_files = db.query(ProductMedia).filter(ProductMedia.product_id == product_id).all()
-        deleted_files_count = 0
-
-        for media in media_files:
-            # Удаляем файл с диска
-            if os.path.exists(media.file_path):
-                try:
-                    os.remove(media.file_path)
-                    deleted_files_count += 1
-                except Exception as e:
-                    logger.error(f"Ошибка при удалении файла {media.file_path}: {e}")
-            db.delete(media)
-
-        # Удаляем сам товар
-        product_name = product.name
-        db.delete(product)
-        db.commit()
-
-        await callback.message.answer(
-            f"✅ Товар '{product_name}' и все связанные медиафайлы удалены!\n"
-            f"🗑️ Удалено медиафайлов: {deleted_files_count}"
-        )
-        await callback.message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
-
-    except Exception as e:
-        db.rollback()
-        await callback.message.answer("❌ Ошибка при удалении товара!")
-    finally:
-        db.close()
+from aiogram import Bot, types, F, Router
+from aiogram.filters import Command, StateFilter
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.context import FSMContext
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message, ContentType, FSInputFile
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+import os
+import asyncio
+import tempfile
+import logging
+from typing import List
+from aiogram.filters.callback_data import CallbackData
+from sqlalchemy import func, cast, String, tuple_, or_, update
+from functools import wraps
+from datetime import datetime, timedelta
+
+from db import Category, Type, Product, ProductMedia, SessionLocal, Order, OrderItem, MainMenuSection, \
+    delete_category_cascade, delete_types_cascade, delete_products_cascade, get_product_covers, format_order_time, \
+    refresh_product_covers
+from config import ADMIN_IDS, MEDIA_FOLDER  # Изменено на ADMIN_IDS
+from stats import format_sales_report, record_completion
+from export import EXPORT_FORMATS, write_orders_export
+from catalog_import import IMPORT_FORMATS, run_catalog_import
+from callbacks import CallbackIndex
+from cache import invalidate_catalog, invalidate_sections, invalidate_products
+from cart_store import cart_store
+from pricing import parse_price_change, format_price_change, count_products_in_scope, apply_price_change, \
+    undo_price_change
+
+# Setup logging for admin module
+logger = logging.getLogger(__name__)
+
+admin_router = Router()
+admin_callbacks = CallbackIndex(admin_router)
+
+ORDERS_PAGE_SIZE = 5
+PICKER_PAGE_SIZE = 8
+
+IMPORT_HELP_TEXT = (
+    "📥 Отправьте файл каталога (.csv, .json или .jsonl).\n\n"
+    "Поля: category, type, name, description, price.\n"
+    "Существующие товары (тип + название) будут обновлены."
+)
+
+
+class OrdersPage(CallbackData, prefix="orders_pag"):
+    before_ts: int
+    before_id: int
+
+
+class CompleteOrder(CallbackData, prefix="complete_order"):
+    order_id: int
+
+
+class OrderMedia(CallbackData, prefix="order_media"):
+    order_id: int
+
+
+class EditSection(CallbackData, prefix="edit_section"):
+    section_key: str
+
+
+class AddTypeCategory(CallbackData, prefix="add_type_cat"):
+    category_id: int
+
+
+class ProductCategory(CallbackData, prefix="prod_cat"):
+    category_id: int
+
+
+class ProductType(CallbackData, prefix="prod_type"):
+    type_id: int
+
+
+class PriceCategory(CallbackData, prefix="price_cat"):
+    category_id: int
+
+
+class PriceType(CallbackData, prefix="price_type"):
+    type_id: int
+
+
+class PriceUndo(CallbackData, prefix="price_undo"):
+    batch_id: int
+
+
+class DeleteCategoryConfirm(CallbackData, prefix="del_cat"):
+    category_id: int
+
+
+class DeleteTypeCategory(CallbackData, prefix="del_type_cat"):
+    category_id: int
+
+
+class DeleteTypeConfirm(CallbackData, prefix="del_type"):
+    type_id: int
+
+
+class DeleteProductCategory(CallbackData, prefix="del_prod_cat"):
+    category_id: int
+
+
+class DeleteProductType(CallbackData, prefix="del_prod_type"):
+    type_id: int
+
+
+class DeleteProductConfirm(CallbackData, prefix="del_prod"):
+    product_id: int
+
+
+class PickerPage(CallbackData, prefix="picker"):
+    kind: str
+    parent_id: int
+    offset: int
+
+
+class PickerReset(CallbackData, prefix="picker_all"):
+    kind: str
+    parent_id: int
+
+
+# Декоратор для проверки админа
+def admin_required(handler):
+    @wraps(handler)
+    async def wrapper(*args, **kwargs):
+        message = None
+        for arg in args:
+            if isinstance(arg, (types.Message, types.CallbackQuery)):
+                message = arg
+                break
+        if not message:
+            message = kwargs.get('message') or kwargs.get('callback_query') or kwargs.get('event')
+
+        # Изменено: проверка на вхождение в список ADMIN_IDS
+        if message and hasattr(message, 'from_user') and message.from_user.id not in ADMIN_IDS:
+            if hasattr(message, 'answer'):
+                await message.answer("⛔ У вас нет прав для выполнения этой команды.")
+            elif hasattr(message, 'message') and hasattr(message.message, 'answer'):
+                await message.message.answer("⛔ У вас нет прав для выполнения этой команды.")
+            return
+
+        return await handler(*args, **kwargs)
+
+    return wrapper
+
+
+def remove_media_files(paths):
+    """Удаляет медиафайлы с диска, возвращает количество удаленных"""
+    deleted_files_count = 0
+    for path in paths:
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+                deleted_files_count += 1
+            except Exception as e:
+                logger.error("Ошибка при удалении файла %s: %s", path, e)
+    return deleted_files_count
+
+
+# Состояния для FSM
+class AddCategory(StatesGroup):
+    entering_name = State()
+
+
+class AddType(StatesGroup):
+    choosing_category = State()
+    entering_name = State()
+
+
+class AddProduct(StatesGroup):
+    choosing_category = State()
+    choosing_type = State()
+    entering_name = State()
+    entering_description = State()
+    entering_price = State()
+    adding_media = State()
+
+
+class DeleteCategory(StatesGroup):
+    choosing_category = State()
+
+
+class DeleteType(StatesGroup):
+    choosing_category = State()
+    choosing_type = State()
+
+
+class DeleteProduct(StatesGroup):
+    choosing_category = State()
+    choosing_type = State()
+    choosing_product = State()
+
+
+class BulkPriceChange(StatesGroup):
+    choosing_category = State()
+    choosing_type = State()
+    entering_change = State()
+    confirming = State()
+
+
+class ImportCatalog(StatesGroup):
+    waiting_for_file = State()
+
+
+# Состояния для редактирования главного меню
+class EditMainMenu(StatesGroup):
+    choosing_section = State()
+    editing_text = State()
+    editing_photo = State()
+
+
+class Picker:
+    """Постраничный выбор категории, типа или товара: сортировка по названию, LIMIT/OFFSET в SQL"""
+
+    def __init__(self, model, parent_column, item_callback):
+        self.model = model
+        self.parent_column = parent_column
+        self.item_callback = item_callback
+
+    def page(self, db, parent_id: int, offset: int, query: str):
+        """Элементы страницы и признак следующей страницы (берем на одну запись больше)"""
+        rows = db.query(self.model.id, self.model.name)
+        if self.parent_column is not None:
+            rows = rows.filter(self.parent_column == parent_id)
+        if query:
+            rows = rows.filter(name_prefix_filter(self.model.name, query))
+        items = rows.order_by(self.model.name, self.model.id).offset(offset).limit(PICKER_PAGE_SIZE + 1).all()
+        return items[:PICKER_PAGE_SIZE], len(items) > PICKER_PAGE_SIZE
+
+
+PICKERS = {
+    "add_type_cat": Picker(Category, None, lambda item_id: AddTypeCategory(category_id=item_id)),
+    "prod_cat": Picker(Category, None, lambda item_id: ProductCategory(category_id=item_id)),
+    "prod_type": Picker(Type, Type.category_id, lambda item_id: ProductType(type_id=item_id)),
+    "del_cat": Picker(Category, None, lambda item_id: DeleteCategoryConfirm(category_id=item_id)),
+    "del_type_cat": Picker(Category, None, lambda item_id: DeleteTypeCategory(category_id=item_id)),
+    "del_type": Picker(Type, Type.category_id, lambda item_id: DeleteTypeConfirm(type_id=item_id)),
+    "del_prod_cat": Picker(Category, None, lambda item_id: DeleteProductCategory(category_id=item_id)),
+    "del_prod_type": Picker(Type, Type.category_id, lambda item_id: DeleteProductType(type_id=item_id)),
+    "del_prod": Picker(Product, Product.type_id, lambda item_id: DeleteProductConfirm(product_id=item_id)),
+}
+
+# Состояния, в которых текстовое сообщение админа - поиск по началу названия в открытом списке
+PICKER_STATES = (
+    AddType.choosing_category, AddProduct.choosing_category, AddProduct.choosing_type,
+    DeleteCategory.choosing_category, DeleteType.choosing_category, DeleteType.choosing_type,
+    DeleteProduct.choosing_category, DeleteProduct.choosing_type, DeleteProduct.choosing_product
+)
+
+
+def name_prefix_filter(column, query: str):
+    """Условие "название начинается с query".
+
+    LIKE в SQLite не учитывает регистр только для латиницы, поэтому для
+    кириллицы дополнительно проверяются варианты с заглавной и строчной первой буквой.
+    """
+    variants = {query, query[:1].upper() + query[1:], query[:1].lower() + query[1:]}
+    return or_(*(column.startswith(variant, autoescape=True) for variant in variants))
+
+
+def picker_text(picker: dict) -> str:
+    if picker["query"]:
+        return f"{picker['title']}\n🔎 Поиск: {picker['query']}"
+    return f"{picker['title']}\n🔎 Для поиска отправьте начало названия"
+
+
+def picker_keyboard(db, picker: dict, offset: int = 0):
+    """Клавиатура страницы списка, None - если список пуст"""
+    kind, parent_id, query = picker["kind"], picker["parent_id"], picker["query"]
+    items, has_more = PICKERS[kind].page(db, parent_id, offset, query)
+    if not items and not offset and not query:
+        return None
+
+    builder = InlineKeyboardBuilder()
+    for item_id, name in items:
+        builder.row(InlineKeyboardButton(text=name, callback_data=PICKERS[kind].item_callback(item_id).pack()))
+
+    navigation = []
+    if offset:
+        navigation.append(InlineKeyboardButton(text="⬅️", callback_data=PickerPage(
+            kind=kind, parent_id=parent_id, offset=max(offset - PICKER_PAGE_SIZE, 0)).pack()))
+    if has_more:
+        navigation.append(InlineKeyboardButton(text="➡️", callback_data=PickerPage(
+            kind=kind, parent_id=parent_id, offset=offset + PICKER_PAGE_SIZE).pack()))
+    if navigation:
+        builder.row(*navigation)
+    if query:
+        reset_text = "✖️ Сбросить поиск" if items else "🤷 Ничего не найдено, показать все"
+        builder.row(InlineKeyboardButton(text=reset_text, callback_data=PickerReset(
+            kind=kind, parent_id=parent_id).pack()))
+    builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data=picker["back"]))
+    return builder.as_markup()
+
+
+async def send_picker(message: Message, state: FSMContext, kind: str, title: str, back: str,
+                      parent_id: int = 0, query: str = "") -> bool:
+    """Отправляет первую страницу списка и запоминает его в FSM для листания и поиска.
+
+    Возвращает False, если выбирать не из чего.
+    """
+    picker = {"kind": kind, "parent_id": parent_id, "title": title, "back": back, "query": query}
+    db = SessionLocal()
+    try:
+        keyboard = picker_keyboard(db, picker)
+    finally:
+        db.close()
+    if keyboard is None:
+        return False
+
+    await state.update_data(picker=picker)
+    await message.answer(picker_text(picker), reply_markup=keyboard)
+    return True
+
+
+async def current_picker(state: FSMContext, kind: str, parent_id: int):
+    """Открытый список из FSM, если кнопка нажата в нем, а не в старом сообщении"""
+    picker = (await state.get_data()).get("picker")
+    if picker and picker["kind"] == kind and picker["parent_id"] == parent_id:
+        return picker
+    return None
+
+
+# Клавиатура админ-панели
+def get_admin_keyboard():
+    keyboard = [
+        [
+            InlineKeyboardButton(text="➕ Добавить категорию", callback_data="add_category"),
+            InlineKeyboardButton(text="➖ Удалить категорию", callback_data="delete_category")
+        ],
+        [
+            InlineKeyboardButton(text="🏷️ Добавить тип", callback_data="add_type"),
+            InlineKeyboardButton(text="🗑️ Удалить тип", callback_data="delete_type")
+        ],
+        [
+            InlineKeyboardButton(text="🚪 Добавить товар", callback_data="add_product"),
+            InlineKeyboardButton(text="❌ Удалить товар", callback_data="delete_product")
+        ],
+        [
+            InlineKeyboardButton(text="📦 Заказы", callback_data="view_orders"),
+            InlineKeyboardButton(text="📝 Редактировать информацию", callback_data="edit_main_menu")
+        ],
+        [
+            InlineKeyboardButton(text="💲 Изменить цены", callback_data="bulk_price"),
+            InlineKeyboardButton(text="📥 Импорт каталога", callback_data="import_catalog")
+        ],
+        [
+            InlineKeyboardButton(text="📊 Статистика", callback_data="view_stats")
+        ]
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+# Команда /admin
+@admin_router.message(Command("admin"))
+@admin_required
+async def cmd_admin(message: Message):
+    await message.answer(
+        "👨‍💻 Панель администратора\n\nВыберите действие:",
+        reply_markup=get_admin_keyboard()
+    )
+
+
+# Обработчики кнопок админ-панели
+@admin_callbacks.handler("admin_panel")
+@admin_required
+async def back_to_admin_panel(callback: types.CallbackQuery):
+    await callback.message.edit_text(
+        "👨‍💻 Панель администратора\n\nВыберите действие:",
+        reply_markup=get_admin_keyboard()
+    )
+
+
+# Листание и поиск в списках выбора категории, типа и товара
+@admin_callbacks.handler(PickerPage, PickerReset)
+@admin_required
+async def turn_picker_page(callback: types.CallbackQuery, callback_data, state: FSMContext):
+    picker = await current_picker(state, callback_data.kind, callback_data.parent_id)
+    if picker is None:
+        await callback.answer("⌛ Список устарел, откройте его заново")
+        return
+
+    offset = 0
+    if isinstance(callback_data, PickerReset):
+        picker["query"] = ""
+        await state.update_data(picker=picker)
+    else:
+        offset = callback_data.offset
+
+    db = SessionLocal()
+    try:
+        keyboard = picker_keyboard(db, picker, offset)
+    finally:
+        db.close()
+    if keyboard is None:
+        await callback.answer("❌ Список пуст")
+        return
+    await callback.message.edit_text(picker_text(picker), reply_markup=keyboard)
+    await callback.answer()
+
+
+@admin_router.message(StateFilter(*PICKER_STATES), F.text)
+@admin_required
+async def search_picker(message: Message, state: FSMContext):
+    picker = (await state.get_data()).get("picker")
+    if not picker:
+        return
+    await send_picker(message, state, picker["kind"], picker["title"], picker["back"],
+                      picker["parent_id"], message.text.strip())
+
+
+# Просмотр заказов: постранично, одно сообщение на заказ
+async def send_orders_page(message: Message, before_ts: int = 0, before_id: int = 0):
+    db = SessionLocal()
+    try:
+        item_line = (
+            OrderItem.product_name + " - " + cast(OrderItem.product_price, String)
+            + " руб. x " + cast(OrderItem.quantity, String)
+        )
+        query = db.query(
+            Order.id, Order.user_name, Order.phone_number, Order.total_amount, Order.created_at,
+            func.group_concat(item_line, "\n").label("items")
+        ).outerjoin(OrderItem, OrderItem.order_id == Order.id).filter(Order.status == "pending")
+        if before_id:
+            query = query.filter(tuple_(Order.created_at, Order.id) < (before_ts, before_id))
+        # Keyset-пагинация по индексу (status, created_at): берем на одну запись больше,
+        # чтобы узнать, есть ли следующая страница
+        orders = query.group_by(Order.id).order_by(
+            Order.created_at.desc(), Order.id.desc()
+        ).limit(ORDERS_PAGE_SIZE + 1).all()
+    finally:
+        db.close()
+
+    if not orders:
+        await message.answer("📦 Нет активных заказов")
+        return
+
+    has_more = len(orders) > ORDERS_PAGE_SIZE
+    orders = orders[:ORDERS_PAGE_SIZE]
+
+    for order in orders:
+        items_text = "\n".join(f"• {line}" for line in order.items.split("\n")) if order.items else ""
+        order_text = (
+            f"📦 Заказ #{order.id}\n"
+            f"👤 Пользователь: {order.user_name}\n"
+            f"📞 Телефон: {order.phone_number}\n"
+            f"💰 Сумма: {order.total_amount} руб.\n"
+            f"📅 Дата: {format_order_time(order.created_at)}\n"
+            f"🛒 Товары:\n{items_text}"
+        )
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="✅ Выполнен", callback_data=CompleteOrder(order_id=order.id).pack()),
+             InlineKeyboardButton(text="🖼️ Фото товаров", callback_data=OrderMedia(order_id=order.id).pack())]
+        ])
+        await message.answer(order_text, reply_markup=keyboard)
+
+    builder = InlineKeyboardBuilder()
+    if has_more:
+        last_order = orders[-1]
+        builder.button(text="Следующие ➡️",
+                       callback_data=OrdersPage(before_ts=last_order.created_at, before_id=last_order.id).pack())
+    builder.button(text="🔙 Назад", callback_data="admin_panel")
+    builder.adjust(1)
+    await message.answer(f"📦 Показано заказов: {len(orders)}", reply_markup=builder.as_markup())
+
+
+@admin_callbacks.handler("view_orders")
+@admin_required
+async def view_orders(callback: types.CallbackQuery):
+    await send_orders_page(callback.message)
+    await callback.answer()
+
+
+@admin_callbacks.handler(OrdersPage)
+@admin_required
+async def view_orders_page(callback: types.CallbackQuery, callback_data: OrdersPage):
+    await send_orders_page(callback.message, callback_data.before_ts, callback_data.before_id)
+    await callback.answer()
+
+
+# Медиа товаров заказа отправляются только по запросу
+@admin_callbacks.handler(OrderMedia)
+@admin_required
+async def show_order_media(callback: types.CallbackQuery, callback_data: OrderMedia):
+    order_id = callback_data.order_id
+    db = SessionLocal()
+    try:
+        order_items = db.query(OrderItem).filter(OrderItem.order_id == order_id).order_by(OrderItem.id).all()
+        covers = get_product_covers(db, [item.product_id for item in order_items])
+        media_group = []
+        for item in order_items:
+            if item.product_id not in covers:
+                continue
+            media_type, file_id = covers[item.product_id]
+            caption = (
+                f"🚪 {item.product_name}\n"
+                f"📦 Заказ #{order_id}\n"
+                f"💰 {item.product_price} руб. x {item.quantity} = {item.product_price * item.quantity} руб."
+            )
+            if media_type == 'photo':
+                media_group.append(types.InputMediaPhoto(media=file_id, caption=caption))
+            else:
+                media_group.append(types.InputMediaVideo(media=file_id, caption=caption))
+    finally:
+        db.close()
+
+    if not media_group:
+        await callback.answer("❌ У товаров заказа нет медиафайлов")
+        return
+
+    # В одной медиагруппе допускается не больше 10 файлов
+    for start in range(0, len(media_group), 10):
+        chunk = media_group[start:start + 10]
+        if len(chunk) == 1:
+            if isinstance(chunk[0], types.InputMediaPhoto):
+                await callback.message.answer_photo(photo=chunk[0].media, caption=chunk[0].caption)
+            else:
+                await callback.message.answer_video(video=chunk[0].media, caption=chunk[0].caption)
+        else:
+            await callback.message.answer_media_group(media=chunk)
+    await callback.answer()
+
+
+# Обработчик выполнения заказа
+@admin_callbacks.handler(CompleteOrder)
+@admin_required
+async def complete_order(callback: types.CallbackQuery, callback_data: CompleteOrder):
+    order_id = callback_data.order_id
+    db = SessionLocal()
+    try:
+        # Проверка статуса и смена одним UPDATE: при двойном нажатии или двух админах
+        # выполнение засчитает в статистику только тот, чей UPDATE изменил строку
+        completed_count = db.execute(
+            update(Order).where(Order.id == order_id, Order.status != "completed").values(status="completed"),
+            execution_options={"synchronize_session": False}
+        ).rowcount
+        if completed_count == 1:
+            order = db.query(Order.created_at, Order.total_amount).filter(Order.id == order_id).one()
+            record_completion(db, order)
+            db.commit()
+        elif not db.query(Order.id).filter(Order.id == order_id).first():
+            await callback.answer("❌ Заказ не найден")
+            return
+
+        # Удаляем сообщение с заказом
+        try:
+            await callback.message.delete()
+        except Exception as e:
+            logger.warning("Не удалось удалить сообщение: %s", e)
+
+        await callback.answer(f"✅ Заказ #{order_id} выполнен и удален из списка")
+    except Exception as e:
+        db.rollback()
+        await callback.answer("❌ Ошибка при выполнении заказа")
+        logger.error("Order completion error: %s", e)
+    finally:
+        db.close()
+
+
+# Статистика продаж из агрегатных таблиц
+@admin_router.message(Command("stats"))
+@admin_required
+async def cmd_stats(message: Message):
+    db = SessionLocal()
+    try:
+        stats_text = format_sales_report(db)
+    finally:
+        db.close()
+    await message.answer(stats_text)
+
+
+@admin_callbacks.handler("view_stats")
+@admin_required
+async def view_stats(callback: types.CallbackQuery):
+    db = SessionLocal()
+    try:
+        stats_text = format_sales_report(db)
+    finally:
+        db.close()
+    await callback.message.answer(stats_text, reply_markup=get_admin_keyboard())
+    await callback.answer()
+
+
+# Выгрузка заказов за период: /export 01.10.2025 31.10.2025 csv
+@admin_router.message(Command("export"))
+@admin_required
+async def cmd_export(message: Message):
+    args = message.text.split()[1:]
+    try:
+        start_date = datetime.strptime(args[0], "%d.%m.%Y")
+        end_date = datetime.strptime(args[1], "%d.%m.%Y") if len(args) > 1 else start_date
+        export_format = args[2].lower() if len(args) > 2 else "csv"
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(export_format)
+    except (IndexError, ValueError):
+        await message.answer("ℹ️ Использование: /export ДД.ММ.ГГГГ [ДД.ММ.ГГГГ] [csv|jsonl]")
+        return
+
+    start_ts = int(start_date.timestamp())
+    end_ts = int((end_date + timedelta(days=1)).timestamp())
+    file_name = f"orders_{start_date:%Y%m%d}_{end_date:%Y%m%d}.{export_format}.gz"
+
+    fd, file_path = tempfile.mkstemp(suffix=".gz")
+    os.close(fd)
+    try:
+        # Выгрузка пишется потоково в отдельном потоке, чтобы не блокировать event loop
+        rows_count = await asyncio.to_thread(write_orders_export, file_path, start_ts, end_ts, export_format)
+        if not rows_count:
+            await message.answer("📭 За выбранный период заказов нет")
+            return
+
+        await message.answer_document(
+            FSInputFile(file_path, filename=file_name),
+            caption=f"📤 Выгрузка заказов: {rows_count} строк"
+        )
+    except Exception as e:
+        await message.answer("❌ Ошибка при выгрузке заказов")
+        logger.error("Export error: %s", e)
+    finally:
+        os.remove(file_path)
+
+
+# Начало редактирования главного меню
+@admin_callbacks.handler("edit_main_menu")
+@admin_required
+async def start_edit_main_menu(callback: types.CallbackQuery, state: FSMContext):
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🛠️ Услуги", callback_data=EditSection(section_key="services").pack())],
+        [InlineKeyboardButton(text="ℹ️ Информация", callback_data=EditSection(section_key="info").pack())],
+        [InlineKeyboardButton(text="💬 Консультация", callback_data=EditSection(section_key="consultation").pack())],
+        [InlineKeyboardButton(text="🔙 Назад", callback_data="admin_panel")]
+    ])
+
+    await callback.message.edit_text(
+        "📝 Редактирование главного меню\n\nКакую информацию хотите изменить?",
+        reply_markup=keyboard
+    )
+    await state.set_state(EditMainMenu.choosing_section)
+    await callback.answer()
+
+
+# Обработчик выбора раздела для редактирования - ИСПРАВЛЕННЫЙ ФИЛЬТР
+@admin_callbacks.handler(EditSection, state=EditMainMenu.choosing_section)
+@admin_required
+async def choose_section_to_edit(callback: types.CallbackQuery, callback_data: EditSection, state: FSMContext):
+    section_key = callback_data.section_key  # services, info, consultation
+
+    db = SessionLocal()
+    try:
+        section = db.query(MainMenuSection).filter(MainMenuSection.section_key == section_key).first()
+        if not section:
+            await callback.answer("❌ Раздел не найден в базе данных")
+            return
+
+        await state.update_data(section_key=section_key, section_id=section.id)
+
+        # Показываем текущее содержимое раздела
+        current_content = f"📝 Редактирование раздела: {section.title}\n\n"
+        current_content += f"Текущий текст:\n{section.content}\n\n"
+        current_content += "Введите новый текст для этого раздела:"
+
+        await callback.message.edit_text(current_content)
+        await state.set_state(EditMainMenu.editing_text)
+
+    except Exception as e:
+        logger.error("Error in choose_section_to_edit: %s", e)
+        await callback.answer("❌ Ошибка при загрузке раздела")
+    finally:
+        db.close()
+
+
+# Обработчик ввода нового текста
+@admin_router.message(EditMainMenu.editing_text, F.text)
+@admin_required
+async def process_section_text(message: Message, state: FSMContext):
+    new_text = message.text
+    user_data = await state.get_data()
+    section_key = user_data['section_key']
+    section_id = user_data['section_id']
+
+    db = SessionLocal()
+    try:
+        section = db.query(MainMenuSection).filter(MainMenuSection.id == section_id).first()
+        if section:
+            section.content = new_text
+            db.commit()
+            invalidate_sections()
+
+            # Предлагаем изменить фото
+            keyboard = InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="🖼️ Изменить фото", callback_data="change_photo")],
+                [InlineKeyboardButton(text="🗑️ Удалить текущее фото", callback_data="remove_photo")],
+                [InlineKeyboardButton(text="➡️ Пропустить", callback_data="skip_photo")]
+            ])
+
+            photo_status = "есть" if section.photo_path else "нет"
+            await message.answer(
+                f"✅ Текст раздела обновлен!\n\n"
+                f"Текущее фото: {photo_status}\n"
+                f"Выберите действие с фото:",
+                reply_markup=keyboard
+            )
+            await state.set_state(EditMainMenu.editing_photo)
+        else:
+            await message.answer("❌ Раздел не найден")
+            await state.clear()
+
+    except Exception as e:
+        db.rollback()
+        await message.answer("❌ Ошибка при обновлении текста")
+        logger.error("Section text update error: %s", e)
+        await state.clear()
+    finally:
+        db.close()
+
+
+# Обработчик действий с фото
+@admin_callbacks.handler("change_photo", "remove_photo", "skip_photo", state=EditMainMenu.editing_photo)
+@admin_required
+async def handle_photo_action(callback: types.CallbackQuery, state: FSMContext, bot: Bot):
+    action = callback.data
+    user_data = await state.get_data()
+    section_id = user_data['section_id']
+
+    db = SessionLocal()
+    try:
+        section = db.query(MainMenuSection).filter(MainMenuSection.id == section_id).first()
+        if not section:
+            await callback.answer("❌ Раздел не найден")
+            await state.clear()
+            return
+
+        if action == "remove_photo":
+            # Удаляем текущее фото
+            if section.photo_path and os.path.exists(section.photo_path):
+                try:
+                    os.remove(section.photo_path)
+                except Exception as e:
+                    logger.error("Ошибка при удалении файла %s: %s", section.photo_path, e)
+
+            section.photo_path = None
+            section.file_id = None
+            db.commit()
+            invalidate_sections()
+
+            await callback.message.answer("✅ Фото удалено! Раздел главного меню обновлен.")
+            await callback.message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
+            await state.clear()
+
+        elif action == "change_photo":
+            await callback.message.answer("🖼️ Отправьте новое фото для этого раздела:")
+            # Состояние уже установлено в editing_photo, ждем фото
+
+        elif action == "skip_photo":
+            await callback.message.answer("✅ Раздел главного меню обновлен!")
+            await callback.message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
+            await state.clear()
+
+    except Exception as e:
+        db.rollback()
+        await callback.message.answer("❌ Ошибка при обработке фото")
+        logger.error("Photo action error: %s", e)
+        await state.clear()
+    finally:
+        db.close()
+
+    await callback.answer()
+
+
+# Обработчик загрузки нового фото
+@admin_router.message(EditMainMenu.editing_photo, F.content_type == ContentType.PHOTO)
+@admin_required
+async def process_section_photo(message: Message, state: FSMContext, bot: Bot):
+    user_data = await state.get_data()
+    section_id = user_data['section_id']
+
+    db = SessionLocal()
+    try:
+        section = db.query(MainMenuSection).filter(MainMenuSection.id == section_id).first()
+        if not section:
+            await message.answer("❌ Раздел не найден")
+            await state.clear()
+            return
+
+        # Удаляем старое фото, если оно есть
+        if section.photo_path and os.path.exists(section.photo_path):
+            try:
+                os.remove(section.photo_path)
+            except Exception as e:
+                logger.error("Ошибка при удалении старого файла %s: %s", section.photo_path, e)
+
+        # Сохраняем новое фото
+        file_id = message.photo[-1].file_id
+        file = await bot.get_file(file_id)
+        file_path = f"files/{file_id}_{message.message_id}.jpg"
+        await bot.download_file(file.file_path, file_path)
+
+        # Обновляем запись в БД
+        section.photo_path = file_path
+        section.file_id = file_id
+        db.commit()
+        invalidate_sections()
+
+        await message.answer("✅ Фото обновлено! Раздел главного меню полностью обновлен.")
+        await message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
+
+    except Exception as e:
+        db.rollback()
+        await message.answer("❌ Ошибка при загрузке фото")
+        logger.error("Photo upload error: %s", e)
+    finally:
+        db.close()
+
+    await state.clear()
+
+
+# Обработчики для остальных функций админ-панели (добавление/удаление категорий, типов, товаров)
+# ... [здесь остаются все ваши существующие обработчики для товаров, категорий и типов]
+
+# Добавление категории
+@admin_callbacks.handler("add_category")
+@admin_required
+async def start_add_category(callback: types.CallbackQuery, state: FSMContext):
+    await callback.message.answer("📝 Введите название новой категории:")
+    await state.set_state(AddCategory.entering_name)
+    await callback.answer()
+
+
+@admin_router.message(AddCategory.entering_name, F.text)
+@admin_required
+async def process_category_name(message: Message, state: FSMContext):
+    category_name = message.text.strip()
+    db = SessionLocal()
+    try:
+        existing_category = db.query(Category).filter(Category.name == category_name).first()
+        if existing_category:
+            await message.answer("❌ Категория с таким названием уже существует!")
+            return
+
+        new_category = Category(name=category_name)
+        db.add(new_category)
+        db.commit()
+        invalidate_catalog()
+        await message.answer(f"✅ Категория '{category_name}' успешно добавлена!")
+        await message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
+    except Exception as e:
+        db.rollback()
+        await message.answer("❌ Ошибка при добавлении категории!")
+    finally:
+        db.close()
+    await state.clear()
+
+
+# Добавление типа
+@admin_callbacks.handler("add_type")
+@admin_required
+async def start_add_type(callback: types.CallbackQuery, state: FSMContext):
+    if not await send_picker(callback.message, state, "add_type_cat", "📁 Выберите категорию для нового типа:",
+                             "admin_panel"):
+        await callback.message.answer("❌ Сначала создайте хотя бы одну категорию!")
+        await callback.answer()
+        return
+    await state.set_state(AddType.choosing_category)
+    await callback.answer()
+
+
+@admin_callbacks.handler(AddTypeCategory, state=AddType.choosing_category)
+@admin_required
+async def process_category_for_type(callback: types.CallbackQuery, callback_data: AddTypeCategory,
+                                    state: FSMContext):
+    category_id = callback_data.category_id
+    await state.update_data(category_id=category_id)
+    await callback.message.answer("🏷️ Введите название нового типа:")
+    await state.set_state(AddType.entering_name)
+    await callback.answer()
+
+
+@admin_router.message(AddType.entering_name, F.text)
+@admin_required
+async def process_type_name(message: Message, state: FSMContext):
+    type_name = message.text.strip()
+    user_data = await state.get_data()
+    category_id = user_data['category_id']
+    db = SessionLocal()
+    try:
+        existing_type = db.query(Type).filter(
+            Type.name == type_name,
+            Type.category_id == category_id
+        ).first()
+        if existing_type:
+            await message.answer("❌ Тип с таким названием уже существует в этой категории!")
+            return
+
+        new_type = Type(name=type_name, category_id=category_id)
+        db.add(new_type)
+        db.commit()
+        invalidate_catalog()
+        category = db.query(Category).filter(Category.id == category_id).first()
+        await message.answer(f"✅ Тип '{type_name}' успешно добавлен в категорию '{category.name}'!")
+        await message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
+    except Exception as e:
+        db.rollback()
+        await message.answer("❌ Ошибка при добавлении типа!")
+    finally:
+        db.close()
+    await state.clear()
+
+
+# Добавление товара
+@admin_callbacks.handler("add_product")
+@admin_required
+async def start_add_product(callback: types.CallbackQuery, state: FSMContext):
+    if not await send_picker(callback.message, state, "prod_cat", "📁 Выберите категорию для товара:",
+                             "admin_panel"):
+        await callback.message.answer("❌ Сначала создайте хотя бы одну категорию!")
+        await callback.answer()
+        return
+    await state.set_state(AddProduct.choosing_category)
+    await state.update_data(media_files=[])
+    await callback.answer()
+
+
+@admin_callbacks.handler(ProductCategory, state=AddProduct.choosing_category)
+@admin_required
+async def process_product_category(callback: types.CallbackQuery, callback_data: ProductCategory,
+                                   state: FSMContext):
+    category_id = callback_data.category_id
+    await state.update_data(category_id=category_id)
+    db = SessionLocal()
+    try:
+        category = db.query(Category).filter(Category.id == category_id).first()
+    finally:
+        db.close()
+    if not category:
+        await callback.answer("❌ Категория не найдена!")
+        return
+
+    if not await send_picker(callback.message, state, "prod_type",
+                             f"🏷️ Выберите тип в категории '{category.name}':", "add_product", category_id):
+        await callback.message.answer(f"❌ В категории '{category.name}' нет типов! Сначала создайте тип.")
+        await state.clear()
+        await callback.answer()
+        return
+    await state.set_state(AddProduct.choosing_type)
+    await callback.answer()
+
+
+@admin_callbacks.handler(ProductType, state=AddProduct.choosing_type)
+@admin_required
+async def process_product_type(callback: types.CallbackQuery, callback_data: ProductType, state: FSMContext):
+    type_id = callback_data.type_id
+    await state.update_data(type_id=type_id)
+    await callback.message.answer("🚪 Введите название товара:")
+    await state.set_state(AddProduct.entering_name)
+    await callback.answer()
+
+
+@admin_router.message(AddProduct.entering_name, F.text)
+@admin_required
+async def process_product_name(message: Message, state: FSMContext):
+    product_name = message.text.strip()
+    await state.update_data(product_name=product_name)
+    await message.answer("📝 Введите описание товара:")
+    await state.set_state(AddProduct.entering_description)
+
+
+@admin_router.message(AddProduct.entering_description, F.text)
+@admin_required
+async def process_product_description(message: Message, state: FSMContext):
+    product_description = message.text.strip()
+    await state.update_data(product_description=product_description)
+    await message.answer("💰 Введите цену товара в рублях (только число):")
+    await state.set_state(AddProduct.entering_price)
+
+
+@admin_router.message(AddProduct.entering_price, F.text)
+@admin_required
+async def process_product_price(message: Message, state: FSMContext):
+    try:
+        price = int(message.text.strip())
+        if price <= 0:
+            await message.answer("❌ Цена должна быть положительным числом!")
+            return
+        await state.update_data(price=price)
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="✅ Завершить добавление медиа", callback_data="finish_media")]
+        ])
+        await message.answer(
+            "🖼️ Теперь отправьте фото или видео товара.\nМожно отправить несколько файлов.\nКогда закончите, нажмите кнопку ниже:",
+            reply_markup=keyboard
+        )
+        await state.set_state(AddProduct.adding_media)
+    except ValueError:
+        await message.answer("❌ Пожалуйста, введите корректную цену (только число):")
+
+
+@admin_router.message(AddProduct.adding_media, F.content_type.in_({ContentType.PHOTO, ContentType.VIDEO}))
+@admin_required
+async def process_product_media(message: Message, state: FSMContext, bot: Bot):
+    user_data = await state.get_data()
+    media_files = user_data.get('media_files', [])
+    try:
+        if message.photo:
+            file_id = message.photo[-1].file_id
+            media_type = "photo"
+        elif message.video:
+            file_id = message.video.file_id
+            media_type = "video"
+        else:
+            await message.answer("❌ Поддерживаются только фото и видео!")
+            return
+
+        file = await bot.get_file(file_id)
+        file_path = f"{MEDIA_FOLDER}/{file_id}_{message.message_id}.jpg" if media_type == "photo" else f"{MEDIA_FOLDER}/{file_id}_{message.message_id}.mp4"
+        await bot.download_file(file.file_path, file_path)
+
+        media_files.append({
+            'file_id': file_id,
+            'file_path': file_path,
+            'media_type': media_type
+        })
+        await state.update_data(media_files=media_files)
+        await message.answer(f"✅ Медиафайл добавлен! Всего файлов: {len(media_files)}")
+    except Exception as e:
+        await message.answer("❌ Ошибка при обработке медиафайла!")
+
+
+@admin_callbacks.handler("finish_media", state=AddProduct.adding_media)
+@admin_required
+async def finish_media_and_save_product(callback: types.CallbackQuery, state: FSMContext, bot: Bot):
+    user_data = await state.get_data()
+    if not user_data.get('media_files'):
+        await callback.message.answer("❌ Вы не добавили ни одного медиафайла! Добавьте хотя бы один.")
+        await callback.answer()
+        return
+
+    db = SessionLocal()
+    try:
+        new_product = Product(
+            name=user_data['product_name'],
+            description=user_data['product_description'],
+            price=user_data['price'],
+            type_id=user_data['type_id']
+        )
+        db.add(new_product)
+        db.flush()
+
+        for media_info in user_data['media_files']:
+            media = ProductMedia(
+                product_id=new_product.id,
+                file_id=media_info['file_id'],
+                file_path=media_info['file_path'],
+                media_type=media_info['media_type']
+            )
+            db.add(media)
+
+        db.flush()
+        refresh_product_covers(db, [new_product.id])
+        db.commit()
+        invalidate_catalog()
+        product_type = db.query(Type).filter(Type.id == user_data['type_id']).first()
+        category = db.query(Category).filter(Category.id == user_data['category_id']).first()
+
+        success_message = (
+            f"✅ Товар успешно добавлен!\n\n"
+            f"📁 Категория: {category.name}\n"
+            f"🏷️ Тип: {product_type.name}\n"
+            f"🚪 Товар: {user_data['product_name']}\n"
+            f"💰 Цена: {user_data['price']} руб.\n"
+            f"📝 Описание: {user_data['product_description']}\n"
+            f"🖼️ Медиафайлов: {len(user_data['media_files'])}"
+        )
+
+        await callback.message.answer(success_message)
+        await callback.message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
+    except Exception as e:
+        db.rollback()
+        await callback.message.answer("❌ Ошибка при сохранении товара!")
+    finally:
+        db.close()
+    await state.clear()
+    await callback.answer()
+
+
+# Импорт каталога из CSV/JSON файла
+@admin_router.message(Command("import"))
+@admin_required
+async def cmd_import_catalog(message: Message, state: FSMContext):
+    await message.answer(IMPORT_HELP_TEXT)
+    await state.set_state(ImportCatalog.waiting_for_file)
+
+
+@admin_callbacks.handler("import_catalog")
+@admin_required
+async def start_import_catalog(callback: types.CallbackQuery, state: FSMContext):
+    await callback.message.answer(IMPORT_HELP_TEXT)
+    await state.set_state(ImportCatalog.waiting_for_file)
+    await callback.answer()
+
+
+@admin_router.message(ImportCatalog.waiting_for_file, F.content_type == ContentType.DOCUMENT)
+@admin_required
+async def process_catalog_file(message: Message, state: FSMContext, bot: Bot):
+    file_name = message.document.file_name or ""
+    if not file_name.lower().endswith(IMPORT_FORMATS):
+        await message.answer("❌ Поддерживаются только файлы .csv, .json и .jsonl")
+        return
+
+    fd, file_path = tempfile.mkstemp(suffix=os.path.splitext(file_name)[1])
+    os.close(fd)
+    try:
+        await bot.download(message.document, destination=file_path)
+        # Разбор и запись в БД идут в отдельном потоке одной транзакцией
+        stats = await asyncio.to_thread(run_catalog_import, file_path, file_name)
+        invalidate_catalog()
+        invalidate_products()
+        cart_store.refresh_prices()
+        await message.answer(
+            f"✅ Импорт каталога завершен!\n\n"
+            f"🆕 Создано: {stats['created']}\n"
+            f"🔄 Обновлено: {stats['updated']}\n"
+            f"⏭️ Пропущено: {stats['skipped']}"
+        )
+        await message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
+        await state.clear()
+    except Exception as e:
+        await message.answer("❌ Ошибка при импорте каталога! Изменения не сохранены.")
+        logger.error("Catalog import error: %s", e)
+    finally:
+        os.remove(file_path)
+
+
+# Массовое изменение цен в категории или типе
+@admin_callbacks.handler("bulk_price")
+@admin_required
+async def start_bulk_price(callback: types.CallbackQuery, state: FSMContext):
+    db = SessionLocal()
+    try:
+        categories = db.query(Category).order_by(Category.name).all()
+        if not categories:
+            await callback.message.answer("❌ Нет категорий для изменения цен!")
+            await callback.answer()
+            return
+
+        builder = InlineKeyboardBuilder()
+        for category in categories:
+            builder.button(text=category.name, callback_data=PriceCategory(category_id=category.id).pack())
+        builder.button(text="🔙 Назад", callback_data="admin_panel")
+        builder.adjust(1)
+
+        await callback.message.answer(
+            "💲 Выберите категорию для изменения цен:",
+            reply_markup=builder.as_markup()
+        )
+        await state.set_state(BulkPriceChange.choosing_category)
+    finally:
+        db.close()
+    await callback.answer()
+
+
+@admin_callbacks.handler(PriceCategory, state=BulkPriceChange.choosing_category)
+@admin_required
+async def choose_type_for_price_change(callback: types.CallbackQuery, callback_data: PriceCategory,
+                                       state: FSMContext):
+    category_id = callback_data.category_id
+    db = SessionLocal()
+    try:
+        category = db.query(Category).filter(Category.id == category_id).first()
+        if not category:
+            await callback.answer("❌ Категория не найдена!")
+            return
+        types = db.query(Type).filter(Type.category_id == category_id).order_by(Type.name).all()
+
+        builder = InlineKeyboardBuilder()
+        builder.button(text="📁 Вся категория", callback_data=PriceType(type_id=0).pack())
+        for type_obj in types:
+            builder.button(text=type_obj.name, callback_data=PriceType(type_id=type_obj.id).pack())
+        builder.button(text="🔙 Назад", callback_data="bulk_price")
+        builder.adjust(1)
+
+        await state.update_data(category_id=category_id, category_name=category.name)
+        await callback.message.answer(
+            f"🏷️ Изменить цены во всей категории '{category.name}' или в одном типе?",
+            reply_markup=builder.as_markup()
+        )
+        await state.set_state(BulkPriceChange.choosing_type)
+    finally:
+        db.close()
+    await callback.answer()
+
+
+@admin_callbacks.handler(PriceType, state=BulkPriceChange.choosing_type)
+@admin_required
+async def enter_price_change(callback: types.CallbackQuery, callback_data: PriceType, state: FSMContext):
+    type_id = callback_data.type_id
+    user_data = await state.get_data()
+    scope = f"категория '{user_data['category_name']}'"
+
+    if type_id:
+        db = SessionLocal()
+        try:
+            type_obj = db.query(Type).filter(Type.id == type_id).first()
+            if not type_obj:
+                await callback.answer("❌ Тип не найден!")
+                return
+            scope = f"тип '{type_obj.name}' ({scope})"
+        finally:
+            db.close()
+
+    await state.update_data(type_id=type_id or None, scope=scope)
+    await callback.message.answer(
+        f"💲 {scope}\n\n"
+        "Введите изменение цены:\n"
+        "• в процентах: +10% или -5%\n"
+        "• в рублях: +500 или -300"
+    )
+    await state.set_state(BulkPriceChange.entering_change)
+    await callback.answer()
+
+
+@admin_router.message(BulkPriceChange.entering_change, F.text)
+@admin_required
+async def preview_price_change(message: Message, state: FSMContext):
+    price_change = parse_price_change(message.text)
+    if not price_change:
+        await message.answer("❌ Не удалось разобрать изменение. Примеры: +10%, -5%, +500, -300")
+        return
+
+    user_data = await state.get_data()
+    db = SessionLocal()
+    try:
+        products_count = count_products_in_scope(db, user_data['category_id'], user_data['type_id'])
+    finally:
+        db.close()
+
+    if not products_count:
+        await message.answer("❌ В выбранном разделе нет товаров!")
+        await message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
+        await state.clear()
+        return
+
+    kind, value = price_change
+    await state.update_data(kind=kind, value=value)
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✅ Применить", callback_data="price_confirm"),
+         InlineKeyboardButton(text="❌ Отмена", callback_data="admin_panel")]
+    ])
+    await message.answer(
+        f"💲 {user_data['scope']}\n\n"
+        f"Изменение: {format_price_change(kind, value)}\n"
+        f"Будет изменено товаров: {products_count}\n\n"
+        "Цена не может стать меньше 1 руб.",
+        reply_markup=keyboard
+    )
+    await state.set_state(BulkPriceChange.confirming)
+
+
+@admin_callbacks.handler("price_confirm", state=BulkPriceChange.confirming)
+@admin_required
+async def confirm_price_change(callback: types.CallbackQuery, state: FSMContext):
+    user_data = await state.get_data()
+    db = SessionLocal()
+    try:
+        batch = apply_price_change(
+            db, user_data['scope'], user_data['category_id'], user_data['type_id'],
+            user_data['kind'], user_data['value']
+        )
+        batch_id, products_count = batch.id, batch.products_count
+        db.commit()
+        invalidate_products()
+        cart_store.refresh_prices()
+
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="↩️ Отменить изменение", callback_data=PriceUndo(batch_id=batch_id).pack())]
+        ])
+        await callback.message.answer(
+            f"✅ Цены изменены: {user_data['scope']}, "
+            f"{format_price_change(user_data['kind'], user_data['value'])}\n"
+            f"🔄 Изменено товаров: {products_count}",
+            reply_markup=keyboard
+        )
+        await callback.message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
+    except Exception as e:
+        db.rollback()
+        await callback.message.answer("❌ Ошибка при изменении цен!")
+        logger.error("Bulk price change error: %s", e)
+    finally:
+        db.close()
+    await state.clear()
+    await callback.answer()
+
+
+@admin_callbacks.handler(PriceUndo)
+@admin_required
+async def undo_bulk_price(callback: types.CallbackQuery, callback_data: PriceUndo):
+    batch_id = callback_data.batch_id
+    db = SessionLocal()
+    try:
+        restored_count = undo_price_change(db, batch_id)
+        if restored_count is None:
+            await callback.answer("❌ Изменение уже отменено или не найдено")
+            return
+        db.commit()
+        invalidate_products()
+        cart_store.refresh_prices()
+
+        try:
+            await callback.message.edit_reply_markup(reply_markup=None)
+        except Exception as e:
+            logger.warning("Не удалось убрать кнопку отмены: %s", e)
+        await callback.message.answer(f"↩️ Цены восстановлены у {restored_count} товаров")
+    except Exception as e:
+        db.rollback()
+        await callback.message.answer("❌ Ошибка при отмене изменения цен!")
+        logger.error("Bulk price undo error: %s", e)
+    finally:
+        db.close()
+    await callback.answer()
+
+
+# Удаление категории
+@admin_callbacks.handler("delete_category")
+@admin_required
+async def start_delete_category(callback: types.CallbackQuery, state: FSMContext):
+    if not await send_picker(callback.message, state, "del_cat", "📁 Выберите категорию для удаления:",
+                             "admin_panel"):
+        await callback.message.answer("❌ Нет категорий для удаления!")
+        await callback.answer()
+        return
+    await state.set_state(DeleteCategory.choosing_category)
+    await callback.answer()
+
+
+@admin_callbacks.handler(DeleteCategoryConfirm)
+@admin_required
+async def process_delete_category(callback: types.CallbackQuery, callback_data: DeleteCategoryConfirm,
+                                  state: FSMContext):
+    category_id = callback_data.category_id
+    db = SessionLocal()
+    try:
+        category = db.query(Category).filter(Category.id == category_id).first()
+        if not category:
+            await callback.message.answer("❌ Категория не найдена!")
+            await callback.answer()
+            return
+
+        category_name = category.name
+        media_paths = delete_category_cascade(db, category_id)
+        db.commit()
+        invalidate_catalog()
+        invalidate_products()
+        cart_store.refresh_prices()
+        deleted_files_count = remove_media_files(media_paths)
+
+        await callback.message.answer(
+            f"✅ Категория '{category_name}' и все связанные типы и товары удалены!\n"
+            f"🗑️ Удалено медиафайлов: {deleted_files_count}"
+        )
+        await callback.message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
+
+    except Exception as e:
+        db.rollback()
+        await callback.message.answer("❌ Ошибка при удалении категории!")
+    finally:
+        db.close()
+    await state.clear()
+    await callback.answer()
+
+
+# Удаление типа
+@admin_callbacks.handler("delete_type")
+@admin_required
+async def start_delete_type(callback: types.CallbackQuery, state: FSMContext):
+    if not await send_picker(callback.message, state, "del_type_cat", "📁 Выберите категорию:", "admin_panel"):
+        await callback.message.answer("❌ Нет категорий для удаления типов!")
+        await callback.answer()
+        return
+    await state.set_state(DeleteType.choosing_category)
+    await callback.answer()
+
+
+@admin_callbacks.handler(DeleteTypeCategory, state=DeleteType.choosing_category)
+@admin_required
+async def choose_type_for_deletion(callback: types.CallbackQuery, callback_data: DeleteTypeCategory,
+                                   state: FSMContext):
+    category_id = callback_data.category_id
+    db = SessionLocal()
+    try:
+        category = db.query(Category).filter(Category.id == category_id).first()
+    finally:
+        db.close()
+    if not category:
+        await callback.answer("❌ Категория не найдена!")
+        return
+
+    if not await send_picker(callback.message, state, "del_type",
+                             f"🏷️ Выберите тип для удаления из категории '{category.name}':", "delete_type",
+                             category_id):
+        await callback.message.answer(f"❌ В категории '{category.name}' нет типов!")
+        await state.clear()
+        await callback.answer()
+        return
+    await state.set_state(DeleteType.choosing_type)
+    await callback.answer()
+
+
+@admin_callbacks.handler(DeleteTypeConfirm, state=DeleteType.choosing_type)
+@admin_required
+async def process_delete_type(callback: types.CallbackQuery, callback_data: DeleteTypeConfirm, state: FSMContext):
+    type_id = callback_data.type_id
+    db = SessionLocal()
+    try:
+        type_obj = db.query(Type).filter(Type.id == type_id).first()
+        if not type_obj:
+            await callback.message.answer("❌ Тип не найден!")
+            await callback.answer()
+            return
+
+        type_name = type_obj.name
+        media_paths = delete_types_cascade(db, [type_id])
+        db.commit()
+        invalidate_catalog()
+        invalidate_products()
+        cart_store.refresh_prices()
+        deleted_files_count = remove_media_files(media_paths)
+
+        await callback.message.answer(
+            f"✅ Тип '{type_name}' и все связанные товары удалены!\n"
+            f"🗑️ Удалено медиафайлов: {deleted_files_count}"
+        )
+        await callback.message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
+
+    except Exception as e:
+        db.rollback()
+        await callback.message.answer("❌ Ошибка при удалении типа!")
+    finally:
+        db.close()
+    await state.clear()
+    await callback.answer()
+
+
+# Удаление товара
+@admin_callbacks.handler("delete_product")
+@admin_required
+async def start_delete_product(callback: types.CallbackQuery, state: FSMContext):
+    if not await send_picker(callback.message, state, "del_prod_cat", "📁 Выберите категорию:", "admin_panel"):
+        await callback.message.answer("❌ Нет категорий для удаления товаров!")
+        await callback.answer()
+        return
+    await state.set_state(DeleteProduct.choosing_category)
+    await callback.answer()
+
+
+@admin_callbacks.handler(DeleteProductCategory, state=DeleteProduct.choosing_category)
+@admin_required
+async def choose_type_for_product_deletion(callback: types.CallbackQuery, callback_data: DeleteProductCategory,
+                                           state: FSMContext):
+    category_id = callback_data.category_id
+    await state.update_data(category_id=category_id)
+    db = SessionLocal()
+    try:
+        category = db.query(Category).filter(Category.id == category_id).first()
+    finally:
+        db.close()
+    if not category:
+        await callback.answer("❌ Категория не найдена!")
+        return
+
+    if not await send_picker(callback.message, state, "del_prod_type",
+                             f"🏷️ Выберите тип из категории '{category.name}':", "delete_product", category_id):
+        await callback.message.answer(f"❌ В категории '{category.name}' нет типов!")
+        await state.clear()
+        await callback.answer()
+        return
+    await state.set_state(DeleteProduct.choosing_type)
+    await callback.answer()
+
+
+@admin_callbacks.handler(DeleteProductType, state=DeleteProduct.choosing_type)
+@admin_required
+async def choose_product_for_deletion(callback: types.CallbackQuery, callback_data: DeleteProductType,
+                                      state: FSMContext):
+    type_id = callback_data.type_id
+    await state.update_data(type_id=type_id)
+    db = SessionLocal()
+    try:
+        type_obj = db.query(Type).filter(Type.id == type_id).first()
+    finally:
+        db.close()
+    if not type_obj:
+        await callback.answer("❌ Тип не найден!")
+        return
+
+    if not await send_picker(callback.message, state, "del_prod",
+                             f"🚪 Выберите товар для удаления из типа '{type_obj.name}':", "delete_product", type_id):
+        await callback.message.answer(f"❌ В типе '{type_obj.name}' нет товаров!")
+        await state.clear()
+        await callback.answer()
+        return
+    await state.set_state(DeleteProduct.choosing_product)
+    await callback.answer()
+
+
+@admin_callbacks.handler(DeleteProductConfirm)
+@admin_required
+async def process_delete_product(callback: types.CallbackQuery, callback_data: DeleteProductConfirm,
+                                 state: FSMContext):
+    product_id = callback_data.product_id
+    db = SessionLocal()
+    try:
+        product = db.query(Product).filter(Product.id == product_id).first()
+        if not product:
+            await callback.message.answer("❌ Товар не найден!")
+            await callback.answer()
+            return
+
+        product_name = product.name
+        media_paths = delete_products_cascade(db, [product_id])
+        db.commit()
+        invalidate_catalog()
+        invalidate_products([product_id])
+        cart_store.refresh_prices()
+        deleted_files_count = remove_media_files(media_paths)
+
+        await callback.message.answer(
+            f"✅ Товар '{product_name}' и все связанные медиафайлы удалены!\n"
+            f"🗑️ Удалено медиафайлов: {deleted_files_count}"
+        )
+        await callback.message.answer("👨‍💻 Панель администратора", reply_markup=get_admin_keyboard())
+
+    except Exception as e:
+        db.rollback()
+        await callback.message.answer("❌ Ошибка при удалении товара!")
+    finally:
+        db.close()
+    await state.clear()
     await callback.answer()
\ No newline at end of file
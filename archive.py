@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import time
+
+from sqlalchemy import select, insert, delete, literal, union_all
+
+from config import ORDER_ARCHIVE_AFTER_DAYS, ORDER_ARCHIVE_INTERVAL, ORDER_ARCHIVE_BATCH_SIZE
+from db import SessionLocal, Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+ORDERS_ARCHIVED = Counter("bot_orders_archived_total", "Заказы, перенесенные в архив", ("unit",))
+ARCHIVE_BATCH_DURATION = Histogram("bot_order_archive_batch_duration_seconds",
+                                   "Время одной транзакции переноса пачки заказов в архив")
+
+ORDER_COLUMNS = ("id", "user_id", "user_name", "phone_number", "total_amount", "status", "created_at")
+ITEM_COLUMNS = ("id", "order_id", "product_id", "product_name", "product_price", "quantity")
+
+
+def all_orders(*columns: str):
+    """SELECT указанных столбцов заказов из orders и orders_archive (UNION ALL)"""
+    return union_all(
+        select(*(getattr(Order, name) for name in columns)),
+        select(*(getattr(ArchivedOrder, name) for name in columns))
+    ).subquery()
+
+
+def all_order_items(*columns: str):
+    """SELECT указанных столбцов позиций из order_items и order_items_archive (UNION ALL)"""
+    return union_all(
+        select(*(getattr(OrderItem, name) for name in columns)),
+        select(*(getattr(ArchivedOrderItem, name) for name in columns))
+    ).subquery()
+
+
+def archive_orders_batch(cutoff: int, batch_size: int):
+    """Переносит до batch_size выполненных заказов старше cutoff одной транзакцией.
+
+    Возвращает (заказов, позиций). Заказы выбираются по индексу
+    ix_orders_status_created_at.
+    """
+    db = SessionLocal()
+    try:
+        order_ids = db.execute(
+            select(Order.id).where(Order.status == "completed", Order.created_at < cutoff)
+            .order_by(Order.created_at).limit(batch_size)
+        ).scalars().all()
+        if not order_ids:
+            return 0, 0
+
+        no_sync = {"synchronize_session": False}
+        db.execute(insert(ArchivedOrder).from_select(
+            ORDER_COLUMNS + ("archived_at",),
+            select(*(getattr(Order, name) for name in ORDER_COLUMNS), literal(int(time.time())))
+            .where(Order.id.in_(order_ids))
+        ))
+        db.execute(insert(ArchivedOrderItem).from_select(
+            ITEM_COLUMNS,
+            select(*(getattr(OrderItem, name) for name in ITEM_COLUMNS)).where(OrderItem.order_id.in_(order_ids))
+        ))
+        items_count = db.execute(
+            delete(OrderItem).where(OrderItem.order_id.in_(order_ids)), execution_options=no_sync
+        ).rowcount
+        db.execute(delete(Order).where(Order.id.in_(order_ids)), execution_options=no_sync)
+        db.commit()
+        return len(order_ids), items_count
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def archive_completed_orders(after_days: float = ORDER_ARCHIVE_AFTER_DAYS,
+                                   batch_size: int = ORDER_ARCHIVE_BATCH_SIZE) -> int:
+    """Переносит выполненные заказы старше after_days в архив пачками, возвращает число заказов.
+
+    Каждая пачка - отдельная короткая транзакция в фоновом потоке, между
+    пачками event loop обслуживает апдейты.
+    """
+    cutoff = int(time.time() - after_days * 86400)
+    archived = 0
+    while True:
+        started = time.perf_counter()
+        orders_count, items_count = await asyncio.to_thread(archive_orders_batch, cutoff, batch_size)
+        if not orders_count:
+            break
+        ARCHIVE_BATCH_DURATION.observe(time.perf_counter() - started)
+        ORDERS_ARCHIVED.inc(orders_count, unit="orders")
+        ORDERS_ARCHIVED.inc(items_count, unit="items")
+        archived += orders_count
+    if archived:
+        logger.info("Перенесено в архив заказов: %s", archived)
+    return archived
+
+
+async def run_order_archiver(interval: float = ORDER_ARCHIVE_INTERVAL):
+    while True:
+        try:
+            await archive_completed_orders()
+        except Exception as e:
+            logger.error("Ошибка при переносе заказов в архив: %s", e)
+        await asyncio.sleep(interval)
@@ -0,0 +1,78 @@
+"""Микро-бенчмарк стоимости диспетчеризации одного callback-запроса.
+
+Сравнивает роутер aiogram с N обработчиками F.data.startswith(...) и
+CallbackIndex с теми же N обработчиками. Callback адресован последнему
+зарегистрированному обработчику — худший случай для линейной проверки.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_callback_dispatch.py
+"""
+import asyncio
+import datetime
+import os
+import sys
+import time
+
+from aiogram import F, Router
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery, Chat, Message, User
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from callbacks import CallbackIndex  # noqa: E402
+
+HANDLER_COUNTS = [10, 50, 200, 1000]
+# Суммарно ~20k проверок фильтров на каждый размер роутера
+FILTER_CHECKS = 20_000
+
+
+async def noop(callback: CallbackQuery, **kwargs):
+    return True
+
+
+def make_callback(data: str) -> CallbackQuery:
+    return CallbackQuery(
+        id="1",
+        from_user=User(id=1, is_bot=False, first_name="Bench"),
+        chat_instance="bench",
+        data=data,
+        message=Message(message_id=1, date=datetime.datetime.now(), chat=Chat(id=1, type="private"))
+    )
+
+
+def build_linear_router(count: int) -> Router:
+    router = Router()
+    for i in range(count):
+        router.callback_query.register(noop, F.data.startswith(f"action{i}_"))
+    return router
+
+
+def build_indexed_router(count: int) -> Router:
+    router = Router()
+    index = CallbackIndex(router)
+    for i in range(count):
+        payload = type(f"Action{i}", (CallbackData,), {"__annotations__": {"item_id": int}}, prefix=f"action{i}")
+        index.handler(payload)(noop)
+    return router
+
+
+async def measure(router: Router, callback: CallbackQuery, iterations: int) -> float:
+    await router.callback_query.trigger(callback)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await router.callback_query.trigger(callback)
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+async def main():
+    print(f"{'обработчиков':>14} {'startswith, мкс':>17} {'индекс, мкс':>13}")
+    for count in HANDLER_COUNTS:
+        iterations = max(20, FILTER_CHECKS // count)
+        linear = await measure(build_linear_router(count), make_callback(f"action{count - 1}_42"), iterations)
+        indexed = await measure(build_indexed_router(count), make_callback(f"action{count - 1}:42"), iterations)
+        print(f"{count:>14} {linear:>17.1f} {indexed:>13.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+"""Бенчмарк операций с корзиной: таблица carts напрямую против cart_store.
+
+Сценарий на пользователя: 3 добавления, просмотр, удаление позиции,
+проверка перед оформлением. "carts" - как обработчики работали раньше:
+запрос и commit на каждую операцию. "cart_store" - корзина в памяти,
+фоновый flush раз в CART_FLUSH_INTERVAL и финальный flush в конце.
+Запуск из корня репозитория:
+    python benchmarks/bench_cart.py [пользователей]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.pool import NullPool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+from db import Base, Category, Type, Product, Cart, SessionLocal  # noqa: E402
+from cart_store import CartStore  # noqa: E402
+
+PRODUCTS_COUNT = 500
+OPERATIONS_PER_USER = 6
+
+
+def seed_catalog(session):
+    session.execute(insert(Category), [{"id": 1, "name": "Бенчмарк"}])
+    session.execute(insert(Type), [{"id": 1, "name": "Тип", "category_id": 1}])
+    session.execute(insert(Product), [
+        {"id": i, "name": f"Дверь {i}", "description": "", "price": 1000 + i, "type_id": 1}
+        for i in range(1, PRODUCTS_COUNT + 1)
+    ])
+    session.commit()
+
+
+def user_products(user_id: int):
+    return [(user_id + line) % PRODUCTS_COUNT + 1 for line in range(3)]
+
+
+def run_carts_table(users: int):
+    for user_id in range(1, users + 1):
+        for product_id in user_products(user_id):
+            session = SessionLocal()
+            try:
+                cart_item = session.query(Cart).filter(Cart.user_id == user_id, Cart.product_id == product_id).first()
+                if cart_item:
+                    cart_item.quantity += 1
+                else:
+                    session.add(Cart(user_id=user_id, product_id=product_id, quantity=1))
+                session.commit()
+            finally:
+                session.close()
+
+        session = SessionLocal()
+        try:
+            items = session.query(Cart, Product).join(Product, Product.id == Cart.product_id) \
+                .filter(Cart.user_id == user_id).order_by(Cart.id).all()
+            sum(product.price * item.quantity for item, product in items)
+            session.query(Cart).filter(Cart.id == items[0][0].id).delete(synchronize_session=False)
+            session.commit()
+            session.query(Cart.id).filter(Cart.user_id == user_id).first()
+        finally:
+            session.close()
+
+
+async def run_cart_store(users: int):
+    store = CartStore()
+    flusher = asyncio.create_task(store.run_flusher())
+    for user_id in range(1, users + 1):
+        for product_id in user_products(user_id):
+            store.add(user_id, product_id, 1, 1000 + product_id)
+        items = store.items(user_id)
+        store.remove(user_id, items[0][0])
+        store.is_empty(user_id)
+        # Обработчики отдают управление event loop между апдейтами
+        await asyncio.sleep(0)
+    flusher.cancel()
+    await store.flush()
+
+
+def measure(name: str, users: int, run):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", poolclass=NullPool)
+        db.set_engine(engine)
+        Base.metadata.create_all(bind=engine)
+        session = SessionLocal()
+        seed_catalog(session)
+        session.close()
+
+        started = time.perf_counter()
+        run(users)
+        elapsed = time.perf_counter() - started
+
+        session = SessionLocal()
+        rows = session.query(Cart).count()
+        session.close()
+        engine.dispose()
+    operations = users * OPERATIONS_PER_USER
+    print(f"{name:<12} {operations / elapsed:>10.0f} операций/с ({elapsed:.2f} с), строк в carts: {rows}")
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    measure("carts", users, run_carts_table)
+    measure("cart_store", users, lambda count: asyncio.run(run_cart_store(count)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Бенчмарк каскадного удаления категории с 10k товаров.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_delete_category.py [количество_товаров]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db import Base, Category, Type, Product, ProductMedia, Cart, delete_category_cascade  # noqa: E402
+
+TYPES_COUNT = 20
+
+
+def seed(db, products_count):
+    db.execute(insert(Category), [{"id": 1, "name": "Бенчмарк"}])
+    db.execute(insert(Type), [
+        {"id": type_id, "name": f"Тип {type_id}", "category_id": 1}
+        for type_id in range(1, TYPES_COUNT + 1)
+    ])
+    db.execute(insert(Product), [
+        {"id": i, "name": f"Дверь {i}", "description": "", "price": 1000 + i, "type_id": i % TYPES_COUNT + 1}
+        for i in range(1, products_count + 1)
+    ])
+    db.execute(insert(ProductMedia), [
+        {"product_id": i, "file_id": f"file_{i}", "file_path": f"doors/missing_{i}.jpg", "media_type": "photo"}
+        for i in range(1, products_count + 1)
+    ])
+    db.execute(insert(Cart), [
+        {"user_id": i, "product_id": i, "quantity": 1}
+        for i in range(1, products_count + 1, 10)
+    ])
+    db.commit()
+
+
+def main():
+    products_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        try:
+            seed(db, products_count)
+
+            started = time.perf_counter()
+            media_paths = delete_category_cascade(db, 1)
+            db.commit()
+            elapsed = time.perf_counter() - started
+
+            left = db.query(Product).count() + db.query(ProductMedia).count() + db.query(Type).count()
+            print(f"Товаров: {products_count}, медиа путей: {len(media_paths)}, осталось строк: {left}")
+            print(f"Удаление категории: {elapsed * 1000:.1f} мс")
+        finally:
+            db.close()
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
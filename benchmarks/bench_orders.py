@@ -0,0 +1,77 @@
+"""Бенчмарк пропускной способности оформления заказов на SQLite.
+
+Каждый заказ: корзина из нескольких позиций -> place_order -> commit.
+Запуск из корня репозитория:
+    python benchmarks/bench_orders.py [количество_заказов] [позиций_в_корзине]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db import Base, Category, Type, Product, Cart, Order, OrderItem, place_order  # noqa: E402
+
+PRODUCTS_COUNT = 500
+
+
+def seed_catalog(db):
+    db.execute(insert(Category), [{"id": 1, "name": "Бенчмарк"}])
+    db.execute(insert(Type), [{"id": 1, "name": "Тип", "category_id": 1}])
+    db.execute(insert(Product), [
+        {"id": i, "name": f"Дверь {i}", "description": "", "price": 1000 + i, "type_id": 1}
+        for i in range(1, PRODUCTS_COUNT + 1)
+    ])
+    db.commit()
+
+
+def main():
+    orders_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    lines_per_cart = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine)
+
+        db = Session()
+        seed_catalog(db)
+        db.execute(insert(Cart), [
+            {"user_id": user_id, "product_id": (user_id + line) % PRODUCTS_COUNT + 1, "quantity": line + 1}
+            for user_id in range(1, orders_count + 1)
+            for line in range(lines_per_cart)
+        ])
+        db.commit()
+        db.close()
+
+        started = time.perf_counter()
+        duplicates = 0
+        for user_id in range(1, orders_count + 1):
+            db = Session()
+            try:
+                order, _ = place_order(db, user_id, f"User {user_id}", "+70000000000")
+                db.commit()
+                # Повторная отправка телефона не должна создать второй заказ
+                duplicate, _ = place_order(db, user_id, f"User {user_id}", "+70000000000")
+                if duplicate:
+                    duplicates += 1
+                db.rollback()
+            finally:
+                db.close()
+        elapsed = time.perf_counter() - started
+
+        db = Session()
+        print(f"Заказов: {db.query(Order).count()}, позиций: {db.query(OrderItem).count()}, "
+              f"осталось в корзинах: {db.query(Cart).count()}, дублей: {duplicates}")
+        print(f"Пропускная способность: {orders_count / elapsed:.0f} заказов/с ({elapsed:.2f} с)")
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Бенчмарк холодного старта: время от запуска процесса до первого обработанного апдейта.
+
+Каждый замер - отдельный процесс Python: импорт main, create_tables,
+прогрев кешей и обработка callback "catalog" через фейковый Bot API.
+Выводится длительность каждого этапа и общее время.
+Первый запуск на базе идет с миграциями, следующие - с совпавшим
+отпечатком схемы.
+Запуск из корня репозитория:
+    python benchmarks/bench_startup.py [количество_запусков] [товаров_в_каталоге]
+"""
+import time
+
+STARTED = time.perf_counter()
+
+import asyncio  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+import tempfile  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.pool import NullPool  # noqa: E402
+
+TYPES_COUNT = 50
+
+
+def seed_database(path: str, products_count: int):
+    from db import Base, Category, Type, Product, ProductMedia
+
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Category), [{"id": i, "name": f"Категория {i}"} for i in range(1, 11)])
+        conn.execute(insert(Type), [
+            {"id": i, "name": f"Тип {i}", "category_id": i % 10 + 1} for i in range(1, TYPES_COUNT + 1)
+        ])
+        conn.execute(insert(Product), [
+            {"id": i, "name": f"Дверь {i}", "description": "", "price": 1000 + i, "type_id": i % TYPES_COUNT + 1}
+            for i in range(1, products_count + 1)
+        ])
+        conn.execute(insert(ProductMedia), [
+            {"product_id": i, "file_id": f"photo-{i}", "file_path": "", "media_type": "photo"}
+            for i in range(1, products_count + 1)
+        ])
+    engine.dispose()
+
+
+async def first_update(db_path: str) -> dict:
+    timings = {}
+    last = [STARTED]
+
+    def mark(name):
+        now = time.perf_counter()
+        timings[name] = round((now - last[0]) * 1000, 1)
+        last[0] = now
+
+    import main
+    from db import set_engine
+    from aiogram.types import Update, CallbackQuery, Message, Chat, User
+    from datetime import datetime
+    from fake_bot_api import FakeBotAPI
+    from harness import use_fake_api
+    mark("import_ms")
+
+    set_engine(create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False}, poolclass=NullPool))
+    main.create_tables()
+    mark("create_tables_ms")
+    await main.warm_up()
+    mark("warm_up_ms")
+
+    api = FakeBotAPI()
+    use_fake_api(main.bot, await api.start())
+    user = User(id=1, is_bot=False, first_name="U")
+    chat = Chat(id=1, type="private")
+    update = Update(update_id=1, callback_query=CallbackQuery(
+        id="1", from_user=user, chat_instance="1", data="catalog",
+        message=Message(message_id=1, date=datetime.now(), chat=chat)
+    ))
+    await main.dp.feed_update(main.bot, update)
+    mark("first_update_ms")
+    timings["total_ms"] = round((time.perf_counter() - STARTED) * 1000, 1)
+
+    await main.bot.session.close()
+    await api.stop()
+    return timings
+
+
+def run_child(db_path: str):
+    import logging
+    logging.getLogger().setLevel(logging.WARNING)
+    print(json.dumps(asyncio.run(first_update(db_path))))
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    products_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        seed_database(db_path, products_count)
+
+        print(f"Товаров: {products_count}")
+        for run in range(runs):
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", db_path],
+                cwd=tmp, capture_output=True, text=True, check=True
+            )
+            timings = json.loads(result.stdout.strip().splitlines()[-1])
+            kind = "с миграциями" if run == 0 else "отпечаток совпал"
+            print(f"запуск {run + 1} ({kind}): " + ", ".join(f"{k}={v}" for k, v in timings.items()))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        run_child(sys.argv[2])
+    else:
+        main()
@@ -0,0 +1,310 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict, OrderedDict
+from typing import Dict, Optional
+
+from aiogram import types
+
+from config import PRODUCT_CACHE_MAX_BYTES
+from db import SessionLocal, Category, Type, Product, ProductMedia, MainMenuSection, CachedFile
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogSnapshot:
+    """Категории, типы и товары (id и названия) для навигации по каталогу"""
+
+    def __init__(self, categories, types, products):
+        self.categories = categories
+        self.categories_by_id = {category.id: category for category in categories}
+        self.types_by_id = {type_row.id: type_row for type_row in types}
+        self.types_by_category = defaultdict(list)
+        for type_row in types:
+            self.types_by_category[type_row.category_id].append(type_row)
+        self.products_by_type = defaultdict(list)
+        for product in products:
+            self.products_by_type[product.type_id].append(product)
+
+
+class SectionSnapshot:
+    def __init__(self, section: MainMenuSection):
+        self.section_key = section.section_key
+        self.title = section.title
+        self.content = section.content
+        self.photo_path = section.photo_path
+        self.file_id = section.file_id
+
+
+class ProductPayload:
+    """Готовая к отправке карточка товара: подпись и медиагруппа"""
+
+    # Примерные накладные расходы Python на объект карточки и на один элемент медиагруппы, байты
+    BASE_SIZE = 600
+    MEDIA_SIZE = 400
+
+    def __init__(self, product: Product, media_files):
+        self.product_id = product.id
+        self.name = product.name
+        self.price = product.price
+        self.type_id = product.type_id
+        self.caption = f"🚪 {product.name}\n\n💰 Цена: {product.price} руб.\n\n📝 {product.description}"
+        media_group = []
+        for i, media_file in enumerate(media_files):
+            media_class = types.InputMediaPhoto if media_file.media_type == 'photo' else types.InputMediaVideo
+            # Подпись к медиагруппе ставится только на первый файл
+            media_group.append(media_class(media=media_file.file_id, caption=self.caption if i == 0 else None))
+        self.media_group = media_group
+        self.size = self.BASE_SIZE + len(self.caption.encode()) + \
+            sum(self.MEDIA_SIZE + len(media_file.file_id or "") for media_file in media_files)
+        # Загружена ли карточка заранее и сколько стоила загрузка - для метрик предзагрузки
+        self.prefetched = False
+        self.load_seconds = 0.0
+
+
+class ProductPayloadCache:
+    """LRU карточек товаров, ограниченный суммарным размером в байтах.
+
+    Не потокобезопасен: все обращения только из потока event loop. Фоновые
+    потоки лишь читают карточку из БД (read_product_payload), а проверка
+    поколения и put выполняются уже в event loop (load_product_payload).
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._payloads: "OrderedDict[int, ProductPayload]" = OrderedDict()
+
+    def __contains__(self, product_id: int) -> bool:
+        return product_id in self._payloads
+
+    def get(self, product_id: int) -> Optional[ProductPayload]:
+        payload = self._payloads.get(product_id)
+        if payload is not None:
+            self._payloads.move_to_end(product_id)
+        return payload
+
+    def put(self, payload: ProductPayload):
+        self.discard(payload.product_id)
+        if payload.size > self.max_bytes:
+            return
+        self._payloads[payload.product_id] = payload
+        self.size += payload.size
+        while self.size > self.max_bytes:
+            _, evicted = self._payloads.popitem(last=False)
+            self.size -= evicted.size
+            PRODUCT_CACHE_EVICTIONS.inc()
+        PRODUCT_CACHE_BYTES.set(self.size)
+
+    def discard(self, product_id: int):
+        payload = self._payloads.pop(product_id, None)
+        if payload is not None:
+            self.size -= payload.size
+            PRODUCT_CACHE_BYTES.set(self.size)
+
+    def clear(self):
+        self._payloads.clear()
+        self.size = 0
+        PRODUCT_CACHE_BYTES.set(0)
+
+
+PRODUCT_CACHE_REQUESTS = Counter("bot_product_cache_requests_total",
+                                 "Обращения к кешу карточек товаров", ("result",))
+PRODUCT_CACHE_EVICTIONS = Counter("bot_product_cache_evictions_total",
+                                  "Карточки товаров, вытесненные из кеша по размеру")
+PRODUCT_CACHE_BYTES = Gauge("bot_product_cache_bytes", "Примерный размер кеша карточек товаров")
+PREFETCH_LOADS = Counter("bot_prefetch_loads_total", "Карточки товаров, загруженные предзагрузкой", ("result",))
+PREFETCH_SAVED_SECONDS = Counter("bot_prefetch_saved_seconds_total",
+                                 "Время загрузки карточек, которое предзагрузка сняла с обработчиков")
+
+# Каждое invalidate увеличивает поколение: загрузка, начатая до сброса, не
+# перезапишет кеш устаревшими данными
+_generation = {"catalog": 0, "sections": 0, "products": 0}
+_catalog: Optional[CatalogSnapshot] = None
+_sections: Optional[Dict[str, SectionSnapshot]] = None
+_file_ids: Dict[str, tuple] = {}
+_products = ProductPayloadCache(PRODUCT_CACHE_MAX_BYTES)
+
+
+def load_catalog() -> CatalogSnapshot:
+    generation = _generation["catalog"]
+    db = SessionLocal()
+    try:
+        snapshot = CatalogSnapshot(
+            db.query(Category.id, Category.name).order_by(Category.name).all(),
+            db.query(Type.id, Type.name, Type.category_id).order_by(Type.name).all(),
+            db.query(Product.id, Product.name, Product.type_id).order_by(Product.name).all()
+        )
+    finally:
+        db.close()
+
+    global _catalog
+    if generation == _generation["catalog"]:
+        _catalog = snapshot
+    return snapshot
+
+
+def get_catalog() -> CatalogSnapshot:
+    return _catalog or load_catalog()
+
+
+def invalidate_catalog():
+    global _catalog
+    _generation["catalog"] += 1
+    _catalog = None
+
+
+def load_sections() -> Dict[str, SectionSnapshot]:
+    generation = _generation["sections"]
+    db = SessionLocal()
+    try:
+        sections = {section.section_key: SectionSnapshot(section) for section in db.query(MainMenuSection).all()}
+    finally:
+        db.close()
+
+    global _sections
+    if generation == _generation["sections"]:
+        _sections = sections
+    return sections
+
+
+def get_section(section_key: str) -> Optional[SectionSnapshot]:
+    return (_sections or load_sections()).get(section_key)
+
+
+def invalidate_sections():
+    global _sections
+    _generation["sections"] += 1
+    _sections = None
+
+
+def read_product_payload(product_id: int, prefetched: bool = False) -> Optional[ProductPayload]:
+    """Читает карточку из БД, кеш не трогает - можно вызывать из фонового потока"""
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        product = db.query(Product).filter(Product.id == product_id).first()
+        if not product:
+            return None
+        media_files = db.query(ProductMedia).filter(ProductMedia.product_id == product_id) \
+            .order_by(ProductMedia.id).all()
+        payload = ProductPayload(product, media_files)
+    finally:
+        db.close()
+    payload.prefetched = prefetched
+    payload.load_seconds = time.perf_counter() - started
+    return payload
+
+
+def store_product_payload(payload: Optional[ProductPayload], generation: int):
+    """Кладет карточку в кеш, если с начала ее загрузки товары не сбрасывались. Только из event loop."""
+    if payload is not None and generation == _generation["products"]:
+        _products.put(payload)
+
+
+def load_product_payload(product_id: int, prefetched: bool = False) -> Optional[ProductPayload]:
+    """Загружает карточку и кладет ее в кеш. Только из потока event loop."""
+    generation = _generation["products"]
+    payload = read_product_payload(product_id, prefetched)
+    store_product_payload(payload, generation)
+    return payload
+
+
+def get_product_payload(product_id: int) -> Optional[ProductPayload]:
+    payload = _products.get(product_id)
+    if payload is None:
+        PRODUCT_CACHE_REQUESTS.inc(result="miss")
+        return load_product_payload(product_id)
+    if payload.prefetched:
+        # Первое обращение к заранее загруженной карточке: обработчик не ждал БД
+        payload.prefetched = False
+        PRODUCT_CACHE_REQUESTS.inc(result="prefetch_hit")
+        PREFETCH_SAVED_SECONDS.inc(payload.load_seconds)
+    else:
+        PRODUCT_CACHE_REQUESTS.inc(result="hit")
+    return payload
+
+
+async def prefetch_products(product_ids):
+    """Загружает в кеш карточки товаров, которых там еще нет.
+
+    Карточки грузятся по одной в фоновом потоке, чтобы предзагрузка не
+    занимала пул потоков и БД в ущерб обработчикам апдейтов.
+    """
+    for product_id in product_ids:
+        if product_id in _products:
+            continue
+        generation = _generation["products"]
+        try:
+            payload = await asyncio.to_thread(read_product_payload, product_id, True)
+        except asyncio.CancelledError:
+            PREFETCH_LOADS.inc(result="cancelled")
+            raise
+        except Exception as e:
+            logger.warning("Не удалось предзагрузить товар %s: %s", product_id, e)
+            continue
+        # Проверка поколения и put - уже в event loop: invalidate_products мог
+        # сбросить кеш, пока карточка читалась в потоке
+        store_product_payload(payload, generation)
+        PREFETCH_LOADS.inc(result="loaded" if payload else "missing")
+
+
+def invalidate_products(product_ids=None):
+    """Сбрасывает карточки указанных товаров или всех товаров, если product_ids не задан"""
+    _generation["products"] += 1
+    if product_ids is None:
+        _products.clear()
+    else:
+        for product_id in product_ids:
+            _products.discard(product_id)
+
+
+def file_mtime(path: str) -> Optional[int]:
+    try:
+        return int(os.path.getmtime(path))
+    except OSError:
+        return None
+
+
+def load_file_ids():
+    db = SessionLocal()
+    try:
+        for cached in db.query(CachedFile).all():
+            _file_ids[cached.path] = (cached.mtime, cached.file_id)
+    finally:
+        db.close()
+
+
+def get_file_id(path: str) -> Optional[str]:
+    """file_id ранее загруженного файла, если файл с тех пор не менялся"""
+    cached = _file_ids.get(path)
+    if cached and cached[0] == file_mtime(path):
+        return cached[1]
+    return None
+
+
+def remember_file_id(path: str, file_id: str):
+    mtime = file_mtime(path)
+    if mtime is None:
+        return
+    _file_ids[path] = (mtime, file_id)
+    db = SessionLocal()
+    try:
+        db.merge(CachedFile(path=path, mtime=mtime, file_id=file_id))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error("Не удалось сохранить file_id для %s: %s", path, e)
+    finally:
+        db.close()
+
+
+async def warm_up():
+    """Параллельно загружает каталог, разделы меню и file_id до запуска polling"""
+    await asyncio.gather(
+        asyncio.to_thread(load_catalog),
+        asyncio.to_thread(load_sections),
+        asyncio.to_thread(load_file_ids),
+    )
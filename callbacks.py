@@ -0,0 +1,74 @@
+import inspect
+from typing import Dict, List, Optional, Type
+
+from aiogram import Router
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.filters.callback_data import CallbackData
+from aiogram.fsm.state import State
+from aiogram.types import CallbackQuery
+
+# Разделитель, которым CallbackData.pack() отделяет префикс от полей
+CALLBACK_SEP = ":"
+
+
+class CallbackHandler:
+    def __init__(self, handler, callback_data_cls: Optional[Type[CallbackData]], state: Optional[State]):
+        self.handler = handler
+        self.callback_data_cls = callback_data_cls
+        self.state = state.state if state is not None else None
+
+        signature = inspect.signature(handler)
+        self.accepts_any = any(p.kind == p.VAR_KEYWORD for p in signature.parameters.values())
+        self.params = set(signature.parameters)
+
+    def kwargs(self, data: dict) -> dict:
+        if self.accepts_any:
+            return data
+        return {key: value for key, value in data.items() if key in self.params}
+
+
+class CallbackIndex:
+    """Диспетчер callback-запросов по префиксу callback_data.
+
+    Вместо десятков фильтров F.data.startswith(...), которые aiogram проверяет
+    по очереди, в роутере регистрируется один обработчик. Он находит
+    кандидатов по префиксу в словаре и один раз распаковывает данные в
+    CallbackData. Простые строки ("catalog", "view_cart") индексируются целиком.
+    """
+
+    def __init__(self, router: Router):
+        self._handlers: Dict[str, List[CallbackHandler]] = {}
+        router.callback_query.register(self.dispatch)
+
+    def handler(self, *keys, state: Optional[State] = None):
+        """Регистрирует обработчик для строк callback_data и/или классов CallbackData"""
+        def decorator(handler):
+            for key in keys:
+                if isinstance(key, str):
+                    prefix, callback_data_cls = key, None
+                else:
+                    prefix, callback_data_cls = key.__prefix__, key
+                self._handlers.setdefault(prefix, []).append(CallbackHandler(handler, callback_data_cls, state))
+            return handler
+        return decorator
+
+    def resolve(self, data: Optional[str], raw_state: Optional[str] = None) -> Optional[CallbackHandler]:
+        if not data:
+            return None
+        prefix = data.split(CALLBACK_SEP, 1)[0]
+        for entry in self._handlers.get(prefix, ()):
+            if entry.state is None or entry.state == raw_state:
+                return entry
+        return None
+
+    async def dispatch(self, callback: CallbackQuery, **data):
+        entry = self.resolve(callback.data, data.get("raw_state"))
+        if entry is None:
+            return UNHANDLED
+
+        if entry.callback_data_cls is not None:
+            try:
+                data["callback_data"] = entry.callback_data_cls.unpack(callback.data)
+            except (TypeError, ValueError):
+                return UNHANDLED
+        return await entry.handler(callback, **entry.kwargs(data))
@@ -0,0 +1,368 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, insert, select, exists
+from sqlalchemy.orm import aliased
+
+from config import CART_FLUSH_INTERVAL, CART_TTL_DAYS, CART_SWEEP_INTERVAL, CART_SWEEP_BATCH_SIZE
+from db import SessionLocal, Cart, CartSummary, Product
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+CART_FLUSHES = Counter("bot_cart_flushes_total", "Сбросы корзин в БД", ("result",))
+CART_FLUSH_USERS = Counter("bot_cart_flush_users_total", "Корзины пользователей, записанные в БД")
+CART_FLUSH_DURATION = Histogram("bot_cart_flush_duration_seconds", "Время записи пачки корзин в БД")
+CART_SWEEPS = Counter("bot_cart_sweeps_total", "Проходы очистки брошенных корзин", ("result",))
+CART_SWEPT = Counter("bot_cart_swept_total", "Удаленные брошенные корзины", ("unit",))
+CART_SWEEP_DURATION = Histogram("bot_cart_sweep_duration_seconds", "Длительность прохода очистки корзин")
+CART_SWEEP_BATCH_DURATION = Histogram("bot_cart_sweep_batch_duration_seconds",
+                                      "Время одной транзакции удаления пачки корзин")
+
+
+class CartLine:
+    __slots__ = ("quantity", "price")
+
+    def __init__(self, quantity: int, price: int):
+        self.quantity = quantity
+        self.price = price
+
+
+class CartSummaryState:
+    """Итог корзины: сумма, число позиций, версия, которая растет с каждым изменением,
+    и время последнего действия пользователя с корзиной"""
+    __slots__ = ("total_amount", "line_count", "version", "updated_at")
+
+    def __init__(self, total_amount: int = 0, line_count: int = 0, version: int = 0, updated_at: int = 0):
+        self.total_amount = total_amount
+        self.line_count = line_count
+        self.version = version
+        self.updated_at = updated_at
+
+
+class CartStore:
+    """Корзины пользователей в памяти с отложенной записью в таблицы carts и cart_summaries.
+
+    Чтения обслуживаются из памяти, изменения помечают корзину
+    "грязной", а flush раз в CART_FLUSH_INTERVAL секунд переписывает
+    строки carts и итоги всех грязных корзин одной транзакцией. Корзина
+    пользователя загружается из БД при первом обращении, поэтому
+    переживает рестарт бота. Итог корзины поддерживается при каждом
+    изменении, сумма и число позиций не пересчитываются по строкам.
+    """
+
+    def __init__(self):
+        # user_id -> {product_id: CartLine}; порядок ключей - порядок добавления
+        self._carts: Dict[int, Dict[int, CartLine]] = {}
+        self._summaries: Dict[int, CartSummaryState] = {}
+        # product_id -> пользователи, у которых товар в корзине (для пересчета при смене цен)
+        self._product_users: Dict[int, Set[int]] = defaultdict(set)
+        self._dirty: Set[int] = set()
+        # Сбросы идут по очереди, чтобы старый снимок не записался поверх нового
+        self._flush_lock = asyncio.Lock()
+
+    def _cart(self, user_id: int) -> Dict[int, CartLine]:
+        cart = self._carts.get(user_id)
+        if cart is None:
+            cart = self._load(user_id)
+        return cart
+
+    def _load(self, user_id: int) -> Dict[int, CartLine]:
+        db = SessionLocal()
+        try:
+            # Строки корзины с ценами и версией итога одним запросом; строки удаленных товаров не попадают
+            rows = db.execute(
+                select(Cart.product_id, Cart.quantity, Cart.updated_at, Product.price, CartSummary.version)
+                .join(Product, Product.id == Cart.product_id)
+                .outerjoin(CartSummary, CartSummary.user_id == Cart.user_id)
+                .where(Cart.user_id == user_id)
+                .order_by(Cart.id)
+            ).all()
+        finally:
+            db.close()
+
+        cart = {}
+        summary = CartSummaryState(version=(rows[0].version or 0) if rows else 0,
+                                   updated_at=max(row.updated_at for row in rows) if rows else 0)
+        for product_id, quantity, _, price, _ in rows:
+            if product_id in cart:
+                cart[product_id].quantity += quantity
+            else:
+                cart[product_id] = CartLine(quantity, price)
+                self._product_users[product_id].add(user_id)
+                summary.line_count += 1
+            summary.total_amount += quantity * price
+        self._carts[user_id] = cart
+        self._summaries[user_id] = summary
+        return cart
+
+    def _changed(self, user_id: int, touched: bool = True):
+        summary = self._summaries[user_id]
+        summary.version += 1
+        if touched:
+            summary.updated_at = int(time.time())
+        self._dirty.add(user_id)
+
+    def items(self, user_id: int) -> List[Tuple[int, int, int]]:
+        """[(product_id, quantity, price)] в порядке добавления"""
+        return [(product_id, line.quantity, line.price) for product_id, line in self._cart(user_id).items()]
+
+    def summary(self, user_id: int) -> CartSummaryState:
+        self._cart(user_id)
+        return self._summaries[user_id]
+
+    def is_empty(self, user_id: int) -> bool:
+        return not self._cart(user_id)
+
+    def add(self, user_id: int, product_id: int, quantity: int, price: int):
+        cart = self._cart(user_id)
+        summary = self._summaries[user_id]
+        line = cart.get(product_id)
+        if line is None:
+            cart[product_id] = CartLine(quantity, price)
+            self._product_users[product_id].add(user_id)
+            summary.line_count += 1
+        else:
+            if line.price != price:
+                summary.total_amount += line.quantity * (price - line.price)
+                line.price = price
+            line.quantity += quantity
+        summary.total_amount += quantity * price
+        self._changed(user_id)
+
+    def remove(self, user_id: int, product_id: int) -> bool:
+        line = self._cart(user_id).pop(product_id, None)
+        if line is None:
+            return False
+        self._forget_product_user(product_id, user_id)
+        summary = self._summaries[user_id]
+        summary.total_amount -= line.quantity * line.price
+        summary.line_count -= 1
+        self._changed(user_id)
+        return True
+
+    def clear(self, user_id: int):
+        for product_id in self._cart(user_id):
+            self._forget_product_user(product_id, user_id)
+        self._carts[user_id] = {}
+        summary = self._summaries[user_id]
+        summary.total_amount = summary.line_count = 0
+        self._changed(user_id)
+
+    def take(self, user_id: int) -> List[Tuple[int, int, int]]:
+        """Забирает содержимое корзины и очищает ее (без await - повторный вызов получит пустую корзину)"""
+        items = self.items(user_id)
+        if items:
+            self.clear(user_id)
+        return items
+
+    def restore(self, user_id: int, items: List[Tuple[int, int, int]]):
+        """Возвращает позиции, взятые take, если заказ не удалось сохранить"""
+        for product_id, quantity, price in items:
+            self.add(user_id, product_id, quantity, price)
+
+    def discard_products(self, user_id: int, product_ids):
+        """Убирает из корзины товары, которых больше нет в каталоге"""
+        for product_id in product_ids:
+            self.remove(user_id, product_id)
+
+    def _forget_product_user(self, product_id: int, user_id: int):
+        users = self._product_users.get(product_id)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del self._product_users[product_id]
+
+    def reprice(self, prices: Dict[int, int]):
+        """Применяет новые цены товаров к итогам загруженных корзин"""
+        for product_id, price in prices.items():
+            for user_id in self._product_users.get(product_id, ()):
+                line = self._carts[user_id][product_id]
+                if line.price != price:
+                    self._summaries[user_id].total_amount += line.quantity * (price - line.price)
+                    line.price = price
+                    # Смена цены - не действие пользователя, срок жизни корзины не продлевается
+                    self._changed(user_id, touched=False)
+
+    def refresh_prices(self):
+        """Перечитывает цены товаров загруженных корзин (после смены цен, импорта и удаления товаров)"""
+        product_ids = list(self._product_users)
+        if not product_ids:
+            return
+        db = SessionLocal()
+        try:
+            prices = dict(db.execute(select(Product.id, Product.price).where(Product.id.in_(product_ids))).all())
+        finally:
+            db.close()
+        self.reprice(prices)
+        for product_id in product_ids:
+            if product_id not in prices:
+                for user_id in list(self._product_users.get(product_id, ())):
+                    self.remove(user_id, product_id)
+
+    def pending(self) -> Dict[int, tuple]:
+        """Снимок грязных корзин: строки и итог; после снимка корзины считаются чистыми"""
+        snapshot = {}
+        for user_id in self._dirty:
+            summary = self._summaries[user_id]
+            snapshot[user_id] = (
+                [(product_id, line.quantity) for product_id, line in self._carts[user_id].items()],
+                (summary.total_amount, summary.line_count, summary.version, summary.updated_at)
+            )
+        self._dirty.clear()
+        return snapshot
+
+    def write(self, snapshot: Dict[int, tuple]):
+        """Переписывает строки carts и cart_summaries для корзин из снимка одной транзакцией"""
+        no_sync = {"synchronize_session": False}
+        db = SessionLocal()
+        try:
+            db.execute(delete(Cart).where(Cart.user_id.in_(snapshot)), execution_options=no_sync)
+            db.execute(delete(CartSummary).where(CartSummary.user_id.in_(snapshot)), execution_options=no_sync)
+            rows = [
+                {"user_id": user_id, "product_id": product_id, "quantity": quantity, "updated_at": summary[3]}
+                for user_id, (items, summary) in snapshot.items()
+                for product_id, quantity in items
+            ]
+            # Пустая корзина не оставляет строк ни в carts, ни в cart_summaries
+            summaries = [
+                {"user_id": user_id, "total_amount": total_amount, "line_count": line_count, "version": version}
+                for user_id, (_, (total_amount, line_count, version, _)) in snapshot.items()
+                if line_count
+            ]
+            if rows:
+                db.execute(insert(Cart), rows)
+            if summaries:
+                db.execute(insert(CartSummary), summaries)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def flush(self):
+        async with self._flush_lock:
+            snapshot = self.pending()
+            if not snapshot:
+                return
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.write, snapshot)
+            except Exception as e:
+                # Корзины снова станут грязными и запишутся следующим flush
+                self._dirty.update(snapshot)
+                CART_FLUSHES.inc(result="error")
+                logger.error("Не удалось сохранить корзины (%s шт.): %s", len(snapshot), e)
+                return
+        CART_FLUSHES.inc(result="ok")
+        CART_FLUSH_USERS.inc(len(snapshot))
+        CART_FLUSH_DURATION.observe(time.perf_counter() - started)
+
+    async def run_flusher(self, interval: float = CART_FLUSH_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    def find_abandoned(self, cutoff: int, limit: int) -> List[int]:
+        """Пользователи, все строки корзины которых не менялись с cutoff"""
+        newer = aliased(Cart)
+        db = SessionLocal()
+        try:
+            return db.execute(
+                select(Cart.user_id).distinct()
+                .where(Cart.updated_at < cutoff)
+                .where(~exists().where(newer.user_id == Cart.user_id, newer.updated_at >= cutoff))
+                .limit(limit)
+            ).scalars().all()
+        finally:
+            db.close()
+
+    def delete_carts(self, user_ids: List[int]) -> int:
+        """Удаляет корзины пользователей короткой транзакцией, возвращает число строк carts"""
+        no_sync = {"synchronize_session": False}
+        db = SessionLocal()
+        try:
+            lines = db.execute(delete(Cart).where(Cart.user_id.in_(user_ids)), execution_options=no_sync).rowcount
+            db.execute(delete(CartSummary).where(CartSummary.user_id.in_(user_ids)), execution_options=no_sync)
+            db.commit()
+            return lines
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _is_active(self, user_id: int, cutoff: int) -> bool:
+        summary = self._summaries.get(user_id)
+        return user_id in self._dirty or (summary is not None and summary.updated_at >= cutoff)
+
+    async def sweep(self, ttl_days: float = CART_TTL_DAYS, batch_size: int = CART_SWEEP_BATCH_SIZE) -> int:
+        """Удаляет корзины, к которым не прикасались дольше ttl_days, пачками по batch_size.
+
+        Каждая пачка - отдельная короткая транзакция, между пачками event
+        loop обслуживает апдейты, а SQLite не держит долгую блокировку
+        записи. Корзины, измененные в памяти после cutoff, не трогаются.
+        Возвращает число удаленных корзин.
+        """
+        started = time.perf_counter()
+        cutoff = int(time.time() - ttl_days * 86400)
+        swept = 0
+        skipped: Set[int] = set()
+        try:
+            while True:
+                candidates = await asyncio.to_thread(self.find_abandoned, cutoff, batch_size + len(skipped))
+                user_ids = [user_id for user_id in candidates
+                            if user_id not in skipped and not self._is_active(user_id, cutoff)]
+                skipped.update(user_id for user_id in candidates if self._is_active(user_id, cutoff))
+                if not user_ids:
+                    break
+                user_ids = user_ids[:batch_size]
+                batch_started = time.perf_counter()
+                lines = await asyncio.to_thread(self.delete_carts, user_ids)
+                CART_SWEEP_BATCH_DURATION.observe(time.perf_counter() - batch_started)
+                for user_id in user_ids:
+                    # Пока шла транзакция, пользователь мог снова открыть корзину
+                    if not self._is_active(user_id, cutoff):
+                        self.forget(user_id)
+                swept += len(user_ids)
+                CART_SWEPT.inc(len(user_ids), unit="carts")
+                CART_SWEPT.inc(lines, unit="lines")
+        except Exception as e:
+            CART_SWEEPS.inc(result="error")
+            logger.error("Ошибка при очистке брошенных корзин: %s", e)
+            return swept
+
+        # Давно не менявшиеся корзины, уже записанные в БД, не нужно держать в памяти
+        for user_id in [user_id for user_id in self._summaries if not self._is_active(user_id, cutoff)]:
+            self.forget(user_id)
+
+        CART_SWEEPS.inc(result="ok")
+        CART_SWEEP_DURATION.observe(time.perf_counter() - started)
+        if swept:
+            logger.info("Удалено брошенных корзин: %s", swept)
+        return swept
+
+    async def run_sweeper(self, interval: float = CART_SWEEP_INTERVAL):
+        while True:
+            await self.sweep()
+            await asyncio.sleep(interval)
+
+    def forget(self, user_id: Optional[int] = None):
+        """Сбрасывает загруженные корзины (например, после подмены БД в инструментах)"""
+        if user_id is None:
+            self._carts.clear()
+            self._summaries.clear()
+            self._product_users.clear()
+            self._dirty.clear()
+        else:
+            for product_id in self._carts.pop(user_id, {}):
+                self._forget_product_user(product_id, user_id)
+            self._summaries.pop(user_id, None)
+            self._dirty.discard(user_id)
+
+
+cart_store = CartStore()
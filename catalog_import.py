@@ -0,0 +1,188 @@
+import csv
+import json
+import os
+
+from sqlalchemy import insert, select, update, bindparam, tuple_
+
+from db import SessionLocal, Category, Type, Product, Cart, refresh_cart_summaries
+
+# Не больше 999 параметров в одном запросе для старых версий SQLite
+IMPORT_BATCH_SIZE = 400
+IMPORT_FORMATS = (".csv", ".json", ".jsonl")
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def iter_csv_records(path):
+    with open(path, newline="", encoding="utf-8-sig") as source:
+        yield from csv.DictReader(source)
+
+
+def iter_jsonl_records(path):
+    with open(path, encoding="utf-8-sig") as source:
+        for line in source:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_json_array(path):
+    """Читает JSON-массив объектов по частям, не загружая файл целиком"""
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8-sig") as source:
+        buffer = source.read(JSON_CHUNK_SIZE).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError("Ожидается JSON-массив товаров")
+        buffer = buffer[1:]
+        eof = False
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                record, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = source.read(JSON_CHUNK_SIZE)
+                eof = not chunk
+                buffer += chunk
+                continue
+            yield record
+            buffer = buffer[end:]
+
+
+def iter_catalog_records(path, file_name):
+    extension = os.path.splitext(file_name.lower())[1]
+    if extension == ".csv":
+        return iter_csv_records(path)
+    if extension == ".jsonl":
+        return iter_jsonl_records(path)
+    if extension == ".json":
+        return iter_json_array(path)
+    raise ValueError(f"Неподдерживаемый формат файла: {file_name}")
+
+
+def parse_record(record):
+    """Приводит запись каталога к (категория, тип, название, описание, цена) или None"""
+    if not isinstance(record, dict):
+        return None
+    category = str(record.get("category") or "").strip()
+    type_name = str(record.get("type") or "").strip()
+    name = str(record.get("name") or "").strip()
+    description = str(record.get("description") or "").strip()
+    try:
+        price = int(float(str(record.get("price", "")).replace(" ", "").replace(",", ".")))
+    except ValueError:
+        return None
+    if not category or not type_name or not name or price <= 0:
+        return None
+    return category, type_name, name, description, price
+
+
+class CatalogImporter:
+    """Upsert категорий, типов и товаров пачками по IMPORT_BATCH_SIZE в одной транзакции"""
+
+    def __init__(self, db):
+        self.db = db
+        self.stats = {'created': 0, 'updated': 0, 'skipped': 0}
+        self.categories = {name: category_id for category_id, name in db.execute(select(Category.id, Category.name))}
+        self.types = {
+            (category_id, name): type_id
+            for type_id, category_id, name in db.execute(select(Type.id, Type.category_id, Type.name))
+        }
+        self.seen = set()
+
+    def run(self, records):
+        batch = []
+        for record in records:
+            parsed = parse_record(record)
+            if not parsed:
+                self.stats['skipped'] += 1
+                continue
+            batch.append(parsed)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+        return self.stats
+
+    def ensure_categories(self, names):
+        new_names = sorted(set(names) - self.categories.keys())
+        if not new_names:
+            return
+        self.db.execute(insert(Category), [{'name': name} for name in new_names])
+        self.categories.update({
+            name: category_id for category_id, name in
+            self.db.execute(select(Category.id, Category.name).where(Category.name.in_(new_names)))
+        })
+
+    def ensure_types(self, keys):
+        new_keys = sorted(set(keys) - self.types.keys())
+        if not new_keys:
+            return
+        self.db.execute(insert(Type), [{'category_id': category_id, 'name': name} for category_id, name in new_keys])
+        self.types.update({
+            (category_id, name): type_id for type_id, category_id, name in
+            self.db.execute(select(Type.id, Type.category_id, Type.name).where(
+                tuple_(Type.category_id, Type.name).in_(new_keys)
+            ))
+        })
+
+    def import_batch(self, batch):
+        self.ensure_categories(category for category, _, _, _, _ in batch)
+        self.ensure_types((self.categories[category], type_name) for category, type_name, _, _, _ in batch)
+
+        rows = {}
+        for category, type_name, name, description, price in batch:
+            key = (self.types[(self.categories[category], type_name)], name)
+            if key in self.seen:
+                # Повтор товара в файле — учитываем только первую строку
+                self.stats['skipped'] += 1
+                continue
+            self.seen.add(key)
+            rows[key] = (description, price)
+
+        existing = {
+            (type_id, name): (product_id, description, price)
+            for product_id, type_id, name, description, price in self.db.execute(
+                select(Product.id, Product.type_id, Product.name, Product.description, Product.price)
+                .where(tuple_(Product.type_id, Product.name).in_(list(rows)))
+            )
+        } if rows else {}
+
+        to_insert, to_update = [], []
+        for (type_id, name), (description, price) in rows.items():
+            current = existing.get((type_id, name))
+            if not current:
+                to_insert.append({'type_id': type_id, 'name': name, 'description': description, 'price': price})
+            elif current[1:] != (description, price):
+                to_update.append({'b_id': current[0], 'b_description': description, 'b_price': price})
+            else:
+                self.stats['skipped'] += 1
+
+        if to_insert:
+            self.db.execute(insert(Product), to_insert)
+        if to_update:
+            self.db.execute(
+                update(Product.__table__).where(Product.id == bindparam('b_id'))
+                .values(description=bindparam('b_description'), price=bindparam('b_price')),
+                to_update
+            )
+        self.stats['created'] += len(to_insert)
+        self.stats['updated'] += len(to_update)
+
+
+def run_catalog_import(path, file_name):
+    """Импорт файла каталога в одной транзакции. Блокирующая: вызывать через asyncio.to_thread."""
+    db = SessionLocal()
+    try:
+        stats = CatalogImporter(db).run(iter_catalog_records(path, file_name))
+        # Импорт мог поменять цены товаров, лежащих в корзинах
+        refresh_cart_summaries(db, select(Cart.user_id))
+        db.commit()
+        return stats
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -1,4 +1,35 @@
-BOT_TOKEN = "8458069766:AAHCIBivtcsiT3n_T_z97oh3X9Mz8YRb8Q0"
-ADMIN_IDS = [785219206, 5393564230]
-DATABASE_URL = "sqlite:///doors_bot.db"
-MEDIA_FOLDER = "doors"
+BOT_TOKEN = "8458069766:AAHCIBivtcsiT3n_T_z97oh3X9Mz8YRb8Q0"
+ADMIN_IDS = [785219206, 5393564230]
+DATABASE_URL = "sqlite:///doors_bot.db"
+MEDIA_FOLDER = "doors"
+
+# JSON Lines файл для записи входящих апдейтов (None - запись выключена)
+TRACE_FILE = None
+
+# Порт HTTP-эндпоинта /metrics в формате Prometheus (None - эндпоинт выключен)
+METRICS_PORT = None
+
+# Уровень логов и доля записей DEBUG, которые попадают в лог
+LOG_LEVEL = "INFO"
+LOG_DEBUG_SAMPLE_RATE = 0.1
+
+# Сколько секунд при остановке ждать незавершенные обработчики и фоновые задачи
+SHUTDOWN_TIMEOUT = 8
+
+# Предел памяти кеша карточек товаров (подпись и медиагруппа), байты
+PRODUCT_CACHE_MAX_BYTES = 2 * 1024 * 1024
+
+# Как часто корзины из памяти записываются в БД, секунды
+CART_FLUSH_INTERVAL = 1.0
+
+# Корзины, к которым не прикасались дольше CART_TTL_DAYS дней, удаляются фоновой очисткой:
+# раз в CART_SWEEP_INTERVAL секунд, пачками по CART_SWEEP_BATCH_SIZE корзин
+CART_TTL_DAYS = 30
+CART_SWEEP_INTERVAL = 3600
+CART_SWEEP_BATCH_SIZE = 200
+
+# Выполненные заказы старше ORDER_ARCHIVE_AFTER_DAYS дней переносятся в архивные таблицы:
+# раз в ORDER_ARCHIVE_INTERVAL секунд, пачками по ORDER_ARCHIVE_BATCH_SIZE заказов
+ORDER_ARCHIVE_AFTER_DAYS = 90
+ORDER_ARCHIVE_INTERVAL = 86400
+ORDER_ARCHIVE_BATCH_SIZE = 500
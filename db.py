@@ -1,205 +1,622 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, text
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from aiogram.filters.callback_data import CallbackData
-import os
-
-from config import DATABASE_URL
-
-
-class CategoryPagination(CallbackData, prefix="cat_pag"):
-    page: int
-
-
-class TypePagination(CallbackData, prefix="type_pag"):
-    category_id: int
-    page: int
-
-
-class ProductPagination(CallbackData, prefix="prod_pag"):
-    type_id: int
-    page: int
-
-
-# Создаем папки для медиа, если их нет
-os.makedirs("doors", exist_ok=True)
-os.makedirs("files", exist_ok=True)
-os.makedirs("location", exist_ok=True)  # Новая папка для локаций
-
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
-
-
-class Category(Base):
-    __tablename__ = "categories"
-
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(100), unique=True, nullable=False)
-
-    # Связь с типами
-    types = relationship("Type", back_populates="category", cascade="all, delete-orphan")
-
-
-class Type(Base):
-    __tablename__ = "types"
-
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(100), nullable=False)
-    category_id = Column(Integer, ForeignKey("categories.id"))
-
-    # Связи
-    category = relationship("Category", back_populates="types")
-    products = relationship("Product", back_populates="type", cascade="all, delete-orphan")
-
-
-class Product(Base):
-    __tablename__ = "products"
-
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(200), nullable=False)
-    description = Column(Text)
-    price = Column(Integer, nullable=False, default=0)
-    type_id = Column(Integer, ForeignKey("types.id"))
-
-    # Связи
-    type = relationship("Type", back_populates="products")
-    media = relationship("ProductMedia", back_populates="product", cascade="all, delete-orphan")
-
-
-class ProductMedia(Base):
-    __tablename__ = "product_media"
-
-    id = Column(Integer, primary_key=True, index=True)
-    product_id = Column(Integer, ForeignKey("products.id"))
-    file_id = Column(String(255))
-    file_path = Column(String(500))
-    media_type = Column(String(10))
-
-    product = relationship("Product", back_populates="media")
-
-
-class Cart(Base):
-    __tablename__ = "carts"
-
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, nullable=False)
-    product_id = Column(Integer, ForeignKey("products.id"))
-    quantity = Column(Integer, default=1)
-
-    product = relationship("Product")
-
-
-class Order(Base):
-    __tablename__ = "orders"
-
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, nullable=False)
-    user_name = Column(String(100))
-    phone_number = Column(String(20))
-    total_amount = Column(Integer)
-    status = Column(String(20), default="pending")
-    created_at = Column(String(50))
-
-
-class OrderItem(Base):
-    __tablename__ = "order_items"
-
-    id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"))
-    product_id = Column(Integer, ForeignKey("products.id"))
-    product_name = Column(String(200))
-    product_price = Column(Integer)
-    quantity = Column(Integer)
-
-    product = relationship("Product")
-    order = relationship("Order")
-
-
-class MainMenuSection(Base):
-    __tablename__ = "main_menu_sections"
-
-    id = Column(Integer, primary_key=True, index=True)
-    section_key = Column(String(50), unique=True, nullable=False)
-    title = Column(String(100), nullable=False)
-    content = Column(Text, default="")
-    photo_path = Column(String(500), nullable=True)
-    file_id = Column(String(255), nullable=True)
-
-
-def create_tables():
-    Base.metadata.create_all(bind=engine)
-    migrate_database()
-
-
-def migrate_database():
-    db = SessionLocal()
-    try:
-        result = db.execute(text("PRAGMA table_info(products)"))
-        columns = [row[1] for row in result]
-
-        if 'price' not in columns:
-            print("Добавляем столбец price в таблицу products...")
-            db.execute(text("ALTER TABLE products ADD COLUMN price INTEGER NOT NULL DEFAULT 0"))
-            print("Столбец price успешно добавлен")
-
-        result = db.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name='main_menu_sections'"))
-        table_exists = result.fetchone()
-
-        if not table_exists:
-            print("Создаем таблицу main_menu_sections...")
-            MainMenuSection.__table__.create(engine)
-            print("Таблица main_menu_sections успешно создана")
-
-        create_initial_sections(db)
-        db.commit()
-
-    except Exception as e:
-        db.rollback()
-        print(f"Ошибка при миграции базы данных: {e}")
-    finally:
-        db.close()
-
-
-def create_initial_sections(db):
-    sections_data = [
-        {
-            'section_key': 'services',
-            'title': '🛠️ Услуги',
-            'content': '🛠️ Раздел "Услуги" в разработке'
-        },
-        {
-            'section_key': 'info',
-            'title': 'ℹ️ Информация',
-            'content': 'ℹ️ Раздел "Информация" в разработке'
-        },
-        {
-            'section_key': 'consultation',
-            'title': '💬 Консультация',
-            'content': '💬 Раздел "Консультация" в разработке'
-        }
-    ]
-
-    for section_data in sections_data:
-        existing_section = db.query(MainMenuSection).filter(
-            MainMenuSection.section_key == section_data['section_key']
-        ).first()
-
-        if not existing_section:
-            print(f"Создаем раздел: {section_data['section_key']}")
-            new_section = MainMenuSection(
-                section_key=section_data['section_key'],
-                title=section_data['title'],
-                content=section_data['content']
-            )
-            db.add(new_section)
-        else:
-            print(f"Раздел {section_data['section_key']} уже существует")
-
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, Index, text, select, delete, insert, \
+    update, func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import NullPool
+from sqlalchemy.orm import sessionmaker, relationship
+from aiogram.filters.callback_data import CallbackData
+import hashlib
+import logging
+import os
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from config import DATABASE_URL
+
+
+class CategoryPagination(CallbackData, prefix="cat_pag"):
+    page: int
+
+
+class TypePagination(CallbackData, prefix="type_pag"):
+    category_id: int
+    page: int
+
+
+class ProductPagination(CallbackData, prefix="prod_pag"):
+    type_id: int
+    page: int
+
+
+logger = logging.getLogger(__name__)
+
+# Увеличивается при каждом изменении migrate_database, чтобы отпечаток схемы
+# поменялся и миграции прогнались заново
+MIGRATIONS_REVISION = 6
+
+_engine = None
+_session_factory = sessionmaker(autocommit=False, autoflush=False)
+Base = declarative_base()
+
+
+def get_engine():
+    """Engine создается при первом обращении, а не при импорте модуля"""
+    global _engine
+    if _engine is None:
+        # Обработчики держат сессию открытой во время запросов к Bot API, поэтому
+        # при ограниченном QueuePool десятки одновременных апдейтов исчерпывали пул
+        # и блокировали event loop. Соединение с файлом SQLite открывается дёшево.
+        _engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=NullPool)
+    return _engine
+
+
+def set_engine(engine):
+    """Подменяет engine (офлайн-инструменты работают с временной базой)"""
+    global _engine
+    _engine = engine
+
+
+def SessionLocal():
+    return _session_factory(bind=get_engine())
+
+
+def ensure_media_dirs():
+    # Создаем папки для медиа, если их нет
+    os.makedirs("doors", exist_ok=True)
+    os.makedirs("files", exist_ok=True)
+    os.makedirs("location", exist_ok=True)  # Новая папка для локаций
+
+
+class Category(Base):
+    __tablename__ = "categories"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), unique=True, nullable=False)
+
+    # Связь с типами
+    types = relationship("Type", back_populates="category", cascade="all, delete-orphan")
+
+
+class Type(Base):
+    __tablename__ = "types"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id"))
+
+    # Связи
+    category = relationship("Category", back_populates="types")
+    products = relationship("Product", back_populates="type", cascade="all, delete-orphan")
+
+    # Списки выбора в админке: типы категории по названию страницами
+    __table_args__ = (
+        Index("ix_types_category_id_name", "category_id", "name"),
+    )
+
+
+class Product(Base):
+    __tablename__ = "products"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(200), nullable=False)
+    description = Column(Text)
+    price = Column(Integer, nullable=False, default=0)
+    type_id = Column(Integer, ForeignKey("types.id"))
+    # Первое медиа товара для корзины и заказов (копия из product_media, см. refresh_product_covers)
+    cover_file_id = Column(String(255))
+    cover_media_type = Column(String(10))
+
+    # Связи
+    type = relationship("Type", back_populates="products")
+    media = relationship("ProductMedia", back_populates="product", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index("ix_products_type_id_name", "type_id", "name"),
+    )
+
+
+class ProductMedia(Base):
+    __tablename__ = "product_media"
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"))
+    file_id = Column(String(255))
+    file_path = Column(String(500))
+    media_type = Column(String(10))
+
+    product = relationship("Product", back_populates="media")
+
+
+class Cart(Base):
+    __tablename__ = "carts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"))
+    quantity = Column(Integer, default=1)
+    # Время последнего изменения корзины пользователем (UTC epoch), по нему чистятся брошенные корзины
+    updated_at = Column(Integer, nullable=False, default=lambda: int(time.time()), index=True)
+
+    product = relationship("Product")
+
+
+class Order(Base):
+    __tablename__ = "orders"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False)
+    user_name = Column(String(100))
+    phone_number = Column(String(20))
+    total_amount = Column(Integer)
+    status = Column(String(20), default="pending")
+    # UTC epoch в секундах
+    created_at = Column(Integer, nullable=False, default=lambda: int(time.time()))
+
+    __table_args__ = (
+        Index("ix_orders_status_created_at", "status", "created_at"),
+        # Выгрузка заказов за период в порядке времени
+        Index("ix_orders_created_at", "created_at"),
+    )
+
+
+class OrderItem(Base):
+    __tablename__ = "order_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)
+    product_id = Column(Integer, ForeignKey("products.id"))
+    product_name = Column(String(200))
+    product_price = Column(Integer)
+    quantity = Column(Integer)
+
+    product = relationship("Product")
+    order = relationship("Order")
+
+
+class ArchivedOrder(Base):
+    """Выполненные заказы старше ORDER_ARCHIVE_AFTER_DAYS, перенесенные из orders (см. archive.py)"""
+    __tablename__ = "orders_archive"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    user_name = Column(String(100))
+    phone_number = Column(String(20))
+    total_amount = Column(Integer)
+    status = Column(String(20))
+    created_at = Column(Integer, nullable=False, index=True)
+    archived_at = Column(Integer, nullable=False)
+
+
+class ArchivedOrderItem(Base):
+    __tablename__ = "order_items_archive"
+
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, ForeignKey("orders_archive.id"), index=True)
+    product_id = Column(Integer)
+    product_name = Column(String(200))
+    product_price = Column(Integer)
+    quantity = Column(Integer)
+
+
+class PriceChangeBatch(Base):
+    """Массовое изменение цен, хранится для отмены"""
+    __tablename__ = "price_change_batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(String(200), nullable=False)
+    change = Column(String(20), nullable=False)
+    products_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(Integer, nullable=False, default=lambda: int(time.time()))
+    undone = Column(Integer, nullable=False, default=0)
+
+
+class PriceChangeItem(Base):
+    __tablename__ = "price_change_items"
+
+    batch_id = Column(Integer, ForeignKey("price_change_batches.id"), primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    old_price = Column(Integer, nullable=False)
+
+
+class SalesDaily(Base):
+    """Агрегаты продаж по дням, поддерживаются инкрементально (см. stats.py)"""
+    __tablename__ = "sales_daily"
+
+    day = Column(String(10), primary_key=True)  # YYYY-MM-DD
+    orders_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Integer, nullable=False, default=0)
+    completed_count = Column(Integer, nullable=False, default=0)
+    completed_revenue = Column(Integer, nullable=False, default=0)
+
+
+class SalesDailyProduct(Base):
+    __tablename__ = "sales_daily_products"
+
+    day = Column(String(10), primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    product_name = Column(String(200))
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Integer, nullable=False, default=0)
+
+
+class MainMenuSection(Base):
+    __tablename__ = "main_menu_sections"
+
+    id = Column(Integer, primary_key=True, index=True)
+    section_key = Column(String(50), unique=True, nullable=False)
+    title = Column(String(100), nullable=False)
+    content = Column(Text, default="")
+    photo_path = Column(String(500), nullable=True)
+    file_id = Column(String(255), nullable=True)
+
+
+class SchemaMeta(Base):
+    __tablename__ = "schema_meta"
+
+    key = Column(String(50), primary_key=True)
+    value = Column(String(255), nullable=False)
+
+
+class CartSummary(Base):
+    """Итог корзины пользователя: обновляется при каждом изменении корзины и цен"""
+    __tablename__ = "cart_summaries"
+
+    user_id = Column(Integer, primary_key=True)
+    total_amount = Column(Integer, nullable=False, default=0)
+    line_count = Column(Integer, nullable=False, default=0)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class CachedFile(Base):
+    """file_id Telegram для локальных файлов, которые бот отправляет сам"""
+    __tablename__ = "cached_files"
+
+    path = Column(String(500), primary_key=True)
+    mtime = Column(Integer, nullable=False)
+    file_id = Column(String(255), nullable=False)
+
+
+def format_order_time(created_at: int) -> str:
+    """Время заказа в локальном часовом поясе для отображения"""
+    return datetime.fromtimestamp(created_at).strftime("%d.%m.%Y %H:%M")
+
+
+def schema_fingerprint() -> str:
+    """Хеш описания моделей и ревизии миграций"""
+    parts = [f"migrations:{MIGRATIONS_REVISION}"]
+    for table in sorted(Base.metadata.tables.values(), key=lambda t: t.name):
+        parts.append(f"table:{table.name}")
+        for column in table.columns:
+            parts.append(f"column:{column.name}:{column.type}:{column.nullable}:{column.primary_key}")
+        for index in sorted(table.indexes, key=lambda i: i.name or ""):
+            parts.append(f"index:{index.name}:{','.join(c.name for c in index.columns)}")
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def stored_schema_fingerprint():
+    try:
+        with get_engine().connect() as conn:
+            return conn.execute(select(SchemaMeta.value).where(SchemaMeta.key == "fingerprint")).scalar()
+    except OperationalError:
+        # таблицы schema_meta еще нет
+        return None
+
+
+def create_tables():
+    ensure_media_dirs()
+    fingerprint = schema_fingerprint()
+    if stored_schema_fingerprint() == fingerprint:
+        logger.info("Схема базы данных актуальна, миграции пропущены")
+        return
+
+    Base.metadata.create_all(bind=get_engine())
+    migrate_database(fingerprint)
+
+
+def migrate_database(fingerprint=None):
+    db = SessionLocal()
+    try:
+        result = db.execute(text("PRAGMA table_info(products)"))
+        columns = [row[1] for row in result]
+
+        if 'price' not in columns:
+            logger.info("Добавляем столбец price в таблицу products...")
+            db.execute(text("ALTER TABLE products ADD COLUMN price INTEGER NOT NULL DEFAULT 0"))
+            logger.info("Столбец price успешно добавлен")
+
+        if 'cover_file_id' not in columns:
+            logger.info("Добавляем обложки товаров в таблицу products...")
+            db.execute(text("ALTER TABLE products ADD COLUMN cover_file_id VARCHAR(255)"))
+            db.execute(text("ALTER TABLE products ADD COLUMN cover_media_type VARCHAR(10)"))
+            refresh_product_covers(db)
+            logger.info("Обложки товаров заполнены")
+
+        result = db.execute(text("PRAGMA table_info(orders)"))
+        created_at_type = {row[1]: row[2] for row in result}.get('created_at', '')
+
+        if created_at_type.upper().startswith('VARCHAR'):
+            logger.info("Переводим orders.created_at в UTC epoch...")
+            migrate_order_timestamps(db)
+            logger.info("Столбец created_at успешно преобразован")
+
+        db.execute(text("CREATE INDEX IF NOT EXISTS ix_order_items_order_id ON order_items (order_id)"))
+        db.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_created_at ON orders (created_at)"))
+        db.execute(text("CREATE INDEX IF NOT EXISTS ix_types_category_id_name ON types (category_id, name)"))
+        db.execute(text("CREATE INDEX IF NOT EXISTS ix_products_type_id_name ON products (type_id, name)"))
+
+        result = db.execute(text("PRAGMA table_info(carts)"))
+        if 'updated_at' not in [row[1] for row in result]:
+            logger.info("Добавляем столбец updated_at в таблицу carts...")
+            db.execute(text("ALTER TABLE carts ADD COLUMN updated_at INTEGER NOT NULL DEFAULT 0"))
+            # Существующим корзинам отсчет срока жизни начинается с миграции
+            db.execute(update(Cart).values(updated_at=int(time.time())), execution_options={"synchronize_session": False})
+            db.execute(text("CREATE INDEX IF NOT EXISTS ix_carts_updated_at ON carts (updated_at)"))
+            logger.info("Столбец updated_at успешно добавлен")
+
+        result = db.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name='main_menu_sections'"))
+        table_exists = result.fetchone()
+
+        if not table_exists:
+            logger.info("Создаем таблицу main_menu_sections...")
+            MainMenuSection.__table__.create(db.connection())
+            logger.info("Таблица main_menu_sections успешно создана")
+
+        if not db.query(CartSummary).first() and db.query(Cart.id).first():
+            logger.info("Считаем итоги корзин...")
+            db.execute(insert(CartSummary).from_select(
+                ['user_id', 'total_amount', 'line_count', 'version'],
+                select(Cart.user_id, func.sum(Cart.quantity * Product.price), func.count(Cart.id), 1)
+                .join(Product, Product.id == Cart.product_id)
+                .group_by(Cart.user_id)
+            ))
+
+        # Заполняем агрегаты продаж по уже существующим заказам
+        if not db.query(SalesDaily).first() and db.query(Order.id).first():
+            from stats import rebuild_sales_stats
+            logger.info("Пересчитываем статистику продаж...")
+            rebuild_sales_stats(db)
+
+        create_initial_sections(db)
+        if fingerprint:
+            db.merge(SchemaMeta(key="fingerprint", value=fingerprint))
+        db.commit()
+
+    except Exception as e:
+        db.rollback()
+        logger.error("Ошибка при миграции базы данных: %s", e)
+    finally:
+        db.close()
+
+
+def migrate_order_timestamps(db):
+    """Пересоздает orders с created_at INTEGER (UTC epoch).
+
+    Старые значения "%d.%m.%Y %H:%M" записаны в локальном времени сервера,
+    SQLite переводит их в UTC модификатором 'utc'.
+    """
+    db.execute(text("""
+        CREATE TABLE orders_new (
+            id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            user_name VARCHAR(100),
+            phone_number VARCHAR(20),
+            total_amount INTEGER,
+            status VARCHAR(20),
+            created_at INTEGER NOT NULL,
+            PRIMARY KEY (id)
+        )
+    """))
+    db.execute(text("""
+        INSERT INTO orders_new (id, user_id, user_name, phone_number, total_amount, status, created_at)
+        SELECT id, user_id, user_name, phone_number, total_amount, status,
+               COALESCE(
+                   CAST(strftime('%s',
+                        substr(created_at, 7, 4) || '-' || substr(created_at, 4, 2) || '-' ||
+                        substr(created_at, 1, 2) || ' ' || substr(created_at, 12, 5),
+                        'utc') AS INTEGER),
+                   CAST(strftime('%s', 'now') AS INTEGER)
+               )
+        FROM orders
+    """))
+    db.execute(text("DROP TABLE orders"))
+    db.execute(text("ALTER TABLE orders_new RENAME TO orders"))
+    db.execute(text("CREATE INDEX ix_orders_id ON orders (id)"))
+    db.execute(text("CREATE INDEX ix_orders_status_created_at ON orders (status, created_at)"))
+
+
+def create_initial_sections(db):
+    sections_data = [
+        {
+            'section_key': 'services',
+            'title': '🛠️ Услуги',
+            'content': '🛠️ Раздел "Услуги" в разработке'
+        },
+        {
+            'section_key': 'info',
+            'title': 'ℹ️ Информация',
+            'content': 'ℹ️ Раздел "Информация" в разработке'
+        },
+        {
+            'section_key': 'consultation',
+            'title': '💬 Консультация',
+            'content': '💬 Раздел "Консультация" в разработке'
+        }
+    ]
+
+    for section_data in sections_data:
+        existing_section = db.query(MainMenuSection).filter(
+            MainMenuSection.section_key == section_data['section_key']
+        ).first()
+
+        if not existing_section:
+            logger.info("Создаем раздел: %s", section_data['section_key'])
+            new_section = MainMenuSection(
+                section_key=section_data['section_key'],
+                title=section_data['title'],
+                content=section_data['content']
+            )
+            db.add(new_section)
+
+
+def delete_products_cascade(db, product_ids):
+    """Удаляет товары вместе с медиа и позициями корзин набором DELETE-запросов.
+
+    product_ids — список id или SELECT, возвращающий id товаров.
+    Возвращает пути медиафайлов, которые нужно удалить с диска после commit.
+    """
+    media_paths = db.execute(
+        select(ProductMedia.file_path).where(ProductMedia.product_id.in_(product_ids))
+    ).scalars().all()
+
+    cart_users = db.execute(
+        select(Cart.user_id).where(Cart.product_id.in_(product_ids)).distinct()
+    ).scalars().all()
+
+    no_sync = {"synchronize_session": False}
+    db.execute(delete(ProductMedia).where(ProductMedia.product_id.in_(product_ids)), execution_options=no_sync)
+    db.execute(delete(Cart).where(Cart.product_id.in_(product_ids)), execution_options=no_sync)
+    db.execute(delete(Product).where(Product.id.in_(product_ids)), execution_options=no_sync)
+    if cart_users:
+        refresh_cart_summaries(db, cart_users)
+    return [path for path in media_paths if path]
+
+
+def refresh_cart_summaries(db, user_ids):
+    """Пересчитывает cart_summaries по таблице carts. user_ids — список id или SELECT."""
+    lines = select(Cart.quantity, Product.price).join(Product, Product.id == Cart.product_id) \
+        .where(Cart.user_id == CartSummary.user_id).correlate(CartSummary).subquery()
+    db.execute(
+        update(CartSummary).where(CartSummary.user_id.in_(user_ids)).values(
+            total_amount=select(func.coalesce(func.sum(lines.c.quantity * lines.c.price), 0)).scalar_subquery(),
+            line_count=select(func.count()).select_from(lines).scalar_subquery(),
+            version=CartSummary.version + 1
+        ),
+        execution_options={"synchronize_session": False}
+    )
+
+
+def delete_types_cascade(db, type_ids):
+    """Удаляет типы и всё их содержимое. type_ids — список id или SELECT."""
+    media_paths = delete_products_cascade(db, select(Product.id).where(Product.type_id.in_(type_ids)))
+    db.execute(delete(Type).where(Type.id.in_(type_ids)), execution_options={"synchronize_session": False})
+    return media_paths
+
+
+def delete_category_cascade(db, category_id):
+    """Удаляет категорию со всеми типами, товарами и медиа."""
+    media_paths = delete_types_cascade(db, select(Type.id).where(Type.category_id == category_id))
+    db.execute(delete(Category).where(Category.id == category_id), execution_options={"synchronize_session": False})
+    return media_paths
+
+
+def place_order(db, user_id, user_name, phone_number, cart_items=None):
+    """Оформляет заказ из корзины пользователя в одной транзакции.
+
+    cart_items - [(product_id, quantity)] из cart_store; если не заданы,
+    корзина читается из таблицы carts. Цены перечитываются из products
+    одним запросом, позиции вставляются одним executemany, строки carts
+    пользователя удаляются одним DELETE. Если корзина уже пуста
+    (повторная отправка телефона), возвращает (None, []).
+    """
+    if cart_items is None:
+        rows = db.execute(
+            select(Cart.product_id, Cart.quantity, Product.name, Product.price)
+            .join(Product, Product.id == Cart.product_id)
+            .where(Cart.user_id == user_id)
+            .order_by(Cart.id)
+        ).all()
+    else:
+        products = {
+            row.id: row for row in db.execute(
+                select(Product.id, Product.name, Product.price)
+                .where(Product.id.in_([product_id for product_id, _ in cart_items]))
+            )
+        }
+        rows = [
+            SimpleNamespace(product_id=product_id, quantity=quantity,
+                            name=products[product_id].name, price=products[product_id].price)
+            for product_id, quantity in cart_items if product_id in products
+        ]
+    if not rows:
+        return None, []
+
+    # Корзину очищаем до вставки заказа: параллельный повторный запрос
+    # получит rowcount == 0 и не создаст второй заказ. Корзину из cart_store
+    # от повтора защищает cart_store.take, а ее строки в carts могли быть
+    # еще не записаны
+    deleted = db.execute(
+        delete(Cart).where(Cart.user_id == user_id), execution_options={"synchronize_session": False}
+    ).rowcount
+    if not deleted and cart_items is None:
+        return None, []
+
+    items = [
+        {
+            'product_id': row.product_id,
+            'product_name': row.name,
+            'price': row.price,
+            'quantity': row.quantity,
+            'total': row.price * row.quantity
+        }
+        for row in rows
+    ]
+
+    order = Order(
+        user_id=user_id,
+        user_name=user_name,
+        phone_number=phone_number,
+        total_amount=sum(item['total'] for item in items),
+        created_at=int(time.time())
+    )
+    db.add(order)
+    db.flush()
+
+    db.execute(insert(OrderItem), [
+        {
+            'order_id': order.id,
+            'product_id': item['product_id'],
+            'product_name': item['product_name'],
+            'product_price': item['price'],
+            'quantity': item['quantity']
+        }
+        for item in items
+    ])
+    return order, items
+
+
+def refresh_product_covers(db, product_ids=None):
+    """Копирует первое медиа товара в products.cover_* (для всех товаров, если product_ids не задан)"""
+    first_media = select(ProductMedia.product_id, func.min(ProductMedia.id).label("media_id")) \
+        .group_by(ProductMedia.product_id)
+    reset = update(Product).values(cover_file_id=None, cover_media_type=None)
+    if product_ids is not None:
+        first_media = first_media.where(ProductMedia.product_id.in_(product_ids))
+        reset = reset.where(Product.id.in_(product_ids))
+    first_media = first_media.subquery()
+    covers = select(first_media.c.product_id, ProductMedia.file_id, ProductMedia.media_type) \
+        .join(ProductMedia, ProductMedia.id == first_media.c.media_id).subquery()
+
+    # UPDATE ... FROM по сгруппированному подзапросу: один проход по product_media
+    db.execute(reset, execution_options={"synchronize_session": False})
+    db.execute(
+        update(Product).where(Product.id == covers.c.product_id)
+        .values(cover_file_id=covers.c.file_id, cover_media_type=covers.c.media_type),
+        execution_options={"synchronize_session": False}
+    )
+
+
+def get_product_covers(db, product_ids):
+    """Возвращает {product_id: (media_type, file_id)} обложек товаров одним запросом"""
+    rows = db.query(Product.id, Product.cover_media_type, Product.cover_file_id).filter(
+        Product.id.in_(product_ids), Product.cover_file_id.isnot(None)
+    ).all()
+    return {row.id: (row.cover_media_type, row.cover_file_id) for row in rows}
+
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,123 @@
+import asyncio
+import inspect
+import logging
+import time
+from typing import Callable, Dict, List, Set
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import Update
+
+from db import get_engine
+from logging_config import stop_logging
+
+logger = logging.getLogger(__name__)
+
+# Пауза между проверками при ожидании обработчиков
+DRAIN_POLL_INTERVAL = 0.05
+
+_accepting = True
+# update_id -> время начала обработки
+_in_flight: Dict[int, float] = {}
+_background: Set[asyncio.Task] = set()
+_flush_hooks: List[Callable] = []
+_last_handled_update_id = None
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """Учитывает обрабатываемые апдейты и не пускает новые после начала остановки"""
+
+    async def __call__(self, handler, event: Update, data: dict):
+        if not _accepting:
+            logger.warning("Апдейт %s пришел во время остановки и не обработан", event.update_id)
+            return None
+
+        global _last_handled_update_id
+        _in_flight[event.update_id] = time.monotonic()
+        try:
+            return await handler(event, data)
+        finally:
+            del _in_flight[event.update_id]
+            if _last_handled_update_id is None or event.update_id > _last_handled_update_id:
+                _last_handled_update_id = event.update_id
+
+
+def spawn(coro, name: str = None) -> asyncio.Task:
+    """Фоновая задача, которую остановка бота дождется (уведомления и т.п.)"""
+    task = asyncio.create_task(coro, name=name)
+    _background.add(task)
+    task.add_done_callback(_background_done)
+    return task
+
+
+def _background_done(task: asyncio.Task):
+    _background.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Фоновая задача %s завершилась ошибкой: %s", task.get_name(), task.exception())
+
+
+def register_flush_hook(hook: Callable):
+    """hook (обычная или async функция) вызывается при остановке после завершения обработчиков"""
+    _flush_hooks.append(hook)
+
+
+async def wait_for_idle(deadline: float) -> bool:
+    while _in_flight or _background:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        if _background:
+            await asyncio.wait(set(_background), timeout=min(remaining, DRAIN_POLL_INTERVAL))
+        else:
+            await asyncio.sleep(min(remaining, DRAIN_POLL_INTERVAL))
+    return True
+
+
+async def confirm_handled_updates(bot: Bot):
+    """Подтверждает Telegram обработанные апдейты, чтобы после рестарта они не пришли снова.
+
+    Polling подтверждает offset только следующим getUpdates, которого после
+    остановки уже не будет. Апдейты, обработка которых не успела
+    завершиться, не подтверждаются.
+    """
+    if _last_handled_update_id is None:
+        return
+    offset = _last_handled_update_id + 1
+    if _in_flight:
+        offset = min(offset, min(_in_flight))
+    try:
+        # limit=1 и timeout=0: подтверждает все id < offset, а полученный апдейт
+        # остается неподтвержденным и придет после рестарта
+        await bot.get_updates(offset=offset, limit=1, timeout=0)
+    except Exception as e:
+        logger.error("Не удалось подтвердить обработанные апдейты: %s", e)
+
+
+async def drain(bot: Bot, timeout: float):
+    """Вызывается из dp.shutdown: polling уже остановлен, сессия бота еще открыта"""
+    global _accepting
+    _accepting = False
+    started = time.monotonic()
+    logger.info("Остановка: обработчиков %s, фоновых задач %s", len(_in_flight), len(_background))
+
+    if not await wait_for_idle(started + timeout):
+        logger.warning("Не дождались за %s с: обработчиков %s, фоновых задач %s",
+                       timeout, len(_in_flight), len(_background))
+        for task in list(_background):
+            task.cancel()
+
+    for hook in _flush_hooks:
+        try:
+            result = hook()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error("Ошибка при сбросе данных перед остановкой: %s", e)
+
+    await confirm_handled_updates(bot)
+    logger.info("Остановка: очереди разобраны за %.2f с", time.monotonic() - started)
+
+
+def close_resources():
+    """Последний шаг остановки, после закрытия сессии бота"""
+    get_engine().dispose()
+    stop_logging()
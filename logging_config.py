@@ -0,0 +1,140 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+from aiogram import BaseMiddleware
+
+from metrics import current_update
+
+logger = logging.getLogger(__name__)
+
+# Контекст текущего апдейта, который попадает в каждую запись лога
+log_context: ContextVar[Optional[dict]] = ContextVar("log_context", default=None)
+
+# Поля LogRecord, которые не переносятся в JSON как дополнительные
+RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class UpdateContextFilter(logging.Filter):
+    """Дописывает в запись id апдейта, чат и обработчик.
+
+    Работает в вызывающем коде (на QueueHandler), пока contextvars ещё
+    указывают на апдейт, а не в потоке QueueListener.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = log_context.get()
+        if context:
+            for key, value in context.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        update_metrics = current_update.get()
+        if update_metrics is not None and not hasattr(record, "handler"):
+            record.handler = update_metrics.handler
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Пропускает только долю rate записей уровня DEBUG, остальные не попадают в очередь"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Сообщение и исключение форматируются здесь, чтобы в очередь не уходили
+        # ссылки на объекты апдейта; сам JSON собирает поток QueueListener
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level: str = "INFO", debug_sample_rate: float = 1.0, stream=None):
+    """Направляет все логи через очередь в отдельный поток, который пишет JSON-строки"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = ContextQueueHandler(log_queue)
+    queue_handler.addFilter(DebugSamplingFilter(debug_sample_rate))
+    queue_handler.addFilter(UpdateContextFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+    # Итоговую строку по каждому апдейту пишет UpdateLogMiddleware
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Дописывает оставшиеся в очереди записи"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def update_chat_id(update) -> Optional[int]:
+    event = update.event
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    return chat.id if chat else None
+
+
+class UpdateLogMiddleware(BaseMiddleware):
+    """Внешний middleware апдейтов: контекст для логов и итоговая запись с длительностью"""
+
+    async def __call__(self, handler, event, data):
+        token = log_context.set({"update_id": event.update_id, "chat_id": update_chat_id(event)})
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Апдейт обработан", extra={"duration_ms": round((time.perf_counter() - started) * 1000, 2)})
+            log_context.reset(token)
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiohttp import web
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from callbacks import CallbackIndex
+
+logger = logging.getLogger(__name__)
+
+# Границы бакетов гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Границы бакетов для количества запросов к БД/Bot API на один апдейт
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Период проверки задержки event loop, секунды
+LOOP_LAG_INTERVAL = 0.5
+
+REGISTRY = []
+
+
+def format_labels(labelnames, values) -> str:
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.values: Dict[tuple, object] = {}
+        REGISTRY.append(self)
+
+    def key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for key, value in self.values.items():
+            yield f"{self.name}{format_labels(self.labelnames, key)} {value}"
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[self.key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        state = self.values.get(key)
+        if state is None:
+            # счётчики по бакетам, сумма, количество
+            state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[0][i] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} {self.kind}"
+        labelnames = self.labelnames + ("le",)
+        for key, (bucket_counts, total, count) in self.values.items():
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                yield f"{self.name}_bucket{format_labels(labelnames, key + (bound,))} {bucket_count}"
+            yield f"{self.name}_bucket{format_labels(labelnames, key + ('+Inf',))} {count}"
+            yield f"{self.name}_sum{format_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{format_labels(self.labelnames, key)} {count}"
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+HANDLER_DURATION = Histogram("bot_handler_duration_seconds", "Время обработки апдейта", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в обработчиках", ("handler", "error"))
+DB_QUERIES_PER_UPDATE = Histogram("bot_db_queries_per_update", "SQL-запросов на апдейт", ("handler",),
+                                  buckets=COUNT_BUCKETS)
+DB_TIME_PER_UPDATE = Histogram("bot_db_time_per_update_seconds", "Время в SQL-запросах на апдейт", ("handler",))
+DB_QUERIES = Counter("bot_db_queries_total", "Все SQL-запросы")
+API_CALLS_PER_UPDATE = Histogram("bot_api_calls_per_update", "Запросов к Bot API на апдейт", ("handler",),
+                                 buckets=COUNT_BUCKETS)
+API_DURATION = Histogram("bot_api_request_duration_seconds", "Время запросов к Bot API", ("method",))
+API_ERRORS = Counter("bot_api_errors_total", "Ошибки запросов к Bot API", ("method", "error"))
+LOOP_LAG = Gauge("bot_event_loop_lag_seconds", "Последняя измеренная задержка event loop")
+LOOP_LAG_HISTOGRAM = Histogram("bot_event_loop_lag_distribution_seconds", "Задержка event loop")
+
+
+class UpdateMetrics:
+    __slots__ = ("handler", "db_queries", "db_time", "api_calls")
+
+    def __init__(self):
+        self.handler = "unhandled"
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.api_calls = 0
+
+
+current_update: ContextVar[Optional[UpdateMetrics]] = ContextVar("current_update", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    DB_QUERIES.inc()
+    update_metrics = current_update.get()
+    if update_metrics is not None:
+        update_metrics.db_queries += 1
+        update_metrics.db_time += elapsed
+
+
+def handler_name(handler, event, data: dict) -> str:
+    callback = handler.callback
+    index = getattr(callback, "__self__", None)
+    if isinstance(index, CallbackIndex):
+        entry = index.resolve(getattr(event, "data", None), data.get("raw_state"))
+        return entry.handler.__name__ if entry else "unhandled"
+    return getattr(callback, "__name__", type(callback).__name__)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware апдейтов: время, ошибки, запросы к БД и Bot API"""
+
+    async def __call__(self, handler, event, data):
+        update_metrics = UpdateMetrics()
+        token = current_update.set(update_metrics)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.inc(handler=update_metrics.handler, error=type(e).__name__)
+            raise
+        finally:
+            current_update.reset(token)
+            name = update_metrics.handler
+            HANDLER_DURATION.observe(time.perf_counter() - started, handler=name)
+            DB_QUERIES_PER_UPDATE.observe(update_metrics.db_queries, handler=name)
+            DB_TIME_PER_UPDATE.observe(update_metrics.db_time, handler=name)
+            API_CALLS_PER_UPDATE.observe(update_metrics.api_calls, handler=name)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Внутренний middleware: запоминает, какой обработчик выбран для апдейта"""
+
+    async def __call__(self, handler, event, data):
+        update_metrics = current_update.get()
+        if update_metrics is not None:
+            update_metrics.handler = handler_name(data["handler"], event, data)
+        return await handler(event, data)
+
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        update_metrics = current_update.get()
+        if update_metrics is not None:
+            update_metrics.api_calls += 1
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            API_ERRORS.inc(method=name, error=type(e).__name__)
+            raise
+        finally:
+            API_DURATION.observe(time.perf_counter() - started, method=name)
+
+
+def instrument_bot_session(session):
+    session.middleware(RequestMetricsMiddleware())
+
+
+def setup_metrics(dp, bot):
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    dp.message.middleware(HandlerNameMiddleware())
+    dp.callback_query.middleware(HandlerNameMiddleware())
+    instrument_bot_session(bot.session)
+
+
+async def monitor_event_loop_lag(interval: float = LOOP_LAG_INTERVAL):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        LOOP_LAG.set(lag)
+        LOOP_LAG_HISTOGRAM.observe(lag)
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render_metrics(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+async def start_metrics_server(port: int, host: str = "0.0.0.0") -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+    return runner
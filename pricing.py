@@ -0,0 +1,95 @@
+import re
+
+from sqlalchemy import func, cast, insert, select, update, Integer, literal
+
+from db import Type, Product, Cart, PriceChangeBatch, PriceChangeItem, refresh_cart_summaries
+
+PRICE_CHANGE_RE = re.compile(r"^([+-])\s*(\d+(?:[.,]\d+)?)\s*(%?)$")
+
+
+def parse_price_change(value: str):
+    """Разбирает "+10%", "-5%", "+500", "-300" в (тип, число) или возвращает None"""
+    match = PRICE_CHANGE_RE.match(value.strip())
+    if not match:
+        return None
+    sign, number, percent = match.groups()
+    number = float(number.replace(",", "."))
+    if sign == "-":
+        number = -number
+    if percent:
+        return ("percent", number) if number > -100 else None
+    return "absolute", int(number)
+
+
+def format_price_change(kind: str, value) -> str:
+    if kind == "percent":
+        return f"{value:+g}%"
+    return f"{value:+d} руб."
+
+
+def products_in_scope(category_id: int, type_id: int = None):
+    """Условие на товары типа или всей категории"""
+    if type_id:
+        return Product.type_id == type_id
+    return Product.type_id.in_(select(Type.id).where(Type.category_id == category_id))
+
+
+def new_price_expr(kind: str, value):
+    if kind == "percent":
+        price = cast(func.round(Product.price * (100 + value) / 100.0), Integer)
+    else:
+        price = Product.price + value
+    # Цена не может стать меньше 1 рубля (max с двумя аргументами в SQLite — скалярная функция)
+    return func.max(price, 1)
+
+
+def count_products_in_scope(db, category_id: int, type_id: int = None) -> int:
+    return db.query(func.count(Product.id)).filter(products_in_scope(category_id, type_id)).scalar()
+
+
+def carts_with_batch_products(batch_id: int):
+    """SELECT пользователей, в корзинах которых есть товары из партии изменения цен"""
+    return select(Cart.user_id).where(
+        Cart.product_id.in_(select(PriceChangeItem.product_id).where(PriceChangeItem.batch_id == batch_id))
+    )
+
+
+def apply_price_change(db, scope: str, category_id: int, type_id, kind: str, value):
+    """Меняет цены одним UPDATE, предварительно сохранив старые цены для отмены"""
+    batch = PriceChangeBatch(scope=scope, change=format_price_change(kind, value))
+    db.add(batch)
+    db.flush()
+
+    condition = products_in_scope(category_id, type_id)
+    db.execute(insert(PriceChangeItem).from_select(
+        ['batch_id', 'product_id', 'old_price'],
+        select(literal(batch.id), Product.id, Product.price).where(condition)
+    ))
+    result = db.execute(
+        update(Product).where(condition).values(price=new_price_expr(kind, value)),
+        execution_options={"synchronize_session": False}
+    )
+    batch.products_count = result.rowcount
+    refresh_cart_summaries(db, carts_with_batch_products(batch.id))
+    return batch
+
+
+def undo_price_change(db, batch_id: int):
+    """Возвращает цены из сохраненной партии. Возвращает число товаров или None, если отмена невозможна."""
+    batch = db.query(PriceChangeBatch).filter(PriceChangeBatch.id == batch_id).first()
+    if not batch or batch.undone:
+        return None
+
+    old_price = select(PriceChangeItem.old_price).where(
+        PriceChangeItem.batch_id == batch_id,
+        PriceChangeItem.product_id == Product.id
+    ).scalar_subquery()
+    result = db.execute(
+        update(Product).where(
+            Product.id.in_(select(PriceChangeItem.product_id).where(PriceChangeItem.batch_id == batch_id))
+        ).values(price=old_price),
+        execution_options={"synchronize_session": False}
+    )
+    batch.undone = 1
+    refresh_cart_summaries(db, carts_with_batch_products(batch_id))
+    return result.rowcount
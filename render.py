@@ -0,0 +1,117 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from cache import prefetch_products
+from metrics import Counter
+
+# Сколько карточек товаров предзагружать после одной отрисовки
+PREFETCH_MAX_PRODUCTS = 20
+
+RENDERS_SUPERSEDED = Counter("bot_renders_superseded_total",
+                             "Отрисовки экранов, пропущенные из-за более нового запроса", ("screen",))
+MENU_EDITS_SKIPPED = Counter("bot_menu_edits_skipped_total",
+                             "Редактирования меню, не отправленные в Telegram: содержимое не изменилось",
+                             ("reason",))
+
+
+def content_digest(text: str, reply_markup) -> str:
+    """Хеш текста и клавиатуры сообщения, чтобы не отправлять одинаковые правки"""
+    digest = hashlib.blake2b(text.encode(), digest_size=16)
+    if reply_markup is not None:
+        digest.update(reply_markup.model_dump_json(exclude_none=True).encode())
+    return digest.hexdigest()
+
+
+class RenderCoalescer:
+    """Схлопывает отрисовки экранов одного чата.
+
+    Отрисовки в чате идут по очереди. Каждый запрос получает номер
+    поколения; когда подходит его очередь, он выполняется, только если за
+    это время не пришел более новый запрос. Двойное нажатие "Вперед ➡️"
+    отрисует одну, последнюю страницу.
+    """
+
+    def __init__(self):
+        self._generations: Dict[int, int] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._waiting: Dict[int, int] = {}
+
+    @asynccontextmanager
+    async def slot(self, chat_id: int):
+        generation = self._generations.get(chat_id, 0) + 1
+        self._generations[chat_id] = generation
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        self._waiting[chat_id] = self._waiting.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                yield self._generations[chat_id] == generation
+        finally:
+            self._waiting[chat_id] -= 1
+            if not self._waiting[chat_id]:
+                del self._waiting[chat_id], self._locks[chat_id], self._generations[chat_id]
+
+
+coalescer = RenderCoalescer()
+
+
+class Prefetcher:
+    """Фоновая предзагрузка карточек, которые пользователь, скорее всего, откроет следующими.
+
+    На чат приходится не больше одной задачи: новая отрисовка в чате
+    отменяет предзагрузку, запущенную для предыдущего экрана.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def schedule(self, chat_id: int, product_ids):
+        self.cancel(chat_id)
+        product_ids = list(product_ids)[:PREFETCH_MAX_PRODUCTS]
+        if not product_ids:
+            return
+        # Пустой контекст: запросы предзагрузки не должны попадать в метрики и логи апдейта
+        task = asyncio.create_task(prefetch_products(product_ids), name=f"prefetch-{chat_id}",
+                                   context=contextvars.Context())
+        self._tasks[chat_id] = task
+        task.add_done_callback(lambda done: self._forget(chat_id, done))
+
+    def _forget(self, chat_id: int, task: asyncio.Task):
+        if self._tasks.get(chat_id) is task:
+            del self._tasks[chat_id]
+
+    def cancel(self, chat_id: int):
+        task = self._tasks.pop(chat_id, None)
+        if task:
+            task.cancel()
+
+    async def wait(self):
+        """Дожидается запущенных предзагрузок (для офлайн-инструментов)"""
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    def cancel_all(self):
+        for chat_id in list(self._tasks):
+            self.cancel(chat_id)
+
+
+prefetcher = Prefetcher()
+
+
+def coalesced(screen: str):
+    """Декоратор функции отрисовки, первый аргумент которой - callback или chat_id"""
+    def decorator(render):
+        @functools.wraps(render)
+        async def wrapper(target, *args, **kwargs):
+            chat_id = target if isinstance(target, int) else target.message.chat.id
+            # Пользователь ушел с экрана - предзагрузка для него больше не нужна
+            prefetcher.cancel(chat_id)
+            async with coalescer.slot(chat_id) as is_latest:
+                if not is_latest:
+                    RENDERS_SUPERSEDED.inc(screen=screen)
+                    return None
+                return await render(target, *args, **kwargs)
+        return wrapper
+    return decorator
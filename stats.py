@@ -0,0 +1,150 @@
+from datetime import date, timedelta
+
+from sqlalchemy import func, delete, insert, select, case
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from archive import all_orders, all_order_items
+from db import SalesDaily, SalesDailyProduct
+
+STATS_PERIODS = [
+    ("📅 Сегодня", 1),
+    ("🗓️ 7 дней", 7),
+    ("📆 30 дней", 30),
+]
+
+TOP_PRODUCTS_LIMIT = 5
+
+
+def order_day(created_at: int) -> str:
+    return date.fromtimestamp(created_at).isoformat()
+
+
+def record_order(db, order, items):
+    """Добавляет новый заказ в агрегаты. Вызывается в транзакции оформления заказа."""
+    day = order_day(order.created_at)
+
+    stmt = sqlite_insert(SalesDaily).values(day=day, orders_count=1, revenue=order.total_amount,
+                                            completed_count=0, completed_revenue=0)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[SalesDaily.day],
+        set_={
+            'orders_count': SalesDaily.orders_count + 1,
+            'revenue': SalesDaily.revenue + stmt.excluded.revenue
+        }
+    ))
+
+    stmt = sqlite_insert(SalesDailyProduct)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[SalesDailyProduct.day, SalesDailyProduct.product_id],
+        set_={
+            'product_name': stmt.excluded.product_name,
+            'quantity': SalesDailyProduct.quantity + stmt.excluded.quantity,
+            'revenue': SalesDailyProduct.revenue + stmt.excluded.revenue
+        }
+    ), [
+        {
+            'day': day,
+            'product_id': item['product_id'],
+            'product_name': item['product_name'],
+            'quantity': item['quantity'],
+            'revenue': item['total']
+        }
+        for item in items
+    ])
+
+
+def record_completion(db, order):
+    """Учитывает выполнение заказа. Вызывается в той же транзакции, что и смена статуса,
+    и только если UPDATE статуса действительно изменил строку."""
+    db.execute(
+        SalesDaily.__table__.update()
+        .where(SalesDaily.day == order_day(order.created_at))
+        .values(completed_count=SalesDaily.completed_count + 1,
+                completed_revenue=SalesDaily.completed_revenue + order.total_amount)
+    )
+
+
+def rebuild_sales_stats(db):
+    """Полный пересчет агрегатов двумя INSERT ... SELECT ... GROUP BY по рабочим и архивным заказам"""
+    db.execute(delete(SalesDaily))
+    db.execute(delete(SalesDailyProduct))
+
+    orders = all_orders("id", "total_amount", "status", "created_at")
+    items = all_order_items("order_id", "product_id", "product_name", "product_price", "quantity")
+    # Локальный день заказа в формате YYYY-MM-DD из created_at (UTC epoch)
+    day = func.date(orders.c.created_at, 'unixepoch', 'localtime')
+
+    is_completed = case((orders.c.status == "completed", 1), else_=0)
+    db.execute(insert(SalesDaily).from_select(
+        ['day', 'orders_count', 'revenue', 'completed_count', 'completed_revenue'],
+        select(
+            day,
+            func.count(orders.c.id),
+            func.coalesce(func.sum(orders.c.total_amount), 0),
+            func.sum(is_completed),
+            func.coalesce(func.sum(orders.c.total_amount * is_completed), 0)
+        ).group_by(day)
+    ))
+    db.execute(insert(SalesDailyProduct).from_select(
+        ['day', 'product_id', 'product_name', 'quantity', 'revenue'],
+        select(
+            day,
+            items.c.product_id,
+            func.max(items.c.product_name),
+            func.sum(items.c.quantity),
+            func.sum(items.c.product_price * items.c.quantity)
+        ).join(orders, orders.c.id == items.c.order_id)
+        .where(items.c.product_id.isnot(None))
+        .group_by(day, items.c.product_id)
+    ))
+
+
+def get_sales_report(db, days: int, today: date = None):
+    """Сводка за последние days дней из агрегатных таблиц"""
+    today = today or date.today()
+    start_day = (today - timedelta(days=days - 1)).isoformat()
+
+    totals = db.query(
+        func.coalesce(func.sum(SalesDaily.orders_count), 0),
+        func.coalesce(func.sum(SalesDaily.revenue), 0),
+        func.coalesce(func.sum(SalesDaily.completed_count), 0),
+        func.coalesce(func.sum(SalesDaily.completed_revenue), 0)
+    ).filter(SalesDaily.day >= start_day).one()
+
+    top_products = db.query(
+        func.max(SalesDailyProduct.product_name),
+        func.sum(SalesDailyProduct.quantity).label("quantity"),
+        func.sum(SalesDailyProduct.revenue)
+    ).filter(
+        SalesDailyProduct.day >= start_day
+    ).group_by(SalesDailyProduct.product_id).order_by(
+        func.sum(SalesDailyProduct.quantity).desc()
+    ).limit(TOP_PRODUCTS_LIMIT).all()
+
+    orders_count, revenue, completed_count, completed_revenue = totals
+    return {
+        'orders_count': orders_count,
+        'revenue': revenue,
+        'average': revenue // orders_count if orders_count else 0,
+        'completed_count': completed_count,
+        'completed_revenue': completed_revenue,
+        'top_products': top_products
+    }
+
+
+def format_sales_report(db):
+    text = "📊 Статистика продаж\n"
+    for title, days in STATS_PERIODS:
+        report = get_sales_report(db, days)
+        text += (
+            f"\n{title}\n"
+            f"📦 Заказов: {report['orders_count']}\n"
+            f"💰 Выручка: {report['revenue']} руб.\n"
+            f"🧺 Средний чек: {report['average']} руб.\n"
+            f"✅ Выполнено: {report['completed_count']} на {report['completed_revenue']} руб.\n"
+        )
+        if report['top_products']:
+            text += "🏆 Топ товаров:\n"
+            for name, quantity, product_revenue in report['top_products']:
+                text += f"• {name} — {quantity} шт., {product_revenue} руб.\n"
+    return text
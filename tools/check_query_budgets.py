@@ -0,0 +1,150 @@
+"""Проверка бюджетов SQL-запросов обработчиков.
+
+Каждый шаг пользовательского сценария подаётся в main.dp через фейковый
+Bot API, SQL-запросы апдейта считаются через before_cursor_execute
+(фоновые задачи вроде предзагрузки карточек не учитываются). Сценарий
+прогоняется на маленьком и на большом каталоге/корзине: число запросов
+не должно превышать бюджет и не должно расти вместе с объёмом данных
+(признак N+1). При нарушении скрипт завершается с кодом 1.
+
+Запуск из корня репозитория:
+    python tools/check_query_budgets.py
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import bind_database, use_fake_api, LoadStats, wait_background  # noqa: E402
+from load_test import VirtualUser, seed_catalog  # noqa: E402
+import main  # noqa: E402
+from cache import warm_up  # noqa: E402
+from db import Base, SessionLocal  # noqa: E402
+from metrics import current_update  # noqa: E402
+from render import prefetcher  # noqa: E402
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+# Максимум SQL-запросов на один апдейт
+QUERY_BUDGETS = {
+    "show_catalog": 0,
+    "show_category_types": 0,
+    "show_type_products": 0,
+    "show_product_details": 2,
+    "start_add_to_cart": 1,
+    "process_quantity": 3,
+    "view_cart": 1,
+    "remove_from_cart": 2,
+    "clear_cart": 0,
+    "start_checkout": 1,
+    "process_order": 7,
+}
+
+# (категорий, типов в категории, товаров в типе, позиций в корзине)
+DATA_SIZES = {
+    "small": (2, 2, 3, 2),
+    "large": (40, 10, 60, 12),
+}
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self.on_execute)
+
+    def on_execute(self, *args):
+        if current_update.get() is not None:
+            self.count += 1
+
+
+async def run_scenario(user: VirtualUser, counter: QueryCounter, cart_lines: int) -> dict:
+    counts = {}
+
+    async def step(name: str, update):
+        # Предзагрузка прошлого шага должна закончиться, иначе результат зависит от гонки
+        await prefetcher.wait()
+        before = counter.count
+        await main.dp.feed_update(main.bot, update)
+        counts[name] = counter.count - before
+
+    await step("show_catalog", user.callback_update("catalog"))
+    await step("show_category_types", user.callback_update(main.ShowCategory(category_id=1).pack()))
+    await step("show_type_products", user.callback_update(main.ShowType(type_id=1, page=0).pack()))
+    await step("show_product_details", user.callback_update(
+        main.ShowProduct(product_id=1, type_id=1, page=0).pack()))
+
+    # Наполняем корзину: бюджет process_quantity меряется на последней позиции
+    for product_id in range(1, cart_lines + 1):
+        await step("start_add_to_cart", user.callback_update(main.AddToCart(product_id=product_id, page=0).pack()))
+        await step("process_quantity", user.message_update("2"))
+
+    await step("view_cart", user.callback_update("view_cart"))
+
+    await step("remove_from_cart", user.callback_update(main.RemoveFromCart(product_id=1).pack()))
+
+    await step("start_checkout", user.callback_update("checkout"))
+    await step("process_order", user.message_update("+79990000000"))
+
+    await step("start_add_to_cart", user.callback_update(main.AddToCart(product_id=1, page=0).pack()))
+    await step("process_quantity", user.message_update("1"))
+    await step("clear_cart", user.callback_update("clear_cart"))
+    return counts
+
+
+async def measure(size: str, tmp: str) -> dict:
+    categories, types_per_category, products_per_type, cart_lines = DATA_SIZES[size]
+    engine = bind_database(os.path.join(tmp, f"{size}.db"))
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        seed_catalog(db, categories, types_per_category, products_per_type, media_per_product=3)
+    finally:
+        db.close()
+    await warm_up()
+
+    counter = QueryCounter(engine)
+    try:
+        return await run_scenario(VirtualUser(20_000_000 + len(size), LoadStats()), counter, cart_lines)
+    finally:
+        engine.dispose()
+
+
+async def run() -> int:
+    api = FakeBotAPI()
+    use_fake_api(main.bot, await api.start())
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            results = {size: await measure(size, tmp) for size in DATA_SIZES}
+    finally:
+        await wait_background()
+        await main.bot.session.close()
+        await api.stop()
+
+    failures = 0
+    print(f"{'обработчик':<24}{'бюджет':>8}" + "".join(f"{size:>8}" for size in DATA_SIZES))
+    for name, budget in QUERY_BUDGETS.items():
+        counts = [results[size].get(name) for size in DATA_SIZES]
+        problems = []
+        if any(count is None for count in counts):
+            problems.append("не вызывался")
+        else:
+            if max(counts) > budget:
+                problems.append("превышен бюджет")
+            if counts[-1] > counts[0]:
+                problems.append("растёт с объёмом данных")
+        failures += bool(problems)
+        print(f"{name:<24}{budget:>8}" + "".join(f"{'-' if c is None else c:>8}" for c in counts)
+              + (f"  <- {', '.join(problems)}" if problems else ""))
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+    # Фейковые callback-сообщения не существуют на фейковом API, предупреждения об их удалении не нужны
+    logging.getLogger("main").setLevel(logging.ERROR)
+    sys.exit(asyncio.run(run()))
@@ -0,0 +1,240 @@
+"""Локальная замена Telegram Bot API для нагрузочных тестов без сети.
+
+Поддерживает методы, которые использует бот: getMe, getUpdates, sendMessage,
+editMessageText, editMessageReplyMarkup, sendPhoto, sendVideo, sendDocument,
+sendMediaGroup, deleteMessage, answerCallbackQuery, getFile и скачивание файлов.
+Остальные методы отвечают {"ok": true, "result": true}.
+
+Задержка ответа и доля ответов 429 настраиваются. Для long polling
+обновления кладутся в очередь через POST /_control/updates; getUpdates
+подтверждает их параметром offset, как настоящий API.
+
+Отдельный запуск:
+    python tools/fake_bot_api.py --port 8081 --latency-ms 30 --rate-limit 0.01
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_limit_ratio: float = 0.0,
+                 retry_after: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+
+        self.calls = Counter()
+        self.rate_limited = Counter()
+        self.messages = {}
+        # Неподтвержденные апдейты: как в Telegram, getUpdates с offset удаляет те, у кого id < offset
+        self.pending_updates = []
+        self.confirmed_offset = 0
+        self._update_arrived = asyncio.Event()
+        self._message_id = 0
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_route("*", "/bot{token}/{method}", self.handle_method)
+        self.app.router.add_get("/file/bot{token}/{path:.*}", self.handle_file)
+        self.app.router.add_post("/_control/updates", self.handle_push_updates)
+        self.app.router.add_get("/_control/stats", self.handle_stats)
+
+        self.methods = {
+            "getme": self.get_me,
+            "getupdates": self.get_updates,
+            "sendmessage": self.send_message,
+            "sendphoto": self.send_photo,
+            "sendvideo": self.send_message,
+            "senddocument": self.send_message,
+            "sendmediagroup": self.send_media_group,
+            "editmessagetext": self.edit_message_text,
+            "editmessagereplymarkup": self.edit_message_reply_markup,
+            "deletemessage": self.delete_message,
+            "getfile": self.get_file,
+        }
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запускает сервер и возвращает базовый URL"""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    @staticmethod
+    async def read_params(request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        params = {}
+        for key, value in (await request.post()).items():
+            if isinstance(value, web.FileField):
+                params[key] = f"upload:{value.filename}"
+                continue
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                params[key] = value
+        params.update(request.query)
+        return params
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await self.read_params(request)
+        self.calls[method] += 1
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+
+        if method.lower() != "getupdates" and random.random() < self.rate_limit_ratio:
+            self.rate_limited[method] += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after}
+            }, status=429)
+
+        handler = self.methods.get(method.lower())
+        try:
+            result = await handler(params) if handler else True
+        except TelegramError as e:
+            return web.json_response({"ok": False, "error_code": e.code, "description": e.description},
+                                     status=e.code)
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_file(self, request: web.Request) -> web.Response:
+        self.calls["fileDownload"] += 1
+        return web.Response(body=b"\xff\xd8fake-file-" + request.match_info["path"].encode())
+
+    async def handle_push_updates(self, request: web.Request) -> web.Response:
+        updates = await request.json()
+        for update in updates if isinstance(updates, list) else [updates]:
+            self.push_update(update)
+        return web.json_response({"ok": True, "queued": len(self.pending_updates)})
+
+    def push_update(self, update: dict):
+        self.pending_updates.append(update)
+        self._update_arrived.set()
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"calls": dict(self.calls), "rate_limited": dict(self.rate_limited)})
+
+    def new_message(self, chat_id, **fields) -> dict:
+        self._message_id += 1
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "from": BOT_USER,
+        }
+        message.update({key: value for key, value in fields.items() if value is not None})
+        self.messages[(int(chat_id), self._message_id)] = message
+        return message
+
+    async def get_me(self, params):
+        return BOT_USER
+
+    async def get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        if offset > self.confirmed_offset:
+            self.confirmed_offset = offset
+            self.pending_updates = [u for u in self.pending_updates if u["update_id"] >= offset]
+
+        timeout = float(params.get("timeout") or 0)
+        if not self.pending_updates and timeout:
+            self._update_arrived.clear()
+            try:
+                await asyncio.wait_for(self._update_arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        return self.pending_updates[:int(params.get("limit") or 100)]
+
+    async def send_message(self, params):
+        return self.new_message(
+            params["chat_id"],
+            text=params.get("text"),
+            caption=params.get("caption"),
+            reply_markup=params.get("reply_markup")
+        )
+
+    async def send_photo(self, params):
+        photo = params.get("photo")
+        # загруженному файлу выдаётся новый file_id, как это делает Telegram
+        file_id = f"file-{self._message_id + 1}" if str(photo).startswith(("upload:", "attach://")) else photo
+        message = await self.send_message(params)
+        message["photo"] = [{"file_id": file_id, "file_unique_id": file_id[-16:], "width": 1280, "height": 960}]
+        return message
+
+    async def send_media_group(self, params):
+        media = params.get("media") or []
+        return [self.new_message(params["chat_id"], caption=item.get("caption")) for item in media]
+
+    def find_message(self, params) -> dict:
+        message = self.messages.get((int(params["chat_id"]), int(params["message_id"])))
+        if message is None:
+            raise TelegramError(400, "Bad Request: message to edit not found")
+        return message
+
+    async def edit_message_text(self, params):
+        message = self.find_message(params)
+        markup = params.get("reply_markup")
+        if message.get("text") == params.get("text") and message.get("reply_markup") == markup:
+            raise TelegramError(400, "Bad Request: message is not modified: specified new message content "
+                                     "and reply markup are exactly the same as a current content and reply "
+                                     "markup of the message")
+        message["text"] = params.get("text")
+        message["reply_markup"] = markup
+        return message
+
+    async def edit_message_reply_markup(self, params):
+        message = self.find_message(params)
+        message["reply_markup"] = params.get("reply_markup")
+        return message
+
+    async def delete_message(self, params):
+        if self.messages.pop((int(params["chat_id"]), int(params["message_id"])), None) is None:
+            raise TelegramError(400, "Bad Request: message to delete not found")
+        return True
+
+    async def get_file(self, params):
+        file_id = params["file_id"]
+        return {"file_id": file_id, "file_unique_id": file_id[:16], "file_size": 16,
+                "file_path": f"files/{file_id}.jpg"}
+
+
+class TelegramError(Exception):
+    def __init__(self, code: int, description: str):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="доля ответов 429, от 0 до 1")
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.latency_ms / 1000, args.jitter_ms / 1000, args.rate_limit)
+    web.run_app(api.app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Общие части офлайн-инструментов: подмена базы и Bot API, сбор и вывод задержек."""
+import os
+import sys
+import time
+from collections import defaultdict
+
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+from cache import invalidate_catalog, invalidate_sections, invalidate_products  # noqa: E402
+from cart_store import cart_store  # noqa: E402
+from lifecycle import wait_for_idle  # noqa: E402
+from metrics import DB_QUERIES_PER_UPDATE, instrument_bot_session  # noqa: E402
+
+
+def bind_database(path: str):
+    """Переключает бота на SQLite-файл path и возвращает engine"""
+    # Пул как в db.get_engine(): QueuePool при десятках пользователей блокирует event loop
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, poolclass=NullPool)
+    db.set_engine(engine)
+    invalidate_catalog()
+    invalidate_sections()
+    invalidate_products()
+    cart_store.forget()
+    return engine
+
+
+async def wait_background(timeout: float = 10.0):
+    """Дожидается фоновых задач бота (уведомлений админам) перед закрытием фейкового API"""
+    await wait_for_idle(time.monotonic() + timeout)
+
+
+def use_fake_api(bot, base_url: str):
+    bot.session = AiohttpSession(api=TelegramAPIServer.from_base(base_url))
+    instrument_bot_session(bot.session)
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    async def measure(self, name: str, coro):
+        started = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            self.errors[name][type(e).__name__] += 1
+        self.latencies[name].append(time.perf_counter() - started)
+
+
+def percentile(sorted_values, q: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def average_db_queries() -> dict:
+    """Среднее число SQL-запросов на апдейт по обработчикам из metrics"""
+    return {key[0]: total / count for key, (_, total, count) in DB_QUERIES_PER_UPDATE.values.items() if count}
+
+
+def print_report(stats: LoadStats, elapsed: float, api):
+    total = sum(len(values) for values in stats.latencies.values())
+    print(f"\nОбновлений: {total} за {elapsed:.2f} с -> {total / elapsed:.1f} обновлений/с")
+    print(f"{'обработчик':<40}{'кол-во':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'ошибки':>8}{'SQL/апд':>9}")
+    db_queries = average_db_queries()
+    for name, values in stats.latencies.items():
+        values.sort()
+        errors = sum(stats.errors.get(name, {}).values())
+        print(f"{name:<40}{len(values):>8}{percentile(values, 50) * 1000:>10.1f}"
+              f"{percentile(values, 95) * 1000:>10.1f}{percentile(values, 99) * 1000:>10.1f}{errors:>8}{db_queries.get(name, 0):>9.1f}")
+
+    for name, errors in stats.errors.items():
+        if errors:
+            print(f"  {name}: " + ", ".join(f"{kind} x{count}" for kind, count in errors.items()))
+
+    print("\nВызовы Bot API: " + ", ".join(f"{method}={count}" for method, count in api.calls.most_common()))
+    if api.rate_limited:
+        print("Ответы 429: " + ", ".join(f"{method}={count}" for method, count in api.rate_limited.most_common()))
@@ -0,0 +1,178 @@
+"""Офлайн нагрузочный тест бота: N пользователей параллельно проходят сценарий
+каталог -> категория -> тип -> товар -> в корзину -> количество -> корзина ->
+оформление -> телефон.
+
+Обновления подаются прямо в main.dp, а все запросы бота уходят в локальный
+FakeBotAPI (tools/fake_bot_api.py). База - временный SQLite-файл с
+синтетическим каталогом, рабочая doors_bot.db не затрагивается.
+
+Запуск из корня репозитория:
+    python tools/load_test.py --users 50 --rounds 3 --latency-ms 30 --rate-limit 0.01
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from aiogram.types import Update, CallbackQuery, Message, Chat, User
+from sqlalchemy import insert
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import LoadStats, bind_database, print_report, use_fake_api, wait_background  # noqa: E402
+import main  # noqa: E402
+from cache import warm_up  # noqa: E402
+from db import Base, SessionLocal, Category, Type, Product, ProductMedia, refresh_product_covers  # noqa: E402
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+FIRST_USER_ID = 10_000_000
+
+
+def seed_catalog(db, categories: int, types_per_category: int, products_per_type: int, media_per_product: int):
+    type_rows, product_rows, media_rows = [], [], []
+    for category_id in range(1, categories + 1):
+        for t in range(types_per_category):
+            type_id = len(type_rows) + 1
+            type_rows.append({"id": type_id, "name": f"Тип {type_id}", "category_id": category_id})
+            for p in range(products_per_type):
+                product_id = len(product_rows) + 1
+                product_rows.append({"id": product_id, "name": f"Дверь {product_id}", "description": "Тест",
+                                     "price": 1000 + product_id, "type_id": type_id})
+                media_rows.extend({"product_id": product_id, "file_id": f"photo-{product_id}-{m}",
+                                   "file_path": "", "media_type": "photo"} for m in range(media_per_product))
+
+    db.execute(insert(Category), [{"id": i, "name": f"Категория {i}"} for i in range(1, categories + 1)])
+    db.execute(insert(Type), type_rows)
+    db.execute(insert(Product), product_rows)
+    db.execute(insert(ProductMedia), media_rows)
+    refresh_product_covers(db)
+    db.commit()
+    return type_rows, product_rows
+
+
+class VirtualUser:
+    update_id = 0
+
+    def __init__(self, user_id: int, stats: LoadStats):
+        self.user = User(id=user_id, is_bot=False, first_name=f"User{user_id}")
+        self.chat = Chat(id=user_id, type="private")
+        self.stats = stats
+        self.message_id = 0
+
+    @classmethod
+    def next_update_id(cls) -> int:
+        cls.update_id += 1
+        return cls.update_id
+
+    def callback_update(self, data: str) -> Update:
+        self.message_id += 1
+        message = Message(message_id=self.message_id, date=datetime.now(), chat=self.chat)
+        update_id = self.next_update_id()
+        return Update(update_id=update_id, callback_query=CallbackQuery(
+            id=str(update_id), from_user=self.user, chat_instance=str(self.user.id), data=data, message=message
+        ))
+
+    def message_update(self, text: str) -> Update:
+        self.message_id += 1
+        return Update(update_id=self.next_update_id(), message=Message(
+            message_id=self.message_id, date=datetime.now(), chat=self.chat, from_user=self.user, text=text
+        ))
+
+    async def step(self, name: str, update: Update):
+        await self.stats.measure(name, main.dp.feed_update(main.bot, update))
+
+    async def click(self, data: str):
+        entry = main.user_callbacks.resolve(data)
+        await self.step(entry.handler.__name__ if entry else data, self.callback_update(data))
+
+    async def send(self, name: str, text: str):
+        await self.step(name, self.message_update(text))
+
+    async def run_scenario(self, type_rows, product_rows, think_time: float):
+        type_row = random.choice(type_rows)
+        product = random.choice([p for p in product_rows if p["type_id"] == type_row["id"]])
+        steps = [
+            lambda: self.click("catalog"),
+            lambda: self.click(main.ShowCategory(category_id=type_row["category_id"]).pack()),
+            lambda: self.click(main.ShowType(type_id=type_row["id"], page=0).pack()),
+            lambda: self.click(main.ShowProduct(product_id=product["id"], type_id=type_row["id"], page=0).pack()),
+            lambda: self.click(main.AddToCart(product_id=product["id"], page=0).pack()),
+            lambda: self.send("process_quantity", str(random.randint(1, 5))),
+            lambda: self.click("view_cart"),
+            lambda: self.click("checkout"),
+            lambda: self.send("process_order", "+79990000000"),
+        ]
+        for step in steps:
+            await step()
+            if think_time:
+                await asyncio.sleep(random.uniform(0, think_time))
+
+
+async def run(args):
+    api = FakeBotAPI(args.latency_ms / 1000, args.jitter_ms / 1000, args.rate_limit)
+    base_url = await api.start()
+    use_fake_api(main.bot, base_url)
+
+    stats = LoadStats()
+    users = [VirtualUser(FIRST_USER_ID + i, stats) for i in range(args.users)]
+
+    db = SessionLocal()
+    try:
+        type_rows, product_rows = seed_catalog(db, args.categories, args.types, args.products, args.media)
+    finally:
+        db.close()
+    await warm_up()
+
+    async def user_loop(user: VirtualUser):
+        for _ in range(args.rounds):
+            await user.run_scenario(type_rows, product_rows, args.think_ms / 1000)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(user_loop(user) for user in users))
+        elapsed = time.perf_counter() - started
+    finally:
+        await wait_background()
+        await main.bot.session.close()
+        await api.stop()
+
+    print_report(stats, elapsed, api)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="одновременных пользователей")
+    parser.add_argument("--rounds", type=int, default=3, help="прохождений сценария на пользователя")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="максимальная пауза между шагами")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="задержка ответа Bot API")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="доля ответов 429, от 0 до 1")
+    parser.add_argument("--categories", type=int, default=5)
+    parser.add_argument("--types", type=int, default=4, help="типов в категории")
+    parser.add_argument("--products", type=int, default=30, help="товаров в типе")
+    parser.add_argument("--media", type=int, default=3, help="медиафайлов у товара")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def run_load_test():
+    args = parse_args()
+    random.seed(args.seed)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = bind_database(os.path.join(tmp, "load.db"))
+        Base.metadata.create_all(bind=engine)
+        try:
+            asyncio.run(run(args))
+        finally:
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    run_load_test()
@@ -0,0 +1,129 @@
+"""Проигрывает записанный трейс апдейтов (config.TRACE_FILE) на фейковом Bot API.
+
+Апдейты одного чата подаются в dp.feed_update строго по очереди, разные чаты
+обрабатываются параллельно, как при polling. Интервалы между апдейтами
+сохраняются и делятся на --speed; --speed 0 подаёт апдейты без пауз.
+Бот работает с копией базы, исходный файл не изменяется.
+
+Запуск из корня репозитория:
+    python tools/replay_trace.py updates.jsonl --db doors_bot.db --speed 10
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from aiogram.types import Update
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import ROOT, LoadStats, bind_database, print_report, use_fake_api, wait_background  # noqa: E402
+import main  # noqa: E402
+from cache import warm_up  # noqa: E402
+from admin import admin_callbacks  # noqa: E402
+from db import create_tables  # noqa: E402
+from fake_bot_api import FakeBotAPI  # noqa: E402
+from update_trace import read_trace  # noqa: E402
+
+
+def update_chat_id(update: Update) -> int:
+    if update.message:
+        return update.message.chat.id
+    if update.callback_query:
+        if update.callback_query.message:
+            return update.callback_query.message.chat.id
+        return update.callback_query.from_user.id
+    return 0
+
+
+async def handler_name(update: Update) -> str:
+    """Имя для отчёта: обработчик callback или состояние FSM, в котором пришло сообщение"""
+    event = update.callback_query or update.message
+    if event is None:
+        return update.event_type
+    state = await main.dp.fsm.get_context(main.bot, update_chat_id(update), event.from_user.id).get_state()
+
+    if update.callback_query:
+        data = update.callback_query.data
+        entry = main.user_callbacks.resolve(data, state) or admin_callbacks.resolve(data, state)
+        return entry.handler.__name__ if entry else f"callback:{(data or '').split(':', 1)[0]}"
+    text = update.message.text or ""
+    if text.startswith("/"):
+        return f"command:{text.split()[0]}"
+    return f"message:{state or update.message.content_type.value}"
+
+
+async def replay(records, speed: float, stats: LoadStats):
+    by_chat = defaultdict(list)
+    first_ts = records[0][0]
+    for ts, update in records:
+        by_chat[update_chat_id(update)].append(((ts - first_ts) / speed if speed else 0.0, update))
+
+    started = time.perf_counter()
+
+    async def chat_worker(chat_updates):
+        for offset, update in chat_updates:
+            delay = offset - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await stats.measure(await handler_name(update), main.dp.feed_update(main.bot, update))
+
+    await asyncio.gather(*(chat_worker(chat_updates) for chat_updates in by_chat.values()))
+    return time.perf_counter() - started
+
+
+async def run(args, records):
+    api = FakeBotAPI(args.latency_ms / 1000, args.jitter_ms / 1000, args.rate_limit)
+    use_fake_api(main.bot, await api.start())
+    await warm_up()
+
+    stats = LoadStats()
+    try:
+        elapsed = await replay(records, args.speed, stats)
+    finally:
+        await wait_background()
+        await main.bot.session.close()
+        await api.stop()
+
+    print_report(stats, elapsed, api)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", help="JSON Lines файл, записанный UpdateRecorder")
+    parser.add_argument("--db", default=os.path.join(ROOT, "doors_bot.db"), help="база, копия которой используется")
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение относительно записи, 0 - без пауз")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="задержка ответа Bot API")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="доля ответов 429, от 0 до 1")
+    return parser.parse_args()
+
+
+def run_replay():
+    args = parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    records = read_trace(args.trace)
+    if not records:
+        print("Трейс пуст")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "replay.db")
+        if os.path.exists(args.db):
+            shutil.copyfile(args.db, db_path)
+        engine = bind_database(db_path)
+        create_tables()
+        try:
+            asyncio.run(run(args, records))
+        finally:
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    run_replay()
@@ -0,0 +1,177 @@
+"""Учения по остановке: SIGTERM посреди оформления заказов.
+
+Бот запускается отдельным процессом через main.main() с настоящим long
+polling к фейковому Bot API и временной базой. У N пользователей уже
+собраны корзины; они нажимают "Оформить заказ" и присылают телефон,
+после чего боту посылается SIGTERM, пока обработчики и уведомления
+админам еще выполняются. Потом проверяется:
+  * процесс завершился сам и с кодом 0;
+  * заказ есть ровно у тех, чей телефон подтвержден через offset
+    (остальные апдейты придут повторно после рестарта, дублей не будет);
+  * у каждого заказа полный состав, корзина очищена;
+  * админы получили уведомление по каждому заказу, хотя часть вызовов
+    Bot API после оформления отвечает 429 (--rate-limit).
+При нарушении скрипт завершается с кодом 1.
+
+Запуск из корня репозитория:
+    python tools/shutdown_drill.py --users 30 --latency-ms 200 --rate-limit 0.05
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from aiogram.types import Update, CallbackQuery, Message, Chat, User
+from sqlalchemy import func, insert
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import bind_database, use_fake_api  # noqa: E402
+from load_test import seed_catalog  # noqa: E402
+from config import ADMIN_IDS  # noqa: E402
+from db import Base, SessionLocal, Cart, Order, OrderItem  # noqa: E402
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+FIRST_USER_ID = 30_000_000
+CART_LINES = 3
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    user = User(id=user_id, is_bot=False, first_name=f"User{user_id}")
+    return Update(update_id=update_id, callback_query=CallbackQuery(
+        id=str(update_id), from_user=user, chat_instance=str(user_id), data=data,
+        message=Message(message_id=1, date=datetime.now(), chat=Chat(id=user_id, type="private"))
+    )).model_dump(mode="json", exclude_none=True)
+
+
+def message_update(update_id: int, user_id: int, text: str) -> dict:
+    user = User(id=user_id, is_bot=False, first_name=f"User{user_id}")
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id, date=datetime.now(), chat=Chat(id=user_id, type="private"), from_user=user, text=text
+    )).model_dump(mode="json", exclude_none=True)
+
+
+def prepare_database(path: str, users: list):
+    engine = bind_database(path)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        seed_catalog(db, 2, 2, 10, 1)
+        db.execute(insert(Cart), [
+            {"user_id": user_id, "product_id": line + 1, "quantity": 2}
+            for user_id in users for line in range(CART_LINES)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+async def wait_until(condition, timeout: float):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+
+async def run_drill(args) -> int:
+    users = [FIRST_USER_ID + i for i in range(args.users)]
+    api = FakeBotAPI(args.latency_ms / 1000)
+    base_url = await api.start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "drill.db")
+        prepare_database(db_path, users)
+
+        bot_process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--child", base_url, db_path], cwd=tmp
+        )
+        try:
+            update_id = 0
+            for user_id in users:
+                update_id += 1
+                api.push_update(callback_update(update_id, user_id, "checkout"))
+            await wait_until(lambda: api.calls["answerCallbackQuery"] >= len(users), 30)
+
+            # 429 включаются после того, как все дошли до ввода телефона: иначе
+            # часть пользователей не попадет в состояние оформления заказа
+            api.rate_limit_ratio = args.rate_limit
+            phone_update_ids = {}
+            for user_id in users:
+                update_id += 1
+                phone_update_ids[user_id] = update_id
+                api.push_update(message_update(update_id, user_id, "+79990000000"))
+            # Часть заказов уже оформляется, уведомления админам в пути
+            await wait_until(lambda: api.calls["sendMessage"] > len(users) + 5, 30)
+            bot_process.send_signal(signal.SIGTERM)
+
+            # Апдейты после SIGTERM не должны потеряться: они остаются неподтвержденными
+            update_id += 1
+            api.push_update(callback_update(update_id, users[0], "catalog"))
+
+            exit_code = await asyncio.to_thread(bot_process.wait, 60)
+        finally:
+            if bot_process.poll() is None:
+                bot_process.kill()
+        await api.stop()
+
+        bind_database(db_path)
+        db = SessionLocal()
+        try:
+            orders = {user_id: order_id for order_id, user_id in db.query(Order.id, Order.user_id)}
+            items_per_order = dict(db.query(OrderItem.order_id, func.count(OrderItem.id)).group_by(OrderItem.order_id))
+            carts_left = {user_id for (user_id,) in db.query(Cart.user_id).distinct()}
+        finally:
+            db.close()
+
+    confirmed = {user_id for user_id, uid in phone_update_ids.items() if uid < api.confirmed_offset}
+    notifications = sum(1 for message in api.messages.values()
+                        if message["chat"]["id"] in ADMIN_IDS and (message.get("text") or "").startswith("📦"))
+
+    problems = []
+    if exit_code != 0:
+        problems.append(f"код завершения бота {exit_code}")
+    if set(orders) != confirmed:
+        problems.append(f"заказы без подтвержденного апдейта: {sorted(set(orders) - confirmed)}, "
+                        f"подтвержденные без заказа: {sorted(confirmed - set(orders))}")
+    incomplete = [order_id for order_id in orders.values() if items_per_order.get(order_id) != CART_LINES]
+    if incomplete:
+        problems.append(f"неполные заказы: {incomplete}")
+    if carts_left & set(orders):
+        problems.append(f"корзины не очищены после заказа: {sorted(carts_left & set(orders))}")
+    if notifications != len(orders) * len(ADMIN_IDS):
+        problems.append(f"уведомлений админам {notifications}, ожидалось {len(orders) * len(ADMIN_IDS)}")
+    if api.pending_updates and api.pending_updates[-1]["update_id"] != update_id:
+        problems.append("апдейт, пришедший после SIGTERM, потерян")
+
+    print(f"Пользователей: {len(users)}, заказов: {len(orders)}, подтвержден offset {api.confirmed_offset}, "
+          f"неподтвержденных апдейтов: {len(api.pending_updates)}, уведомлений админам: {notifications}, "
+          f"ответов 429: {sum(api.rate_limited.values())}")
+    for problem in problems:
+        print(f"  ОШИБКА: {problem}")
+    print("Итог: " + ("есть потери" if problems else "ничего не потеряно"))
+    return 1 if problems else 0
+
+
+def run_child(api_url: str, db_path: str):
+    import main
+
+    bind_database(db_path)
+    use_fake_api(main.bot, api_url)
+    asyncio.run(main.main())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3 and sys.argv[1] == "--child":
+        run_child(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=30)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="задержка ответа Bot API")
+    parser.add_argument("--rate-limit", type=float, default=0.05,
+                        help="доля ответов 429 во время оформления заказов, от 0 до 1")
+    sys.exit(asyncio.run(run_drill(parser.parse_args())))
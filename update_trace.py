@@ -0,0 +1,34 @@
+import json
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+
+class UpdateRecorder(BaseMiddleware):
+    """Дописывает каждый входящий Update в JSON Lines файл.
+
+    Строка файла: {"ts": unix-время получения, "update": Update как JSON}.
+    Такой трейс проигрывается tools/replay_trace.py на фейковом Bot API.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    async def __call__(self, handler, event: Update, data: dict):
+        record = {"ts": time.time(), "update": event.model_dump(mode="json", exclude_none=True)}
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return await handler(event, data)
+
+
+def read_trace(path: str):
+    """Читает трейс и возвращает пары (ts, Update) в порядке получения"""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                records.append((record["ts"], Update.model_validate(record["update"])))
+    records.sort(key=lambda record: record[0])
+    return records